@@ -0,0 +1,202 @@
+from models import db, Program, Enrollment
+from cache import TTLCache
+from db_routing import RoutingSession
+from tenancy import current_facility_id
+from sqlalchemy import event, select, func, case, text, and_
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import accumulate, chain
+
+BUCKETS = ('day', 'week', 'month')
+
+# Cleared whenever enrollments or programs change; the TTL bounds how stale
+# other worker processes can be
+analytics_cache = TTLCache(ttl=300, max_entries=256)
+
+POSTGRES_SERIES_SQL = """
+WITH e AS (
+    SELECT enrollment.enrollment_date AS started,
+           enrollment.enrollment_date + program.duration * INTERVAL '1 day' AS ends,
+           enrollment.status
+    FROM enrollment
+    JOIN program ON program.id = enrollment.program_id
+    WHERE enrollment.deleted_at IS NULL
+      AND program.deleted_at IS NULL
+      AND enrollment.enrollment_date IS NOT NULL
+      {program_filter}
+      {facility_filter}
+),
+events AS (
+    SELECT date_trunc(:bucket, started) AS bucket, 1 AS enrolled,
+           CASE WHEN status = 'Completed' THEN 1 ELSE 0 END AS completed, 0 AS ended
+    FROM e
+    UNION ALL
+    SELECT date_trunc(:bucket, ends), 0, 0, 1 FROM e WHERE ends <= :now
+)
+SELECT bucket,
+       SUM(enrolled) AS enrolled,
+       SUM(completed) AS completed,
+       SUM(SUM(enrolled)) OVER (ORDER BY bucket) AS cumulative,
+       SUM(SUM(enrolled) - SUM(ended)) OVER (ORDER BY bucket) AS active
+FROM events
+GROUP BY bucket
+ORDER BY bucket
+"""
+
+
+def bucket_start(value, bucket):
+    """Start of the day, week (Monday) or month containing value, like date_trunc"""
+    day = datetime(value.year, value.month, value.day)
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _series_postgres(program_id, bucket, now):
+    # Plain SQL isn't limited to the user's facility automatically
+    facility_id = current_facility_id()
+    program_filter = 'AND enrollment.program_id = :program_id' if program_id is not None else ''
+    facility_filter = 'AND enrollment.facility_id = :facility_id' if facility_id is not None else ''
+    rows = db.session.execute(
+        text(POSTGRES_SERIES_SQL.format(program_filter=program_filter, facility_filter=facility_filter)),
+        {'bucket': bucket, 'now': now, 'program_id': program_id, 'facility_id': facility_id}
+    ).all()
+    return [
+        (row.bucket, int(row.enrolled), int(row.completed), int(row.cumulative), int(row.active))
+        for row in rows
+    ]
+
+
+def _series_python(program_id, bucket, now):
+    """Same series as the Postgres query, bucketed in Python from three narrow columns"""
+    query = select(Enrollment.enrollment_date, Enrollment.status, Program.duration).join(
+        Program, Enrollment.program_id == Program.id
+    ).where(
+        Enrollment.deleted_at.is_(None),
+        Program.deleted_at.is_(None),
+        Enrollment.enrollment_date.isnot(None)
+    )
+    if program_id is not None:
+        query = query.where(Enrollment.program_id == program_id)
+
+    enrolled, completed, ended = Counter(), Counter(), Counter()
+    for started, status, duration in db.session.execute(query):
+        start_bucket = bucket_start(started, bucket)
+        enrolled[start_bucket] += 1
+        if status == 'Completed':
+            completed[start_bucket] += 1
+        ends = started + timedelta(days=duration)
+        if ends <= now:
+            ended[bucket_start(ends, bucket)] += 1
+
+    buckets = sorted(set(enrolled) | set(ended))
+    cumulative = accumulate(enrolled[b] for b in buckets)
+    active = accumulate(enrolled[b] - ended[b] for b in buckets)
+    return [
+        (b, enrolled[b], completed[b], total, in_progress)
+        for b, total, in_progress in zip(buckets, cumulative, active)
+    ]
+
+
+def enrollment_series(program_id, bucket, start=None, end=None):
+    """
+    Time-bucketed enrollment series. For each bucket:
+    - enrolled: new enrollments
+    - completed: how many of those enrollments are now Completed
+    - cumulative: enrollments up to the end of the bucket
+    - active: enrollments whose program period had not ended by the bucket
+    """
+    now = datetime.utcnow()
+    if db.engine.dialect.name == 'postgresql':
+        rows = _series_postgres(program_id, bucket, now)
+    else:
+        rows = _series_python(program_id, bucket, now)
+
+    return [{
+        'bucket': b.strftime('%d/%m/%Y'),
+        'enrolled': enrolled,
+        'completed': completed,
+        'completion_rate': round(completed / enrolled, 4) if enrolled else None,
+        'cumulative': cumulative,
+        'active': active
+    } for b, enrolled, completed, cumulative, active in rows
+        if (start is None or b >= start) and (end is None or b <= end)]
+
+
+def program_summaries(program_id=None):
+    """Enrollment counts by status and completion rate per program, in one grouped query"""
+    query = select(
+        Program.id,
+        Program.name,
+        func.count(Enrollment.id).label('total'),
+        func.sum(case((Enrollment.status == 'Active', 1), else_=0)).label('active'),
+        func.sum(case((Enrollment.status == 'Completed', 1), else_=0)).label('completed'),
+        func.sum(case((Enrollment.status == 'Suspended', 1), else_=0)).label('suspended')
+    ).select_from(Program).outerjoin(
+        Enrollment, and_(Enrollment.program_id == Program.id, Enrollment.deleted_at.is_(None))
+    ).where(Program.deleted_at.is_(None)).group_by(Program.id, Program.name).order_by(Program.id)
+    if program_id is not None:
+        query = query.where(Program.id == program_id)
+
+    return [{
+        'program_id': row.id,
+        'name': row.name,
+        'total': row.total,
+        'active': int(row.active or 0),
+        'completed': int(row.completed or 0),
+        'suspended': int(row.suspended or 0),
+        'completion_rate': round(int(row.completed or 0) / row.total, 4) if row.total else None
+    } for row in db.session.execute(query)]
+
+
+def program_analytics(program_id, bucket='week', start=None, end=None):
+    key = ('program', current_facility_id(), program_id, bucket, start, end)
+    result = analytics_cache.get(key)
+    if result is None:
+        summaries = program_summaries(program_id)
+        result = {
+            'program_id': program_id,
+            'bucket': bucket,
+            'summary': summaries[0] if summaries else None,
+            'series': enrollment_series(program_id, bucket, start, end)
+        }
+        analytics_cache.set(key, result)
+    return result
+
+
+def overall_analytics(bucket='week', start=None, end=None):
+    key = ('all', current_facility_id(), None, bucket, start, end)
+    result = analytics_cache.get(key)
+    if result is None:
+        result = {
+            'bucket': bucket,
+            'programs': program_summaries(),
+            'series': enrollment_series(None, bucket, start, end)
+        }
+        analytics_cache.set(key, result)
+    return result
+
+
+def _touches_analytics(mapper):
+    return mapper is not None and mapper.class_ in (Enrollment, Program)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_stale_on_flush(session, flush_context):
+    if any(isinstance(obj, (Enrollment, Program)) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info['analytics_stale'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_stale_on_bulk_write(orm_execute_state):
+    if (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete) \
+            and _touches_analytics(orm_execute_state.bind_mapper):
+        orm_execute_state.session.info['analytics_stale'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('analytics_stale', False):
+        analytics_cache.clear()
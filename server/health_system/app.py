@@ -1,12 +1,23 @@
 from flask import Flask
 from flask_cors import CORS
-from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from models import db
-from routes.program_routes import init_program_routes
-from routes.client_routes import init_client_routes
-from routes.enrollment_routes import init_enrollment_routes
-from routes.system_user_routes import init_system_user_routes
+from db_routing import replica_router
+from sqlite_tuning import init_sqlite
+from rate_limit import rate_limiter
+from audit import audit_log
+from user_activity import user_activity
+from user_tokens import init_token_checks
+from routes import init_routes
+from archiver import init_archiver
+from jobs import init_jobs
+from facilities import init_facilities
+from snapshot import init_snapshot
+from outbox import init_outbox
+from program_catalog import init_program_catalog
+from idempotency import init_idempotency
+from sqlalchemy import inspect
+import click
 import os
 from datetime import timedelta
 from dotenv import load_dotenv
@@ -14,50 +25,124 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app) #Enable CORS for all routes
 
-#Configure the database
-# app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///health_system.db'
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URI')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_SECRET_KEY'] = os.getenv("JWT_SECRET_KEY")
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)  # Token expiration time
-app.config['JWT_TOKEN_LOCATION'] = ['headers']  # Look for tokens in headers
-app.config['JWT_HEADER_NAME'] = 'Authorization'  # Header name
-app.config['JWT_HEADER_TYPE'] = 'Bearer'  # Header type
+def configure(app):
+    #Configure the database
+    # app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///health_system.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URI')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['JWT_SECRET_KEY'] = os.getenv("JWT_SECRET_KEY")
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)  # Token expiration time
+    app.config['JWT_TOKEN_LOCATION'] = ['headers']  # Look for tokens in headers
+    app.config['JWT_HEADER_NAME'] = 'Authorization'  # Header name
+    app.config['JWT_HEADER_TYPE'] = 'Bearer'  # Header type
+    # Let token errors reach the JWT error handlers instead of flask-restful turning them into 500s
+    app.config['PROPAGATE_EXCEPTIONS'] = True
 
-db.init_app(app)
-jwt = JWTManager(app)
+    # Optional read replicas, comma separated (e.g. sqlite:///replica.db,postgresql://...)
+    app.config['SQLALCHEMY_REPLICA_URIS'] = [
+        uri.strip() for uri in os.environ.get('DATABASE_REPLICA_URIS', '').split(',') if uri.strip()
+    ]
+    app.config['REPLICA_HEALTH_CHECK_INTERVAL'] = int(os.environ.get('DATABASE_REPLICA_HEALTH_CHECK_INTERVAL', 5))
+    app.config['READ_YOUR_WRITES_SECONDS'] = int(os.environ.get('DATABASE_READ_YOUR_WRITES_SECONDS', 5))
 
-# JWT error handlers
-@jwt.invalid_token_loader
-def invalid_token_callback(error):
-    return {'error': 'Invalid token'}, 401
+    # Tuned SQLite connections (WAL, relaxed fsync, bigger cache) for single-node deployments
+    app.config['SQLITE_PERFORMANCE_MODE'] = os.environ.get('SQLITE_PERFORMANCE_MODE', 'false').lower() == 'true'
 
-@jwt.expired_token_loader
-def expired_token_callback(jwt_header, jwt_data):
-    return {'error': 'Token has expired'}, 401
+    # Largest number of clients the external batch endpoint returns at once
+    app.config['CLIENT_BATCH_MAX'] = int(os.environ.get('CLIENT_BATCH_MAX', 500))
 
-@jwt.unauthorized_loader
-def missing_token_callback(error):
-    return {'error': 'Authorization token is missing'}, 401
+    # Per-user, per-route request quotas by role (shared between workers when a Redis URL is set)
+    app.config['RATE_LIMIT_STORAGE_URL'] = os.environ.get('RATE_LIMIT_STORAGE_URL')
+    app.config['RATE_LIMITS'] = {
+        'admin': os.environ.get('RATE_LIMIT_ADMIN', '600/minute'),
+        'doctor': os.environ.get('RATE_LIMIT_DOCTOR', '120/minute'),
+        'nurse': os.environ.get('RATE_LIMIT_NURSE', '120/minute')
+    }
 
-# Initialize Flask-Migrate
-migrate = Migrate(app, db)
+    # Background jobs use the database as their queue unless a Redis broker is configured
+    app.config['JOB_BROKER_URL'] = os.environ.get('JOB_BROKER_URL')
+    app.config['JOB_TYPE_CONCURRENCY'] = {'client_import': 2, 'client_export': 1, 'enrollment_completion': 1, 'client_dedup_scan': 1, 'bulk_export': 2, 'idempotency_key_purge': 1}
+    # Periodic jobs queued by the worker, in seconds between runs
+    app.config['JOB_SCHEDULE'] = {'enrollment_completion': 3600, 'idempotency_key_purge': 3600}
 
-# Initialize routes
-init_system_user_routes(app)
-init_program_routes(app)
-init_client_routes(app)
-init_enrollment_routes(app)
 
-with app.app_context():
-    db.create_all()
+def init_jwt(app):
+    jwt = JWTManager(app)
+    init_token_checks(jwt)
+
+    # JWT error handlers
+    @jwt.invalid_token_loader
+    def invalid_token_callback(error):
+        return {'error': 'Invalid token'}, 401
+
+    @jwt.expired_token_loader
+    def expired_token_callback(jwt_header, jwt_data):
+        return {'error': 'Token has expired'}, 401
+
+    @jwt.unauthorized_loader
+    def missing_token_callback(error):
+        return {'error': 'Authorization token is missing'}, 401
+
+
+def init_commands(app, with_migrations):
+    if with_migrations:
+        # Alembic is slow to import and only needed by `flask db`
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create the tables of a new, empty database (existing ones are upgraded with `flask db upgrade`)"""
+        if set(inspect(db.engine).get_table_names()) & set(db.metadata.tables):
+            raise click.ClickException("The database already has tables, upgrade it with `flask db upgrade`")
+        db.create_all()
+        if with_migrations:
+            # The tables match the latest revision, so later upgrades start from there
+            from flask_migrate import stamp
+            stamp()
+        click.echo("Database tables created")
+
+    init_archiver(app)
+    init_jobs(app)
+    init_facilities(app)
+    init_snapshot(app)
+    init_outbox(app)
+
+
+def create_app(with_migrations=True):
+    """
+    Build the application. Nothing here connects to the database, so a
+    gunicorn master can build it once and fork workers from it.
+    Web servers pass with_migrations=False to skip loading Alembic.
+    """
+    app = Flask(__name__)
+    CORS(app) #Enable CORS for all routes
+
+    configure(app)
+
+    db.init_app(app)
+    replica_router.init_app(app)
+    init_sqlite(app)
+    rate_limiter.init_app(app)
+    audit_log.init_app(app)
+    user_activity.init_app(app)
+    init_program_catalog(app)
+    init_idempotency(app)
+    init_jwt(app)
+
+    # Initialize routes
+    init_routes(app)
+
+    # Register CLI commands
+    init_commands(app, with_migrations)
+
+    @app.route('/')
+    def hello():
+        return f'Hello there!'
+
+    return app
 
-@app.route('/')
-def hello():
-    return f'Hello there!'
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
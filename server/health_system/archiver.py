@@ -0,0 +1,91 @@
+from models import db, Client, Program, Enrollment, ClientArchive, EnrollmentArchive
+from sqlalchemy import select, insert, delete, literal, or_, and_
+from datetime import datetime, timedelta
+import click
+import time
+
+CLIENT_COLUMNS = [
+    'id', 'first_name', 'last_name', 'date_of_birth', 'gender', 'contact_number',
+    'email', 'address', 'facility_id', 'created_at', 'created_by', 'deleted_at'
+]
+ENROLLMENT_COLUMNS = [
+    'id', 'client_id', 'program_id', 'enrollment_date', 'status', 'facility_id', 'created_by', 'deleted_at'
+]
+
+
+def _move(model, archive_model, columns, condition):
+    """Copy the rows matching condition into the archive table, then delete them"""
+    now = datetime.utcnow()
+    source = select(*[getattr(model, c) for c in columns], literal(now)).where(condition)
+    db.session.execute(insert(archive_model).from_select(columns + ['archived_at'], source))
+    db.session.execute(delete(model).where(condition))
+
+
+def archive_enrollments(cutoff, batch_size=500):
+    """
+    Archive enrollments that were completed, unenrolled or belong to a
+    deleted program before the cutoff date.
+    Each batch is committed separately so locks are only held briefly.
+    """
+    deleted_programs = select(Program.id).where(Program.deleted_at < cutoff)
+    condition = or_(
+        and_(Enrollment.status == 'Completed', Enrollment.enrollment_date < cutoff),
+        Enrollment.deleted_at < cutoff,
+        Enrollment.program_id.in_(deleted_programs)
+    )
+
+    archived = 0
+    while True:
+        ids = db.session.scalars(
+            select(Enrollment.id).where(condition).order_by(Enrollment.id).limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        _move(Enrollment, EnrollmentArchive, ENROLLMENT_COLUMNS, Enrollment.id.in_(ids))
+        db.session.commit()
+        archived += len(ids)
+    return archived
+
+
+def archive_clients(cutoff, batch_size=500):
+    """Archive clients deleted before the cutoff date together with all their enrollments"""
+    archived = 0
+    while True:
+        ids = db.session.scalars(
+            select(Client.id).where(Client.deleted_at < cutoff).order_by(Client.id).limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        _move(Enrollment, EnrollmentArchive, ENROLLMENT_COLUMNS, Enrollment.client_id.in_(ids))
+        _move(Client, ClientArchive, CLIENT_COLUMNS, Client.id.in_(ids))
+        db.session.commit()
+        archived += len(ids)
+    return archived
+
+
+def run_archiver(days, batch_size=500):
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    return {
+        'enrollments': archive_enrollments(cutoff, batch_size),
+        'clients': archive_clients(cutoff, batch_size)
+    }
+
+
+def init_archiver(app):
+    app.config.setdefault('ARCHIVE_AFTER_DAYS', 365)
+    app.config.setdefault('ARCHIVE_BATCH_SIZE', 500)
+
+    @app.cli.command('archive')
+    @click.option('--days', type=int, default=None, help='Archive rows completed or deleted more than this many days ago')
+    @click.option('--batch-size', type=int, default=None, help='Rows moved per transaction')
+    @click.option('--interval', type=int, default=0, help='Keep running, sleeping this many seconds between runs')
+    def archive_command(days, batch_size, interval):
+        """Move old completed enrollments and deleted clients to the archive tables"""
+        days = days if days is not None else app.config['ARCHIVE_AFTER_DAYS']
+        batch_size = batch_size or app.config['ARCHIVE_BATCH_SIZE']
+        while True:
+            result = run_archiver(days, batch_size)
+            click.echo(f"Archived {result['enrollments']} enrollments and {result['clients']} clients")
+            if not interval:
+                break
+            time.sleep(interval)
@@ -0,0 +1,194 @@
+from flask import request, Response, has_request_context
+from flask_jwt_extended import get_jwt_identity
+from models import db, AuditLog
+from datetime import datetime
+from functools import wraps
+import atexit
+import os
+import queue
+import threading
+import time
+
+
+class AuditLogger:
+    """
+    Records who read which client or program without an INSERT per request.
+    Records are buffered in memory and written in batches by a background
+    thread. The buffer is bounded: when it is full a request waits up to
+    AUDIT_BLOCK_TIMEOUT seconds for room and then writes its own record,
+    so records are never dropped.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AUDIT_ENABLED', True)
+        app.config.setdefault('AUDIT_BUFFER_SIZE', 10000)
+        app.config.setdefault('AUDIT_BATCH_SIZE', 500)
+        app.config.setdefault('AUDIT_FLUSH_INTERVAL', 1.0)
+        app.config.setdefault('AUDIT_BLOCK_TIMEOUT', 0.5)
+
+        self.app = app
+        self._queue = queue.Queue(maxsize=app.config['AUDIT_BUFFER_SIZE'])
+        self._thread = None
+        app.extensions['audit_log'] = self
+        atexit.register(self.flush)
+
+    def _ensure_writer(self):
+        # Threads don't survive a fork, so each worker process starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                if self._pid is not None:
+                    self._queue = queue.Queue(maxsize=self.app.config['AUDIT_BUFFER_SIZE'])
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, args=(self._queue,), name='audit-writer', daemon=True)
+                self._thread.start()
+
+    def record(self, resource_type, resource_ids, action='read', user_id=None, endpoint=None):
+        """
+        Queue one audit row per resource id for the current user and request.
+        Background jobs pass the user who queued them and the job type instead.
+        """
+        if not self.app.config['AUDIT_ENABLED']:
+            return
+        self._ensure_writer()
+
+        in_request = has_request_context()
+        if user_id is None:
+            user_id = int(get_jwt_identity())
+        endpoint = endpoint or (request.endpoint if in_request else None)
+        ip_address = request.remote_addr if in_request else None
+        accessed_at = datetime.utcnow()
+        for resource_id in resource_ids:
+            row = {
+                'user_id': user_id,
+                'action': action,
+                'resource_type': resource_type,
+                'resource_id': resource_id,
+                'endpoint': endpoint,
+                'ip_address': ip_address,
+                'accessed_at': accessed_at
+            }
+            try:
+                self._queue.put(row, timeout=self.app.config['AUDIT_BLOCK_TIMEOUT'])
+            except queue.Full:
+                # The writer can't keep up; slow this request down instead of losing the record
+                self._write([row])
+
+    def _next_batch(self, rows):
+        """Wait for a row, then collect more for up to AUDIT_FLUSH_INTERVAL seconds"""
+        batch = [rows.get()]
+        deadline = time.monotonic() + self.app.config['AUDIT_FLUSH_INTERVAL']
+        while len(batch) < self.app.config['AUDIT_BATCH_SIZE']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(rows.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, rows):
+        # Keeps to the queue it was started with; init_app or a fork may replace self._queue
+        while True:
+            batch = self._next_batch(rows)
+            while True:
+                try:
+                    self._write(batch)
+                    break
+                except Exception:
+                    # Keep the batch and retry; the bounded buffer pushes back on requests meanwhile
+                    self.app.logger.exception('Could not write %d audit records', len(batch))
+                    time.sleep(self.app.config['AUDIT_FLUSH_INTERVAL'])
+            for _ in batch:
+                rows.task_done()
+
+    def _write(self, rows):
+        with self.app.app_context():
+            # A connection of its own, outside any request's session and transaction
+            with db.engine.begin() as connection:
+                connection.execute(AuditLog.__table__.insert(), rows)
+
+    def flush(self, timeout=5):
+        """Write everything buffered so far, e.g. at shutdown"""
+        if self._queue is None:
+            return
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if rows:
+            self._write(rows)
+            for _ in rows:
+                self._queue.task_done()
+
+        # Wait for the batch the writer thread may still be collecting or writing
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._queue.all_tasks_done.wait(remaining)
+
+
+audit_log = AuditLogger()
+
+
+def _status_code(result):
+    if isinstance(result, Response):
+        return result.status_code
+    if isinstance(result, tuple) and len(result) > 1:
+        return result[1]
+    return 200
+
+
+def _returned_ids(result):
+    """IDs of the records in a list response: {"data": [...]} or a page, {"data": {"items": [...]}}"""
+    if isinstance(result, Response):
+        body = result.get_json(silent=True)
+    else:
+        body = result[0] if isinstance(result, tuple) else result
+    items = (body or {}).get('data')
+    if isinstance(items, dict):
+        items = items.get('items')
+    return [item['id'] for item in items or []]
+
+
+def audited(resource_type, id_arg=None, lists=False):
+    """
+    Record a read of the resource named by the id_arg view argument
+    (client_id for clients) once the request has succeeded. With lists=True
+    a read without an id, i.e. of a list or search, records every record
+    the response returned.
+    Must be applied inside @jwt_required() and outside @single_flight so
+    coalesced requests are each recorded.
+    """
+    id_arg = id_arg or f'{resource_type}_id'
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            result = f(*args, **kwargs)
+            if _status_code(result) >= 400:
+                return result
+            resource_id = kwargs.get(id_arg)
+            if resource_id is not None:
+                audit_log.record(resource_type, [resource_id])
+            elif lists:
+                audit_log.record(resource_type, _returned_ids(result))
+            return result
+        return decorated
+    return decorator
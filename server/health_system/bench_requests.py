@@ -0,0 +1,66 @@
+"""
+Measure per-request latency of the hot POST endpoints against a throwaway
+SQLite database, using Flask's test client so only the application's own
+overhead (routing, JWT, validation, ORM) is timed.
+
+    python bench_requests.py --requests 500
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+
+def timed(client, method, url, requests, body, headers=None):
+    samples = []
+    for i in range(requests):
+        payload = body(i)
+        start = time.perf_counter()
+        response = client.open(url, method=method, json=payload, headers=headers)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code < 500, response.get_json()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ['DATABASE_URI'] = f'sqlite:///{directory}/bench.db'
+    os.environ.setdefault('JWT_SECRET_KEY', 'bench-secret-key-with-enough-length')
+
+    from app import create_app
+    from models import db
+
+    app = create_app(with_migrations=False)
+    app.config['RATE_LIMIT_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+
+    client = app.test_client()
+    client.post('/api/doctors', json={'username': 'bench', 'password': 'bench-password', 'email': 'bench@example.com'})
+    token = client.post('/api/doctors/login', json={'username': 'bench', 'password': 'bench-password'}).get_json()['data']['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    program_id = client.post('/api/programs', json={'name': 'Bench'}, headers=headers).get_json()['data']['id']
+
+    cases = [
+        ('POST /api/clients', 'POST', '/api/clients', lambda i: {
+            'first_name': f'First{i}', 'last_name': f'Last{i}', 'date_of_birth': '01/01/1990',
+            'gender': 'Female', 'contact_number': f'07{i:08d}'
+        }),
+        ('POST /api/clients (invalid)', 'POST', '/api/clients', lambda i: {'first_name': 'First'}),
+        ('POST /api/programs', 'POST', '/api/programs', lambda i: {'name': f'Program {i}', 'duration': 30}),
+        ('POST /api/enrollments', 'POST', '/api/enrollments', lambda i: {'client_id': i + 1, 'program_ids': [program_id]}),
+        ('PUT /api/enrollments/status', 'PUT', '/api/enrollments/status', lambda i: {'enrollment_ids': [i + 1], 'status': 'Suspended'}),
+    ]
+    for label, method, url, body in cases:
+        samples = timed(client, method, url, args.requests, body, headers)
+        print(f'{label:<30} median {statistics.median(samples) * 1000:6.2f} ms  '
+              f'p95 {statistics.quantiles(samples, n=20)[-1] * 1000:6.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
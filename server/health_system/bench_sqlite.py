@@ -0,0 +1,115 @@
+"""
+Compare SQLite with and without SQLITE_PERFORMANCE_MODE under concurrent
+load: reader processes fetch clients while writer processes register
+clients and enroll them, all against one database file.
+
+    python bench_sqlite.py --readers 4 --writers 2 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+SEED_CLIENTS = 500
+
+
+def setup(directory):
+    """Create the database, a user and a program; returns the auth headers"""
+    from app import create_app
+    from models import db
+
+    app = create_app(with_migrations=False)
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    client.post('/api/doctors', json={'username': 'bench', 'password': 'bench-password', 'email': 'bench@example.com'})
+    token = client.post('/api/doctors/login', json={'username': 'bench', 'password': 'bench-password'}).get_json()['data']['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    client.post('/api/programs', json={'name': 'Bench', 'duration': 30}, headers=headers)
+    for i in range(SEED_CLIENTS):
+        client.post('/api/clients', json={
+            'first_name': f'Seed{i}', 'last_name': 'Client', 'date_of_birth': '01/01/1990', 'gender': 'Female'
+        }, headers=headers)
+    with app.app_context():
+        db.engine.dispose()
+    return headers
+
+
+def worker(role, headers, seconds, results):
+    from app import create_app
+
+    app = create_app(with_migrations=False)
+    app.config['RATE_LIMIT_ENABLED'] = False
+    client = app.test_client()
+    random.seed(os.getpid())
+
+    latencies, errors = [], 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        if role == 'reader':
+            responses = [client.get(f'/api/clients/{random.randint(1, SEED_CLIENTS)}', headers=headers)]
+        else:
+            response = client.post('/api/clients', json={
+                'first_name': f'Bench{random.random()}', 'last_name': 'Client',
+                'date_of_birth': '01/01/1990', 'gender': 'Male'
+            }, headers=headers)
+            responses = [response]
+            if response.status_code == 201:
+                responses.append(client.post('/api/enrollments', json={
+                    'client_id': response.get_json()['data']['id'], 'program_ids': [1]
+                }, headers=headers))
+        latencies.append(time.perf_counter() - start)
+        errors += sum(r.status_code >= 500 for r in responses)
+    results.put((role, latencies, errors))
+
+
+def run(performance_mode, args):
+    directory = tempfile.mkdtemp()
+    os.environ['DATABASE_URI'] = f'sqlite:///{directory}/bench.db'
+    os.environ['SQLITE_PERFORMANCE_MODE'] = 'true' if performance_mode else 'false'
+    headers = setup(directory)
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(role, headers, args.seconds, results))
+        for role in ['reader'] * args.readers + ['writer'] * args.writers
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    label = 'performance mode' if performance_mode else 'default'
+    for role in ('reader', 'writer'):
+        latencies = [l for r, ls, _ in collected if r == role for l in ls]
+        errors = sum(e for r, _, e in collected if r == role)
+        if not latencies:
+            continue
+        latencies.sort()
+        print(
+            f"{label:>16} {role}s: {len(latencies) / args.seconds:8.1f} ops/s  "
+            f"median {statistics.median(latencies) * 1000:7.2f} ms  "
+            f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.2f} ms  errors {errors}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    os.environ.setdefault('JWT_SECRET_KEY', 'bench-secret-key-with-enough-length')
+    for performance_mode in (False, True):
+        run(performance_mode, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Measure how long a fresh process takes to import the app, build it and
+serve its first request. Each run starts a new interpreter so nothing is
+cached between runs.
+
+    python bench_startup.py --runs 5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import json
+
+SCRIPT = """
+import json, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app(with_migrations={with_migrations})
+created = time.perf_counter()
+app.test_client().get('/')
+served = time.perf_counter()
+print(json.dumps({{
+    'import': imported - start,
+    'create_app': created - imported,
+    'first_request': served - created,
+    'total': served - start
+}}))
+"""
+
+
+def run(with_migrations):
+    output = subprocess.run(
+        [sys.executable, '-c', SCRIPT.format(with_migrations=with_migrations)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    for label, with_migrations in (('web (wsgi)', False), ('cli (with migrations)', True)):
+        runs = [run(with_migrations) for _ in range(args.runs)]
+        print(f'{label}:')
+        for phase in ('import', 'create_app', 'first_request', 'total'):
+            print(f'  {phase:<14} {statistics.median(r[phase] for r in runs) * 1000:7.1f} ms (median)')
+
+
+if __name__ == '__main__':
+    main()
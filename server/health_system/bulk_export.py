@@ -0,0 +1,141 @@
+from flask import current_app
+from models import Client, Program, Enrollment
+from audit import audit_log
+from sqlalchemy.orm import contains_eager
+from datetime import datetime, timezone
+import gzip
+import json
+import os
+
+BATCH_SIZE = 1000
+EPISODE_STATUSES = {'Active': 'active', 'Completed': 'finished', 'Suspended': 'onhold'}
+# FHIR AdministrativeGender codes for the genders clients are registered with
+PATIENT_GENDERS = {'male': 'male', 'm': 'male', 'female': 'female', 'f': 'female', 'other': 'other', 'unknown': 'unknown'}
+
+
+def parse_since(value):
+    """
+    Parse an ISO 8601 _since into naive UTC like the updated_at columns
+    Raises ValueError if it isn't a date and time
+    """
+    since = datetime.fromisoformat(value)
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+
+def patient_gender(gender):
+    """FHIR gender code; any other recorded gender is 'other'"""
+    gender = (gender or '').strip().lower()
+    if not gender:
+        return 'unknown'
+    return PATIENT_GENDERS.get(gender, 'other')
+
+
+def client_to_patient(client):
+    """FHIR-style Patient resource for a client"""
+    telecom = []
+    if client.contact_number:
+        telecom.append({'system': 'phone', 'value': client.contact_number})
+    if client.email:
+        telecom.append({'system': 'email', 'value': client.email})
+
+    return {
+        'resourceType': 'Patient',
+        'id': str(client.id),
+        'meta': {'lastUpdated': client.updated_at.isoformat() if client.updated_at else None},
+        'name': [{'family': client.last_name, 'given': [client.first_name]}],
+        'gender': patient_gender(client.gender),
+        'birthDate': client.date_of_birth.isoformat(),
+        'telecom': telecom,
+        'address': [{'text': client.address}] if client.address else []
+    }
+
+
+def enrollment_to_episode(enrollment):
+    """FHIR-style EpisodeOfCare resource for an enrollment"""
+    return {
+        'resourceType': 'EpisodeOfCare',
+        'id': str(enrollment.id),
+        'meta': {'lastUpdated': enrollment.updated_at.isoformat() if enrollment.updated_at else None},
+        'status': EPISODE_STATUSES.get(enrollment.status, 'active'),
+        'type': [{'text': enrollment.program.name}],
+        'patient': {'reference': f'Patient/{enrollment.client_id}'},
+        'period': {'start': enrollment.enrollment_date.isoformat() if enrollment.enrollment_date else None}
+    }
+
+
+def _patients(since):
+    query = Client.live()
+    if since is not None:
+        query = query.filter(Client.updated_at >= since)
+    return query, Client.id, client_to_patient, lambda client: client.id
+
+
+def _episodes(since):
+    query = Enrollment.live().join(Program, Enrollment.program_id == Program.id).join(
+        Client, Enrollment.client_id == Client.id
+    ).filter(
+        Program.deleted_at.is_(None),
+        Client.deleted_at.is_(None)
+    ).options(contains_eager(Enrollment.program))
+    if since is not None:
+        query = query.filter(Enrollment.updated_at >= since)
+    return query, Enrollment.id, enrollment_to_episode, lambda enrollment: enrollment.client_id
+
+
+RESOURCE_TYPES = {
+    'Patient': _patients,
+    'EpisodeOfCare': _episodes,
+}
+
+
+def export_dir(job_id):
+    return os.path.join(current_app.config['EXPORT_DIR'], 'bulk', str(job_id))
+
+
+def write_bulk_export(job, types, since=None):
+    """
+    Write each resource type to gzip-compressed NDJSON files of at most
+    BULK_EXPORT_FILE_ROWS resources, reading the tables in id order one
+    batch at a time. The clients whose data is exported are audited for the
+    user who started the export. Returns the output list for the manifest.
+    """
+    directory = export_dir(job.job_id)
+    os.makedirs(directory, exist_ok=True)
+    rows_per_file = current_app.config['BULK_EXPORT_FILE_ROWS']
+    since = parse_since(since) if since else None
+
+    output = []
+    written = 0
+    for resource_type in types:
+        query, id_column, to_resource, client_id = RESOURCE_TYPES[resource_type](since)
+        last_id = 0
+        part = 0
+        f = None
+        count = 0
+        while True:
+            batch = query.filter(id_column > last_id).order_by(id_column).limit(BATCH_SIZE).all()
+            if not batch:
+                break
+            for item in batch:
+                if f is None or count == rows_per_file:
+                    if f is not None:
+                        f.close()
+                        output.append({'type': resource_type, 'file': filename, 'count': count})
+                    part += 1
+                    count = 0
+                    filename = f'{resource_type}.{part}.ndjson.gz'
+                    f = gzip.open(os.path.join(directory, filename), 'wt', encoding='utf-8')
+                f.write(json.dumps(to_resource(item), separators=(',', ':')) + '\n')
+                count += 1
+            client_ids = list(dict.fromkeys(client_id(item) for item in batch))
+            audit_log.record('client', client_ids, 'export', job.created_by, 'bulk_export')
+            written += len(batch)
+            last_id = batch[-1].id
+            job.update_progress(written)
+        if f is not None:
+            f.close()
+            output.append({'type': resource_type, 'file': filename, 'count': count})
+
+    return output
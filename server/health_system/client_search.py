@@ -0,0 +1,119 @@
+from models import db, Client, Enrollment
+from cache import TTLCache
+from tenancy import current_facility_id
+from sqlalchemy import select, exists, or_
+from datetime import date
+import json
+
+COUNT_MODES = ('estimate', 'exact')
+
+# Filters that don't change which clients match, only which page is returned
+PAGING_ARGS = ('page', 'per_page', 'after', 'count')
+
+# Exact counts reused as estimates; they are at most `ttl` seconds old
+search_count_cache = TTLCache(ttl=60, max_entries=1024)
+
+
+def years_before(day, years):
+    """The same calendar day `years` earlier; 29 February becomes the 28th"""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+def _enrolled(program_id=None, status=None):
+    """
+    Clients with a live enrollment, as a semi-join the database can drive
+    from ix_enrollment_live_program when a program is given
+    """
+    subquery = select(Enrollment.client_id).where(Enrollment.deleted_at.is_(None))
+    if program_id is not None:
+        subquery = subquery.where(Enrollment.program_id == program_id)
+    if status is not None:
+        subquery = subquery.where(Enrollment.status == status)
+    return Client.id.in_(subquery)
+
+
+def _not_enrolled(program_id):
+    """
+    Clients without a live enrollment in a program, as an anti-join checked
+    per client against uq_enrollment_live_client_program
+    """
+    return ~exists(select(Enrollment.id).where(
+        Enrollment.client_id == Client.id,
+        Enrollment.program_id == program_id,
+        Enrollment.deleted_at.is_(None)
+    ))
+
+
+def client_search_query(filters, today=None):
+    """
+    Live clients matching the search filters, as one query ordered by id.
+    Ages become a date_of_birth range and enrollment filters become IN and
+    NOT EXISTS subqueries, so everything is filtered in the database:
+    - query: part of the first or last name
+    - gender: exact gender
+    - min_age, max_age: age in whole years today, inclusive
+    - enrolled_in, not_enrolled_in: program ID
+    - status: enrollment status; of the enrolled_in program if given,
+      otherwise of any enrollment
+    - created_by: ID of the user who registered the client
+    - after: only clients with a higher ID (keyset pagination)
+    """
+    today = today or date.today()
+    query = Client.live()
+
+    if filters.get('query'):
+        pattern = f"%{filters['query']}%"
+        query = query.filter(or_(Client.first_name.ilike(pattern), Client.last_name.ilike(pattern)))
+    if filters.get('gender'):
+        query = query.filter(Client.gender == filters['gender'])
+    if filters.get('min_age') is not None:
+        query = query.filter(Client.date_of_birth <= years_before(today, filters['min_age']))
+    if filters.get('max_age') is not None:
+        # Anyone born on or before this day has had their (max_age + 1)th birthday
+        query = query.filter(Client.date_of_birth > years_before(today, filters['max_age'] + 1))
+    if filters.get('created_by') is not None:
+        query = query.filter(Client.created_by == filters['created_by'])
+
+    if filters.get('enrolled_in') is not None or filters.get('status'):
+        query = query.filter(_enrolled(filters.get('enrolled_in'), filters.get('status')))
+    if filters.get('not_enrolled_in') is not None:
+        query = query.filter(_not_enrolled(filters['not_enrolled_in']))
+
+    if filters.get('after') is not None:
+        query = query.filter(Client.id > filters['after'])
+    return query.order_by(Client.id)
+
+
+def _planner_estimate(query):
+    """Postgres planner's row estimate for a query, without running it"""
+    # Plain SQL isn't limited to the user's facility automatically
+    facility_id = current_facility_id()
+    if facility_id is not None:
+        query = query.filter(Client.facility_id == facility_id)
+    compiled = query.order_by(None).statement.compile(dialect=db.engine.dialect)
+    plan = db.session.connection().exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compiled}', compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_clients(query, filters, mode='estimate'):
+    """
+    (total, exact) for a search. Exact counts run COUNT(*). Estimates come
+    from the query planner on Postgres; elsewhere an exact count is cached
+    per filter set for a minute and reused.
+    """
+    if mode == 'estimate' and db.engine.dialect.name == 'postgresql':
+        return _planner_estimate(query), False
+
+    key = (current_facility_id(), tuple(sorted((k, v) for k, v in filters.items() if k not in PAGING_ARGS)))
+    if mode == 'estimate':
+        total = search_count_cache.get(key)
+        if total is not None:
+            return total, False
+    total = query.order_by(None).count()
+    search_count_cache.set(key, total)
+    return total, True
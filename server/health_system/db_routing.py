@@ -0,0 +1,166 @@
+from flask import g, has_request_context, current_app
+from flask_sqlalchemy.session import Session
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import create_engine, text, event
+from sqlalchemy.sql.dml import UpdateBase
+from functools import wraps
+import itertools
+import threading
+import time
+
+
+class ReplicaRouter:
+    """
+    Routes read-only queries to one or more read replicas.
+
+    Replicas are configured with SQLALCHEMY_REPLICA_URIS (a list of database
+    URIs). Reads are spread round-robin over replicas that passed their last
+    health check; if none is healthy, the primary is used. A user who has
+    written recently keeps reading from the primary for
+    READ_YOUR_WRITES_SECONDS so they see their own changes.
+
+    Recent writes are remembered per process. With several gunicorn workers
+    a read that lands on a worker other than the one that handled the write
+    can still go to a replica, so read-your-writes only holds within one
+    worker; keep READ_YOUR_WRITES_SECONDS above the replicas' usual lag.
+    """
+
+    def __init__(self, app=None):
+        self.engines = []
+        self._health = {}
+        self._recent_writes = {}
+        self._pruned_at = 0.0
+        self._cycle = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+        app.config.setdefault('REPLICA_HEALTH_CHECK_INTERVAL', 5)
+        app.config.setdefault('READ_YOUR_WRITES_SECONDS', 5)
+
+        self.health_check_interval = app.config['REPLICA_HEALTH_CHECK_INTERVAL']
+        self.read_your_writes_seconds = app.config['READ_YOUR_WRITES_SECONDS']
+        self.engines = [
+            create_engine(uri, pool_pre_ping=True)
+            for uri in app.config['SQLALCHEMY_REPLICA_URIS']
+        ]
+        # Every replica starts healthy and is checked on first use
+        self._health = {engine: (True, 0.0) for engine in self.engines}
+        self._cycle = itertools.cycle(self.engines) if self.engines else None
+        app.extensions['replica_router'] = self
+
+    def _is_healthy(self, engine):
+        healthy, checked_at = self._health[engine]
+        now = time.monotonic()
+        if now - checked_at < self.health_check_interval:
+            return healthy
+
+        try:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            healthy = True
+        except Exception:
+            current_app.logger.warning('Read replica %s failed health check', engine.url)
+            healthy = False
+
+        self._health[engine] = (healthy, now)
+        return healthy
+
+    def pick(self):
+        """Return the next healthy replica engine, or None to use the primary"""
+        if self._cycle is None:
+            return None
+
+        for _ in range(len(self.engines)):
+            with self._lock:
+                engine = next(self._cycle)
+            if self._is_healthy(engine):
+                return engine
+        return None
+
+    def _current_identity(self):
+        try:
+            return get_jwt_identity()
+        except Exception:
+            return None
+
+    def mark_write(self):
+        """Remember that the current user has just written to the primary"""
+        if not has_request_context():
+            return
+        identity = self._current_identity()
+        if identity is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writes[identity] = now
+            # Forget users whose window has passed, so the dict only holds recent writers
+            if now - self._pruned_at > self.read_your_writes_seconds:
+                cutoff = now - self.read_your_writes_seconds
+                self._recent_writes = {i: t for i, t in self._recent_writes.items() if t >= cutoff}
+                self._pruned_at = now
+
+    def wrote_recently(self):
+        identity = self._current_identity()
+        if identity is None:
+            return False
+        last_write = self._recent_writes.get(identity)
+        if last_write is None:
+            return False
+        if time.monotonic() - last_write > self.read_your_writes_seconds:
+            self._recent_writes.pop(identity, None)
+            return False
+        return True
+
+    def should_use_replica(self):
+        return (
+            self._cycle is not None
+            and has_request_context()
+            and g.get('use_read_replica', False)
+            and not self.wrote_recently()
+        )
+
+
+replica_router = ReplicaRouter()
+
+
+class RoutingSession(Session):
+    """Session that sends reads made inside @read_replica handlers to a replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and not isinstance(clause, UpdateBase)
+            and replica_router.should_use_replica()
+        ):
+            engine = replica_router.pick()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _record_write(session, flush_context):
+    replica_router.mark_write()
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _record_bulk_write(orm_execute_state):
+    # UPDATE/DELETE statements run without a flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        replica_router.mark_write()
+
+
+def read_replica(f):
+    """Allow the queries made by a read-only handler to be served by a replica"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        g.use_read_replica = True
+        try:
+            return f(*args, **kwargs)
+        finally:
+            g.use_read_replica = False
+    return decorated
@@ -0,0 +1,218 @@
+from models import db, Client
+from sqlalchemy import event, select, update, bindparam, func, or_, and_
+from difflib import SequenceMatcher
+from itertools import combinations
+import unicodedata
+import re
+
+# Minimum score for two clients to be reported as likely duplicates
+DUPLICATE_THRESHOLD = 0.75
+
+# The three blocks a client can share with a duplicate; only clients in the
+# same block are ever compared, each block lookup is served by an index
+BLOCKS = (
+    ('last_name_key', 'birth_year'),
+    ('last_name_key', 'first_name_key'),
+    ('phone_suffix',),
+)
+
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6',
+}
+
+
+def normalize_name(name):
+    """Lowercase ASCII letters only, so accents, spaces and punctuation don't matter"""
+    name = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z]', '', name.lower())
+
+
+def soundex(name):
+    """American Soundex code of a name, e.g. Robert -> R163"""
+    name = normalize_name(name)
+    if not name:
+        return None
+
+    code = name[0].upper()
+    previous = SOUNDEX_CODES.get(name[0])
+    for letter in name[1:]:
+        digit = SOUNDEX_CODES.get(letter)
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # h and w don't separate letters with the same code, vowels do
+        if letter not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def phone_suffix(contact_number):
+    """Last seven digits, which stay the same with or without a country code"""
+    digits = re.sub(r'\D', '', contact_number or '')
+    return digits[-7:] if len(digits) >= 7 else None
+
+
+def blocking_keys(first_name, last_name, date_of_birth, contact_number):
+    return {
+        'first_name_key': soundex(first_name),
+        'last_name_key': soundex(last_name),
+        'birth_year': date_of_birth.year if date_of_birth else None,
+        'phone_suffix': phone_suffix(contact_number)
+    }
+
+
+def changed_blocking_keys(values):
+    """
+    Blocking keys affected by a partial update. Each key depends on a
+    single column, so only the keys of the columns in values are returned.
+    """
+    keys = {}
+    if 'first_name' in values:
+        keys['first_name_key'] = soundex(values['first_name'])
+    if 'last_name' in values:
+        keys['last_name_key'] = soundex(values['last_name'])
+    if 'date_of_birth' in values:
+        keys['birth_year'] = values['date_of_birth'].year if values['date_of_birth'] else None
+    if 'contact_number' in values:
+        keys['phone_suffix'] = phone_suffix(values['contact_number'])
+    return keys
+
+
+def match_score(a, b):
+    """
+    How likely two clients are the same person, from 0 to 1.
+    a and b are objects or rows with first_name, last_name, date_of_birth and contact_number.
+    """
+    name_a = normalize_name(a.first_name) + ' ' + normalize_name(a.last_name)
+    name_b = normalize_name(b.first_name) + ' ' + normalize_name(b.last_name)
+    swapped_b = normalize_name(b.last_name) + ' ' + normalize_name(b.first_name)
+    name_similarity = max(
+        SequenceMatcher(None, name_a, name_b).ratio(),
+        SequenceMatcher(None, name_a, swapped_b).ratio()
+    )
+
+    same_birth_date = a.date_of_birth == b.date_of_birth
+    suffix_a = phone_suffix(a.contact_number)
+    same_phone = suffix_a is not None and suffix_a == phone_suffix(b.contact_number)
+
+    return round(0.6 * name_similarity + 0.25 * same_birth_date + 0.15 * same_phone, 4)
+
+
+def _block_conditions(keys):
+    conditions = []
+    for columns in BLOCKS:
+        if all(keys[c] is not None for c in columns):
+            conditions.append(and_(*[getattr(Client, c) == keys[c] for c in columns]))
+    return conditions
+
+
+def find_duplicates(candidate, exclude_id=None, limit=10):
+    """
+    Live clients that are likely the same person as candidate, best match first.
+    Only clients sharing a blocking key with the candidate are loaded.
+    """
+    keys = blocking_keys(candidate.first_name, candidate.last_name, candidate.date_of_birth, candidate.contact_number)
+    conditions = _block_conditions(keys)
+    if not conditions:
+        return []
+
+    query = Client.live().filter(or_(*conditions))
+    if exclude_id is not None:
+        query = query.filter(Client.id != exclude_id)
+
+    matches = []
+    for client in query.all():
+        score = match_score(candidate, client)
+        if score >= DUPLICATE_THRESHOLD:
+            matches.append((score, client))
+    matches.sort(key=lambda match: match[0], reverse=True)
+    return matches[:limit]
+
+
+def scan_duplicates(on_block=None):
+    """
+    Find likely duplicate pairs across the whole registry.
+    Clients are only compared within blocks that share a key, so the work
+    grows with block sizes rather than with the square of the registry.
+    """
+    pairs = {}
+    columns = ('id', 'first_name', 'last_name', 'date_of_birth', 'contact_number')
+    for block in BLOCKS:
+        key_columns = [getattr(Client, c) for c in block]
+        shared_keys = db.session.execute(
+            select(*key_columns)
+            .where(Client.deleted_at.is_(None), *[c.isnot(None) for c in key_columns])
+            .group_by(*key_columns)
+            .having(func.count(Client.id) > 1)
+        ).all()
+
+        for key in shared_keys:
+            members = db.session.execute(
+                select(*[getattr(Client, c) for c in columns]).where(
+                    Client.deleted_at.is_(None),
+                    *[column == value for column, value in zip(key_columns, key)]
+                )
+            ).all()
+            for a, b in combinations(members, 2):
+                pair = (min(a.id, b.id), max(a.id, b.id))
+                if pair in pairs:
+                    continue
+                score = match_score(a, b)
+                if score >= DUPLICATE_THRESHOLD:
+                    pairs[pair] = score
+            if on_block:
+                on_block()
+
+    return sorted(
+        ({'client_ids': list(pair), 'score': score} for pair, score in pairs.items()),
+        key=lambda match: match['score'],
+        reverse=True
+    )
+
+
+def backfill_blocking_keys(batch_size=1000):
+    """
+    Compute blocking keys for clients registered before they existed
+    The keys are written with a plain table UPDATE, so the clients' version,
+    updated_at and change events are left alone; nothing about them changed.
+    """
+    table = Client.__table__
+    # Sets the columns named in each row's parameters; updated_at is set to
+    # itself, otherwise its onupdate default would still fire
+    set_keys = update(table).where(table.c.id == bindparam('client_id')).values(updated_at=table.c.updated_at)
+    updated = 0
+    last_id = 0
+    while True:
+        clients = db.session.execute(
+            select(Client.id, Client.first_name, Client.last_name, Client.date_of_birth, Client.contact_number)
+            .where(Client.birth_year.is_(None), Client.id > last_id)
+            .order_by(Client.id)
+            .limit(batch_size)
+        ).all()
+        if not clients:
+            break
+        db.session.execute(set_keys, [
+            {'client_id': client.id, **blocking_keys(*client[1:])} for client in clients
+        ])
+        db.session.commit()
+        updated += len(clients)
+        last_id = clients[-1].id
+    return updated
+
+
+def set_blocking_keys(client):
+    keys = blocking_keys(client.first_name, client.last_name, client.date_of_birth, client.contact_number)
+    for column, value in keys.items():
+        setattr(client, column, value)
+
+
+@event.listens_for(Client, 'before_insert')
+@event.listens_for(Client, 'before_update')
+def _keep_blocking_keys_current(mapper, connection, client):
+    set_blocking_keys(client)
@@ -0,0 +1,98 @@
+from models import db, Program, Enrollment
+from outbox import record_events
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.types import DateTime
+from datetime import datetime, timedelta
+
+ENROLLMENT_STATUSES = ('Active', 'Completed', 'Suspended')
+
+
+class add_days(FunctionElement):
+    """SQL expression for a datetime column plus an integer number of days"""
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(add_days)
+def _add_days_default(element, compiler, **kw):
+    timestamp, days = list(element.clauses)
+    return f"({compiler.process(timestamp, **kw)} + {compiler.process(days, **kw)} * INTERVAL '1 day')"
+
+
+@compiles(add_days, 'sqlite')
+def _add_days_sqlite(element, compiler, **kw):
+    timestamp, days = list(element.clauses)
+    return f"datetime({compiler.process(timestamp, **kw)}, '+' || {compiler.process(days, **kw)} || ' days')"
+
+
+def _record_status_changes(enrollment_ids, status):
+    """Add outbox events for the enrollments a bulk UPDATE just set to status"""
+    changed = db.session.execute(
+        select(Enrollment.id, Enrollment.client_id, Enrollment.program_id, Enrollment.status, Enrollment.facility_id)
+        .where(Enrollment.id.in_(enrollment_ids), Enrollment.status == status, Enrollment.deleted_at.is_(None))
+    ).all()
+    record_events(Enrollment, 'updated', changed)
+
+
+def complete_due_enrollments(batch_size=1000, now=None):
+    """
+    Mark active enrollments in live programs as Completed once
+    enrollment_date + program.duration has passed. Works in batches of UPDATE ... FROM program statements, each
+    committed on its own, and returns the number of enrollments completed.
+    """
+    now = now or datetime.utcnow()
+    shortest_duration = db.session.scalar(select(func.min(Program.duration)).where(Program.deleted_at.is_(None)))
+    if shortest_duration is None:
+        return 0
+
+    # Nothing enrolled after this date can be due yet; lets the
+    # (status, enrollment_date) index narrow the scan
+    latest_possible = now - timedelta(days=shortest_duration)
+    due = (
+        Enrollment.program_id == Program.id,
+        Program.deleted_at.is_(None),
+        Enrollment.status == 'Active',
+        Enrollment.deleted_at.is_(None),
+        Enrollment.enrollment_date <= latest_possible,
+        add_days(Enrollment.enrollment_date, Program.duration) <= now
+    )
+
+    completed = 0
+    while True:
+        ids = db.session.scalars(
+            select(Enrollment.id).where(*due).order_by(Enrollment.enrollment_date).limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        updated = db.session.execute(
+            update(Enrollment)
+            .where(Enrollment.id.in_(ids), *due)
+            .values(status='Completed', version=Enrollment.version + 1),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        if updated:
+            _record_status_changes(ids, 'Completed')
+        db.session.commit()
+        if not updated:
+            break
+        completed += updated
+    return completed
+
+
+def set_enrollment_status(enrollment_ids, status):
+    """Change the status of many enrollments with one UPDATE, returning how many changed"""
+    if status not in ENROLLMENT_STATUSES:
+        raise ValueError(f"Status must be one of: {', '.join(ENROLLMENT_STATUSES)}")
+
+    updated = db.session.execute(
+        update(Enrollment)
+        .where(Enrollment.id.in_(enrollment_ids), Enrollment.deleted_at.is_(None))
+        .values(status=status, version=Enrollment.version + 1),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if updated:
+        _record_status_changes(enrollment_ids, status)
+    db.session.commit()
+    return updated
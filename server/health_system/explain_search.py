@@ -0,0 +1,84 @@
+"""
+Check that demographic client searches are answered from indexes, by
+printing the query plan of typical searches against a throwaway SQLite
+database filled with generated clients and enrollments.
+
+    python explain_search.py --clients 20000
+"""
+import argparse
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+
+# Filters of typical searches and an index each plan is expected to use
+SEARCHES = [
+    ('females aged 15-24', {'gender': 'Female', 'min_age': 15, 'max_age': 24}, 'ix_client_live_demographics'),
+    ('females aged 15-24 not enrolled in program 1',
+     {'gender': 'Female', 'min_age': 15, 'max_age': 24, 'not_enrolled_in': 1}, 'uq_enrollment_live_client_program'),
+    ('enrolled in program 2 and Suspended', {'enrolled_in': 2, 'status': 'Suspended'}, 'ix_enrollment_live_program'),
+    ('next page after client 5000', {'after': 5000}, 'PRIMARY KEY'),
+]
+
+
+def explain(query):
+    """Query plan lines of an ORM query on the current database"""
+    from models import db
+    dialect = db.engine.dialect
+    sql = str(query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    return [' '.join(str(value) for value in row) for row in db.session.execute(db.text(prefix + sql))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=20000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ['DATABASE_URI'] = f'sqlite:///{directory}/explain.db'
+    os.environ.setdefault('JWT_SECRET_KEY', 'explain-secret-key-with-enough-length')
+
+    from app import create_app
+    from models import db, Client, Program, Enrollment, User
+    from client_search import client_search_query
+
+    app = create_app(with_migrations=False)
+    with app.app_context():
+        db.create_all()
+        random.seed(1)
+        user = User(username='explain', password='-', email='explain@example.com')
+        db.session.add(user)
+        db.session.flush()
+        programs = [Program(name=f'Program {i}', duration=30, created_by=user.id) for i in range(1, 6)]
+        db.session.add_all(programs)
+        db.session.flush()
+
+        clients = [{
+            'first_name': f'First{i}', 'last_name': f'Last{i % 1000}',
+            'date_of_birth': date(1950, 1, 1) + timedelta(days=random.randrange(70 * 365)),
+            'gender': random.choice(['Female', 'Male']), 'created_by': user.id
+        } for i in range(args.clients)]
+        db.session.execute(db.insert(Client), clients)
+        enrollments = [{
+            'client_id': client_id, 'program_id': program.id,
+            'status': random.choice(['Active', 'Active', 'Completed', 'Suspended'])
+        } for client_id in range(1, args.clients + 1) for program in random.sample(programs, 2)]
+        db.session.execute(db.insert(Enrollment), enrollments)
+        db.session.commit()
+        db.session.execute(db.text('ANALYZE'))
+
+        failures = 0
+        for label, filters, index in SEARCHES:
+            query = client_search_query(filters)
+            plan = explain(query)
+            uses_index = any(index in line for line in plan)
+            failures += not uses_index
+            print(f"{label}: {query.count()} clients, {'uses' if uses_index else 'DOES NOT USE'} {index}")
+            for line in plan:
+                print(f"    {line}")
+        raise SystemExit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+from models import db, Facility, User
+from user_tokens import revoke_tokens
+from sqlalchemy import Index, MetaData, select, text
+import click
+
+# Tables that can be split into one Postgres partition per facility
+PARTITIONED_TABLES = ('client', 'enrollment')
+
+# Foreign keys re-created on the partitioned tables; enrollment references
+# client through the partition key as well
+PARTITION_FOREIGN_KEYS = {
+    'client': [
+        'FOREIGN KEY (facility_id) REFERENCES facility (id)',
+        'FOREIGN KEY (created_by) REFERENCES "user" (id)',
+    ],
+    'enrollment': [
+        'FOREIGN KEY (facility_id) REFERENCES facility (id)',
+        'FOREIGN KEY (facility_id, client_id) REFERENCES client (facility_id, id)',
+        'FOREIGN KEY (program_id) REFERENCES program (id)',
+        'FOREIGN KEY (created_by) REFERENCES "user" (id)',
+    ],
+}
+
+
+def is_partitioned(connection, table_name):
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.scalar(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :table_name)"
+    ), {'table_name': table_name})
+
+
+def _create_partition(connection, table_name, facility_id):
+    facility_id = int(facility_id)
+    connection.execute(text(
+        f'CREATE TABLE IF NOT EXISTS {table_name}_facility_{facility_id} '
+        f'PARTITION OF {table_name} FOR VALUES IN ({facility_id})'
+    ))
+
+
+def create_facility_partitions(connection, facility_id):
+    """Give a new facility its own partition of each partitioned table"""
+    for table_name in PARTITIONED_TABLES:
+        if is_partitioned(connection, table_name):
+            _create_partition(connection, table_name, facility_id)
+
+
+def _partition_index(index):
+    """The model's index, with unique ones made to include the partition key as Postgres requires"""
+    if not index.unique or 'facility_id' in index.columns.keys():
+        return index
+    return Index(
+        index.name, index.table.c.facility_id, *index.columns, unique=True,
+        postgresql_where=index.dialect_options['postgresql']['where']
+    )
+
+
+def partition_tables(connection):
+    """
+    Rebuild client and enrollment as tables LIST partitioned by facility_id,
+    with a partition per existing facility and a default partition, so
+    queries limited to one facility only read that facility's partition.
+    Postgres only; tables that are already partitioned are left alone.
+    """
+    facility_ids = connection.scalars(select(Facility.id).order_by(Facility.id)).all()
+    done = []
+    for table_name in PARTITIONED_TABLES:
+        if is_partitioned(connection, table_name):
+            continue
+        old = f'{table_name}_unpartitioned'
+        sequence = connection.scalar(text("SELECT pg_get_serial_sequence(:table_name, 'id')"), {'table_name': table_name})
+
+        connection.execute(text(f'ALTER TABLE {table_name} RENAME TO {old}'))
+        connection.execute(text(
+            f'CREATE TABLE {table_name} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY LIST (facility_id)'
+        ))
+        # Unique keys of a partitioned table must include the partition key
+        connection.execute(text(f'ALTER TABLE {table_name} ADD PRIMARY KEY (facility_id, id)'))
+        if sequence:
+            connection.execute(text(f'ALTER SEQUENCE {sequence} OWNED BY {table_name}.id'))
+        for facility_id in facility_ids:
+            _create_partition(connection, table_name, facility_id)
+        connection.execute(text(f'CREATE TABLE {table_name}_default PARTITION OF {table_name} DEFAULT'))
+
+        connection.execute(text(f'INSERT INTO {table_name} SELECT * FROM {old}'))
+        connection.execute(text(f'DROP TABLE {old} CASCADE'))
+
+        # Indexes on the parent are created on every partition. A copy of the
+        # table is used so the extra indexes don't end up in the app's metadata
+        table = db.metadata.tables[table_name].to_metadata(MetaData())
+        for index in list(table.indexes):
+            _partition_index(index).create(connection)
+        for foreign_key in PARTITION_FOREIGN_KEYS[table_name]:
+            connection.execute(text(f'ALTER TABLE {table_name} ADD {foreign_key}'))
+        done.append(table_name)
+    return done
+
+
+def init_facilities(app):
+    @app.cli.group('facility')
+    def facility_group():
+        """Manage facilities"""
+
+    @facility_group.command('create')
+    @click.argument('name')
+    def create_command(name):
+        """Add a facility (and its partitions when the tables are partitioned)"""
+        facility = Facility(name=name)
+        db.session.add(facility)
+        db.session.flush()
+        create_facility_partitions(db.session.connection(), facility.id)
+        db.session.commit()
+        click.echo(f"Created facility {facility.id}: {facility.name}")
+
+    @facility_group.command('assign')
+    @click.argument('username')
+    @click.argument('facility_id', type=int)
+    def assign_command(username, facility_id):
+        """Limit a user to a facility; their current tokens stop working"""
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f"No user named {username}")
+        if db.session.get(Facility, facility_id) is None:
+            raise click.ClickException(f"No facility with ID {facility_id}")
+        user.facility_id = facility_id
+        revoke_tokens(user)
+        db.session.commit()
+        click.echo(f"{username} now belongs to facility {facility_id}")
+
+    @facility_group.command('partition')
+    def partition_command():
+        """Partition client and enrollment by facility (Postgres only)"""
+        if db.engine.dialect.name != 'postgresql':
+            raise click.ClickException("Partitioning needs PostgreSQL")
+        with db.engine.begin() as connection:
+            done = partition_tables(connection)
+        click.echo(f"Partitioned: {', '.join(done) if done else 'nothing to do'}")
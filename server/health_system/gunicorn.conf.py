@@ -0,0 +1,29 @@
+import os
+
+# gunicorn reads this file from the working directory: `gunicorn`
+wsgi_app = 'wsgi:app'
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Each worker serves requests from a pool of threads, so identical requests
+# on one worker can be coalesced (single_flight.py) and a slow request or an
+# event stream doesn't block the worker's other requests
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+# Import the app once in the master and fork workers from it, instead of
+# every worker importing Flask, SQLAlchemy and the routes on its own
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Connections must not be shared across processes; give each worker
+    # fresh pools without closing the master's connections
+    from models import db
+    from db_routing import replica_router
+    from wsgi import app
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+    for engine in replica_router.engines:
+        engine.dispose(close=False)
@@ -0,0 +1,179 @@
+from flask import request, current_app
+from flask_jwt_extended import get_jwt_identity
+from models import db, IdempotencyKey
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+from functools import wraps
+import hashlib
+import json
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def _digest(*parts):
+    sha = hashlib.sha256()
+    for part in parts:
+        sha.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def request_fingerprint():
+    """SHA-256 of the query string and body; JSON bodies are compared by content, not formatting"""
+    body = request.get_json(silent=True)
+    body = json.dumps(body, sort_keys=True) if body is not None else request.get_data()
+    return _digest(request.query_string, body)
+
+
+def _split(result):
+    """A resource method's result as (data, status, headers)"""
+    if not isinstance(result, tuple):
+        result = (result,)
+    data = result[0]
+    status = result[1] if len(result) > 1 else 200
+    headers = result[2] if len(result) > 2 else {}
+    return data, status, dict(headers or {})
+
+
+def _replay(record):
+    return record.response, record.status_code, {**(record.response_headers or {}), 'Idempotent-Replayed': 'true'}
+
+
+def _in_progress():
+    return {'error': "A request with this Idempotency-Key is still being processed"}, 409, {'Retry-After': '1'}
+
+
+def _find(key_id):
+    # A plain row, still readable after the transaction ends
+    return db.session.execute(select(*IdempotencyKey.__table__.c).where(IdempotencyKey.id == key_id)).first()
+
+
+def reserve(key_id, fingerprint, now=None):
+    """
+    Claim a key for this request before running it, in a transaction of its
+    own. Returns None when the request should run, or the response to send
+    instead: the stored response of a finished request with the same key, or
+    an error when the key is in use or was used for a different request.
+    """
+    now = now or datetime.utcnow()
+    config = current_app.config
+    record = _find(key_id)
+
+    if record is not None and record.expires_at <= now:
+        db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == key_id))
+        record = None
+
+    if record is None:
+        try:
+            db.session.execute(insert(IdempotencyKey).values(
+                id=key_id,
+                fingerprint=fingerprint,
+                locked_at=now,
+                expires_at=now + timedelta(seconds=config['IDEMPOTENCY_KEY_TTL_SECONDS'])
+            ))
+            db.session.commit()
+            return None
+        except IntegrityError:
+            # A concurrent request with the same key got there first
+            db.session.rollback()
+            record = _find(key_id)
+            if record is None:
+                return _in_progress()
+
+    if record.fingerprint != fingerprint:
+        db.session.rollback()
+        return {'error': "This Idempotency-Key was already used for a different request"}, 422
+    if record.status_code is not None:
+        db.session.rollback()
+        return _replay(record)
+    if record.locked_at > now - timedelta(seconds=config['IDEMPOTENCY_LOCK_SECONDS']):
+        db.session.rollback()
+        return _in_progress()
+
+    # The first request never finished (its worker died); let this one take over,
+    # unless another retry just did
+    taken = db.session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.id == key_id, IdempotencyKey.locked_at == record.locked_at)
+        .values(locked_at=now)
+    ).rowcount
+    db.session.commit()
+    return None if taken else _in_progress()
+
+
+def finish(key_id, data, status, headers):
+    """
+    Add the response for retries to the current transaction; server errors
+    release the key so the request can be retried. The caller commits.
+    """
+    if status >= 500:
+        db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == key_id))
+    else:
+        db.session.execute(update(IdempotencyKey).where(IdempotencyKey.id == key_id).values(
+            status_code=status,
+            response=data,
+            response_headers=headers,
+            locked_at=None
+        ))
+
+
+def idempotent(f):
+    """
+    Honour an Idempotency-Key header on a POST: the first request with a
+    key runs and its response is stored; retries of the same request by the
+    same user get that response back from the idempotency_key table (with
+    Idempotent-Replayed: true) without running again. Must be applied
+    inside @jwt_required().
+
+    The decorated method flushes its changes instead of committing them.
+    They are committed here, in the same transaction as the stored
+    response, so a worker that dies in between can't leave the changes
+    without the response and let a retry make them again.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            result = f(*args, **kwargs)
+            try:
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                return {'error': str(e)}, 500
+            return result
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return {'error': f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters"}, 400
+
+        key_id = _digest(get_jwt_identity(), request.method, request.path, key)
+        response = reserve(key_id, request_fingerprint())
+        if response is not None:
+            return response
+
+        try:
+            result = f(*args, **kwargs)
+            finish(key_id, *_split(result))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            finish(key_id, None, 500, {})
+            db.session.commit()
+            return {'error': str(e)}, 500
+        return result
+    return decorated
+
+
+def purge_expired_keys(now=None):
+    """Delete expired keys; returns how many were deleted"""
+    deleted = db.session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.expires_at <= (now or datetime.utcnow()))
+    ).rowcount
+    db.session.commit()
+    return deleted
+
+
+def init_idempotency(app):
+    app.config.setdefault('IDEMPOTENCY_KEY_TTL_SECONDS', 24 * 3600)
+    # How long a retry waits for the first request before assuming it died
+    app.config.setdefault('IDEMPOTENCY_LOCK_SECONDS', 60)
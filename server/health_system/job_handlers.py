@@ -0,0 +1,158 @@
+from flask import current_app
+from models import db, Client
+from jobs import job_handler
+from outbox import record_events
+from enrollment_lifecycle import complete_due_enrollments
+from dedup import blocking_keys, backfill_blocking_keys, scan_duplicates
+from bulk_export import write_bulk_export
+from idempotency import purge_expired_keys
+from audit import audit_log
+from routes.schemas import client_schema
+from marshmallow import ValidationError
+from sqlalchemy import insert
+from datetime import datetime
+import csv
+import os
+
+IMPORT_BATCH_SIZE = 500
+EXPORT_BATCH_SIZE = 1000
+
+CLIENT_EXPORT_FIELDS = [
+    'id', 'first_name', 'last_name', 'date_of_birth', 'gender',
+    'contact_number', 'email', 'address', 'created_by', 'created_at'
+]
+
+
+def parse_client_row(row, created_by):
+    """Validate one imported client like a registration, returning the column values"""
+    data = client_schema.load(row)
+    return {
+        'first_name': data['first_name'],
+        'last_name': data['last_name'],
+        'date_of_birth': data['date_of_birth'],
+        'gender': data['gender'],
+        'contact_number': data.get('contact_number'),
+        'email': data.get('email'),
+        'address': data.get('address'),
+        'created_by': created_by,
+        'created_at': datetime.utcnow(),
+        # Bulk inserts skip ORM events, so set the duplicate detection keys here
+        **blocking_keys(data['first_name'], data['last_name'], data['date_of_birth'], data.get('contact_number'))
+    }
+
+
+@job_handler('client_import')
+def import_clients(job, payload):
+    """
+    Register many clients at once
+    Rows that fail validation are skipped and reported in the result
+    """
+    rows = payload.get('clients', [])
+    # A retried job carries on from the totals saved with its last batch
+    totals = job.result or {}
+    imported = totals.get('imported', 0)
+    errors = totals.get('errors', [])
+    # A retried job picks up after the last committed batch
+    job.update_progress(job.progress, len(rows))
+
+    for start in range(job.progress, len(rows), IMPORT_BATCH_SIZE):
+        batch = []
+        for index, row in enumerate(rows[start:start + IMPORT_BATCH_SIZE], start):
+            try:
+                batch.append(parse_client_row(row, payload.get('created_by')))
+            except ValidationError as e:
+                errors.append({'row': index, 'errors': e.messages})
+
+        if batch:
+            # Committed with the batch by update_progress
+            created = db.session.execute(insert(Client).returning(Client.id, Client.facility_id), batch).all()
+            record_events(Client, 'created', created)
+            imported += len(batch)
+        job.update_progress(min(start + IMPORT_BATCH_SIZE, len(rows)),
+                            result={'imported': imported, 'errors': errors})
+
+    return {'imported': imported, 'errors': errors}
+
+
+@job_handler('client_export')
+def export_clients(job, payload):
+    """Write every client to a CSV file in EXPORT_DIR"""
+    export_dir = current_app.config['EXPORT_DIR']
+    os.makedirs(export_dir, exist_ok=True)
+    filename = f"clients_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{job.job_id}.csv"
+
+    total = Client.live().count()
+    job.update_progress(0, total)
+
+    written = 0
+    last_id = 0
+    with open(os.path.join(export_dir, filename), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CLIENT_EXPORT_FIELDS)
+        writer.writeheader()
+        # Read in id order one batch at a time instead of loading the whole table
+        while True:
+            clients = Client.live().filter(Client.id > last_id).order_by(Client.id).limit(EXPORT_BATCH_SIZE).all()
+            if not clients:
+                break
+            for client in clients:
+                writer.writerow({
+                    'id': client.id,
+                    'first_name': client.first_name,
+                    'last_name': client.last_name,
+                    'date_of_birth': client.date_of_birth.strftime('%d/%m/%Y'),
+                    'gender': client.gender,
+                    'contact_number': client.contact_number,
+                    'email': client.email,
+                    'address': client.address,
+                    'created_by': client.created_by,
+                    'created_at': client.created_at.isoformat() if client.created_at else None
+                })
+            audit_log.record('client', [c.id for c in clients], 'export', job.created_by, 'client_export')
+            written += len(clients)
+            last_id = clients[-1].id
+            job.update_progress(written)
+
+    return {'file': filename, 'rows': written}
+
+
+@job_handler('enrollment_completion')
+def complete_enrollments(job, payload):
+    """Mark enrollments whose program duration has passed as Completed"""
+    completed = complete_due_enrollments(payload.get('batch_size', 1000))
+    return {'completed': completed}
+
+
+@job_handler('idempotency_key_purge')
+def purge_idempotency_keys(job, payload):
+    """Delete Idempotency-Key responses past their expiry"""
+    return {'deleted': purge_expired_keys()}
+
+
+@job_handler('client_dedup_scan')
+def scan_client_duplicates(job, payload):
+    """Find likely duplicate clients across the whole registry"""
+    backfill_blocking_keys()
+
+    blocks_done = 0
+
+    def on_block():
+        nonlocal blocks_done
+        blocks_done += 1
+        if blocks_done % 100 == 0:
+            job.update_progress(blocks_done)
+
+    duplicates = scan_duplicates(on_block)
+    job.update_progress(blocks_done, blocks_done)
+    return {'duplicates': duplicates}
+
+
+@job_handler('bulk_export')
+def bulk_export(job, payload):
+    """FHIR-style bulk export of the requested resource types to NDJSON files"""
+    transaction_time = datetime.utcnow().isoformat()
+    output = write_bulk_export(job, payload['types'], payload.get('since'))
+    return {
+        'transactionTime': transaction_time,
+        'request': payload.get('request'),
+        'output': output
+    }
@@ -0,0 +1,327 @@
+from flask import current_app
+from models import db, Job
+from tenancy import current_facility_id, facility_scope
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import aliased
+from datetime import datetime, timedelta
+import click
+import threading
+import time
+
+# Registered job handlers, keyed by job type
+handlers = {}
+
+# Jobs this process is running, kept alive by the worker's heartbeat
+running_jobs = set()
+running_jobs_lock = threading.Lock()
+
+
+def job_handler(job_type):
+    """Register a function(job_context, payload) as the handler for a job type"""
+    def decorator(f):
+        handlers[job_type] = f
+        return f
+    return decorator
+
+
+class JobContext:
+    """
+    Handed to job handlers so they can report progress.
+    Progress is committed together with the handler's pending work, so a
+    retried job can resume from `progress` instead of starting over. A
+    partial `result` saved with it is handed back on the retry.
+    """
+
+    def __init__(self, job_id, progress=0, created_by=None, result=None):
+        self.job_id = job_id
+        self.progress = progress
+        self.created_by = created_by  # User who queued the job, for audit records
+        self.result = result
+
+    def update_progress(self, progress, total=None, result=None):
+        self.progress = progress
+        values = {'progress': progress, 'heartbeat_at': datetime.utcnow()}
+        if total is not None:
+            values['total'] = total
+        if result is not None:
+            self.result = result
+            values['result'] = result
+        db.session.execute(update(Job).where(Job.id == self.job_id).values(**values))
+        db.session.commit()
+
+
+class DatabaseBroker:
+    """Uses the job table itself as the queue"""
+
+    def push(self, job):
+        pass
+
+    def defer(self, job_id, seconds):
+        pass
+
+    def next_job_id(self, job_types, timeout):
+        if not job_types:
+            return None
+        return db.session.scalar(
+            select(Job.id).where(
+                Job.status == 'queued',
+                Job.run_after <= datetime.utcnow(),
+                Job.type.in_(job_types)
+            ).order_by(Job.run_after, Job.id).limit(1)
+        )
+
+
+class RedisBroker:
+    """
+    Delivers job ids through a Redis (or compatible) list. Job state still
+    lives in the job table; retries wait in a sorted set until they are due.
+    """
+
+    def __init__(self, url, key='afyalink:jobs'):
+        import redis
+
+        self.redis = redis.Redis.from_url(url)
+        self.key = key
+        self.delayed_key = f'{key}:delayed'
+
+    def push(self, job):
+        if job.run_after and job.run_after > datetime.utcnow():
+            self.redis.zadd(self.delayed_key, {job.id: job.run_after.timestamp()})
+        else:
+            self.redis.lpush(self.key, job.id)
+
+    def _promote_due(self):
+        due = self.redis.zrangebyscore(self.delayed_key, 0, datetime.utcnow().timestamp())
+        for job_id in due:
+            if self.redis.zrem(self.delayed_key, job_id):
+                self.redis.lpush(self.key, job_id)
+
+    def next_job_id(self, job_types, timeout):
+        self._promote_due()
+        item = self.redis.brpop(self.key, timeout=max(1, int(timeout)))
+        if item is None:
+            return None
+        job_id = int(item[1])
+        job_type = db.session.scalar(select(Job.type).where(Job.id == job_id))
+        if job_type not in job_types:
+            # Its type is at its concurrency limit, hand it back for later
+            self.defer(job_id, timeout)
+            return None
+        return job_id
+
+    def defer(self, job_id, seconds):
+        self.redis.zadd(self.delayed_key, {job_id: time.time() + seconds})
+
+
+def get_broker():
+    app = current_app._get_current_object()
+    broker = app.extensions.get('job_broker')
+    if broker is None:
+        url = app.config.get('JOB_BROKER_URL')
+        broker = RedisBroker(url) if url else DatabaseBroker()
+        app.extensions['job_broker'] = broker
+    return broker
+
+
+def enqueue(job_type, payload=None, created_by=None, max_attempts=None):
+    """Queue a job and return it; the caller gets the id to poll"""
+    if job_type not in handlers:
+        raise ValueError(f"Unknown job type: {job_type}")
+
+    job = Job(
+        type=job_type,
+        payload=payload,
+        created_by=created_by,
+        # The job sees the same facility as the user who queued it
+        facility_id=current_facility_id(),
+        max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS']
+    )
+    db.session.add(job)
+    db.session.commit()
+    get_broker().push(job)
+    return job
+
+
+def claim(job_id):
+    """
+    Atomically move a queued job to running; False if another worker got it
+    first or its type is already running as many jobs as it may
+    """
+    now = datetime.utcnow()
+    job_type = db.session.scalar(select(Job.type).where(Job.id == job_id))
+    limit = current_app.config['JOB_TYPE_CONCURRENCY'].get(job_type)
+    claim_job = update(Job).where(Job.id == job_id, Job.status == 'queued')
+    if limit is not None:
+        if db.engine.dialect.name == 'postgresql':
+            # Claims of one type take turns, so each counts the jobs the one before it started
+            db.session.execute(select(func.pg_advisory_xact_lock(func.hashtext(job_type))))
+        running = aliased(Job)
+        claim_job = claim_job.where(
+            select(func.count(running.id))
+            .where(running.type == job_type, running.status == 'running')
+            .scalar_subquery() < limit
+        )
+    claimed = db.session.execute(
+        claim_job.values(
+            status='running',
+            started_at=now,
+            heartbeat_at=now,
+            attempts=Job.attempts + 1
+        )
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+def run_job(job_id):
+    job = db.session.get(Job, job_id)
+    with running_jobs_lock:
+        running_jobs.add(job_id)
+    try:
+        with facility_scope(job.facility_id):
+            context = JobContext(job.id, job.progress, job.created_by, job.result)
+            result = handlers[job.type](context, job.payload or {})
+        job.status = 'succeeded'
+        job.result = result
+        job.error = None
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.error = str(e)
+        if job.attempts < job.max_attempts:
+            # Exponential backoff before the next attempt
+            delay = current_app.config['JOB_RETRY_BACKOFF_SECONDS'] * 2 ** (job.attempts - 1)
+            job.status = 'queued'
+            job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+            db.session.commit()
+            get_broker().push(job)
+        else:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+        current_app.logger.exception('Job %s (%s) failed', job.id, job.type)
+    finally:
+        with running_jobs_lock:
+            running_jobs.discard(job_id)
+
+
+def available_job_types():
+    """Job types that are below their concurrency limit"""
+    limits = current_app.config['JOB_TYPE_CONCURRENCY']
+    running = dict(db.session.execute(
+        select(Job.type, func.count(Job.id)).where(Job.status == 'running').group_by(Job.type)
+    ).all())
+    return [t for t in handlers if running.get(t, 0) < limits.get(t, float('inf'))]
+
+
+def send_heartbeat():
+    """Mark the jobs this process is running as still alive"""
+    with running_jobs_lock:
+        job_ids = list(running_jobs)
+    if job_ids:
+        db.session.execute(
+            update(Job).where(Job.id.in_(job_ids), Job.status == 'running').values(heartbeat_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+
+def requeue_stale_jobs():
+    """Put back running jobs whose worker stopped sending heartbeats"""
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=current_app.config['JOB_HEARTBEAT_TIMEOUT_SECONDS'])
+    stale = db.session.execute(
+        select(Job.id, Job.attempts, Job.max_attempts).where(Job.status == 'running', Job.heartbeat_at < cutoff)
+    ).all()
+    requeued = []
+    for job_id, attempts, max_attempts in stale:
+        retry = attempts < max_attempts
+        # Only if it is still silent, a heartbeat may have come in since the select
+        changed = db.session.execute(
+            update(Job).where(Job.id == job_id, Job.status == 'running', Job.heartbeat_at < cutoff).values(
+                status='queued' if retry else 'failed',
+                error='Worker stopped before the job finished',
+                finished_at=None if retry else now
+            )
+        ).rowcount
+        if changed and retry:
+            requeued.append(job_id)
+    db.session.commit()
+    for job_id in requeued:
+        get_broker().push(db.session.get(Job, job_id))
+
+
+def enqueue_scheduled_jobs():
+    """Queue each periodic job whose interval has passed since it was last queued"""
+    for job_type, interval in current_app.config['JOB_SCHEDULE'].items():
+        pending = db.session.scalar(
+            select(func.count(Job.id)).where(Job.type == job_type, Job.status.in_(['queued', 'running']))
+        )
+        last_queued = db.session.scalar(select(func.max(Job.created_at)).where(Job.type == job_type))
+        if not pending and (last_queued is None or last_queued <= datetime.utcnow() - timedelta(seconds=interval)):
+            enqueue(job_type)
+
+
+def work(app, poll_interval, stop_event):
+    """Worker thread loop: claim and run one job at a time"""
+    while not stop_event.is_set():
+        with app.app_context():
+            try:
+                job_id = get_broker().next_job_id(available_job_types(), poll_interval)
+                if job_id is not None:
+                    if claim(job_id):
+                        run_job(job_id)
+                        continue
+                    if db.session.scalar(select(Job.status).where(Job.id == job_id)) == 'queued':
+                        # Its type reached its concurrency limit after the broker handed it out
+                        get_broker().defer(job_id, poll_interval)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Job worker error')
+        stop_event.wait(poll_interval)
+
+
+def init_jobs(app):
+    app.config.setdefault('JOB_BROKER_URL', None)
+    app.config.setdefault('JOB_MAX_ATTEMPTS', 3)
+    app.config.setdefault('JOB_RETRY_BACKOFF_SECONDS', 10)
+    app.config.setdefault('JOB_HEARTBEAT_SECONDS', 10)
+    app.config.setdefault('JOB_HEARTBEAT_TIMEOUT_SECONDS', 60)
+    app.config.setdefault('JOB_TYPE_CONCURRENCY', {})
+    app.config.setdefault('JOB_SCHEDULE', {})
+    app.config.setdefault('EXPORT_DIR', f'{app.instance_path}/exports')
+    app.config.setdefault('BULK_EXPORT_FILE_ROWS', 10000)
+
+    # Handlers register themselves when their module is imported
+    import job_handlers  # noqa: F401
+
+    @app.cli.command('worker')
+    @click.option('--concurrency', type=int, default=2, help='Number of jobs run at the same time')
+    @click.option('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+    def worker_command(concurrency, poll_interval):
+        """Run background jobs until interrupted"""
+        stop_event = threading.Event()
+        threads = [
+            threading.Thread(target=work, args=(app, poll_interval, stop_event), daemon=True)
+            for _ in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        click.echo(f"Worker started with {concurrency} threads")
+        try:
+            while any(thread.is_alive() for thread in threads):
+                with app.app_context():
+                    try:
+                        send_heartbeat()
+                        # Any worker may take over the jobs of one that died
+                        requeue_stale_jobs()
+                        enqueue_scheduled_jobs()
+                    except Exception:
+                        db.session.rollback()
+                        app.logger.exception('Could not run worker housekeeping')
+                stop_event.wait(app.config['JOB_HEARTBEAT_SECONDS'])
+        except KeyboardInterrupt:
+            stop_event.set()
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,38 @@
+"""Blocking keys for duplicate client detection
+
+Revision ID: 1c3c3af9ef33
+Revises: 39c402ff47e2
+Create Date: 2026-10-19 09:04:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c3c3af9ef33'
+down_revision = '39c402ff47e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing clients get their keys from the first client_dedup_scan job
+    op.add_column('client', sa.Column('first_name_key', sa.String(length=4), nullable=True))
+    op.add_column('client', sa.Column('last_name_key', sa.String(length=4), nullable=True))
+    op.add_column('client', sa.Column('birth_year', sa.Integer(), nullable=True))
+    op.add_column('client', sa.Column('phone_suffix', sa.String(length=7), nullable=True))
+    op.create_index('ix_client_block_last_name_year', 'client', ['last_name_key', 'birth_year'])
+    op.create_index('ix_client_block_names', 'client', ['last_name_key', 'first_name_key'])
+    op.create_index('ix_client_block_phone', 'client', ['phone_suffix'])
+
+
+def downgrade():
+    op.drop_index('ix_client_block_phone', table_name='client')
+    op.drop_index('ix_client_block_names', table_name='client')
+    op.drop_index('ix_client_block_last_name_year', table_name='client')
+    with op.batch_alter_table('client') as batch_op:
+        batch_op.drop_column('phone_suffix')
+        batch_op.drop_column('birth_year')
+        batch_op.drop_column('last_name_key')
+        batch_op.drop_column('first_name_key')
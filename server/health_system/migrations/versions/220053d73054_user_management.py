@@ -0,0 +1,34 @@
+"""User management: deactivation, token revocation, created_by indexes
+
+Revision ID: 220053d73054
+Revises: ad676c872e32
+Create Date: 2026-10-19 09:12:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '220053d73054'
+down_revision = 'ad676c872e32'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('is_active', sa.Boolean(), server_default=sa.true(), nullable=False))
+    op.add_column('user', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+    # The user list counts the records each user created
+    op.create_index('ix_client_created_by', 'client', ['created_by'])
+    op.create_index('ix_program_created_by', 'program', ['created_by'])
+    op.create_index('ix_enrollment_created_by', 'enrollment', ['created_by'])
+
+
+def downgrade():
+    op.drop_index('ix_enrollment_created_by', table_name='enrollment')
+    op.drop_index('ix_program_created_by', table_name='program')
+    op.drop_index('ix_client_created_by', table_name='client')
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('token_version')
+        batch_op.drop_column('is_active')
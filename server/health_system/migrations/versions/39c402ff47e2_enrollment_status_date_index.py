@@ -0,0 +1,24 @@
+"""Index enrollments by status and date for the completion job
+
+Revision ID: 39c402ff47e2
+Revises: 863c36dbee53
+Create Date: 2026-10-19 09:03:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '39c402ff47e2'
+down_revision = '863c36dbee53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_enrollment_status_date', 'enrollment', ['status', 'enrollment_date'])
+
+
+def downgrade():
+    op.drop_index('ix_enrollment_status_date', table_name='enrollment')
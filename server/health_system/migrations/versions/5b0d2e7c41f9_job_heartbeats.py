@@ -0,0 +1,27 @@
+"""Job heartbeats
+
+Revision ID: 5b0d2e7c41f9
+Revises: 87e4b714393d
+Create Date: 2026-10-19 09:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b0d2e7c41f9'
+down_revision = '87e4b714393d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('job', sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+    # Jobs already running count from when they started
+    op.execute("UPDATE job SET heartbeat_at = started_at WHERE status = 'running'")
+
+
+def downgrade():
+    with op.batch_alter_table('job') as batch_op:
+        batch_op.drop_column('heartbeat_at')
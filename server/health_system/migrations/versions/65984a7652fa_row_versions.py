@@ -0,0 +1,27 @@
+"""Row versions for optimistic concurrency
+
+Revision ID: 65984a7652fa
+Revises: d6030eede1a2
+Create Date: 2026-10-19 09:07:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '65984a7652fa'
+down_revision = 'd6030eede1a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('client', 'program', 'enrollment'):
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    for table in ('enrollment', 'program', 'client'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version')
@@ -0,0 +1,35 @@
+"""Idempotency keys for client and enrollment creation
+
+Revision ID: 87e4b714393d
+Revises: 9e886a79566f
+Create Date: 2026-10-19 09:14:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '87e4b714393d'
+down_revision = '9e886a79566f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('idempotency_key',
+        sa.Column('id', sa.String(length=64), nullable=False),
+        sa.Column('fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('status_code', sa.Integer(), nullable=True),
+        sa.Column('response', sa.JSON(), nullable=True),
+        sa.Column('response_headers', sa.JSON(), nullable=True),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_idempotency_key_expires_at', 'idempotency_key', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_idempotency_key_expires_at', table_name='idempotency_key')
+    op.drop_table('idempotency_key')
@@ -0,0 +1,81 @@
+"""Initial schema
+
+Revision ID: 91991623d608
+Revises: 
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '91991623d608'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases set up with db.create_all() before there were migrations
+    # already have these tables; upgrading them starts from the next revision
+    if 'user' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.create_table('user',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=80), nullable=False),
+        sa.Column('password', sa.String(length=120), nullable=False),
+        sa.Column('email', sa.String(length=120), nullable=False),
+        sa.Column('role', sa.String(length=50), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('last_login', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+        sa.UniqueConstraint('username')
+    )
+    op.create_table('client',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('first_name', sa.String(length=50), nullable=False),
+        sa.Column('last_name', sa.String(length=50), nullable=False),
+        sa.Column('date_of_birth', sa.Date(), nullable=False),
+        sa.Column('gender', sa.String(length=10), nullable=False),
+        sa.Column('contact_number', sa.String(length=15), nullable=True),
+        sa.Column('email', sa.String(length=100), nullable=True),
+        sa.Column('address', sa.String(length=200), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['user.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('program',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('duration', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+    op.create_table('enrollment',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=False),
+        sa.Column('program_id', sa.Integer(), nullable=False),
+        sa.Column('enrollment_date', sa.DateTime(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['client_id'], ['client.id']),
+        sa.ForeignKeyConstraint(['created_by'], ['user.id']),
+        sa.ForeignKeyConstraint(['program_id'], ['program.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('client_id', 'program_id')
+    )
+
+
+def downgrade():
+    op.drop_table('enrollment')
+    op.drop_table('program')
+    op.drop_table('client')
+    op.drop_table('user')
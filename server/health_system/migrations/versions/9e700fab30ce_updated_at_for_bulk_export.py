@@ -0,0 +1,35 @@
+"""Track when clients and enrollments were last updated, for bulk export _since
+
+Revision ID: 9e700fab30ce
+Revises: 1c3c3af9ef33
+Create Date: 2026-10-19 09:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e700fab30ce'
+down_revision = '1c3c3af9ef33'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('client', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.add_column('enrollment', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    # Existing rows count as last changed when they were created
+    op.execute('UPDATE client SET updated_at = created_at')
+    op.execute('UPDATE enrollment SET updated_at = enrollment_date')
+    op.create_index('ix_client_updated_at', 'client', ['updated_at'])
+    op.create_index('ix_enrollment_updated_at', 'enrollment', ['updated_at'])
+
+
+def downgrade():
+    op.drop_index('ix_enrollment_updated_at', table_name='enrollment')
+    op.drop_index('ix_client_updated_at', table_name='client')
+    with op.batch_alter_table('enrollment') as batch_op:
+        batch_op.drop_column('updated_at')
+    with op.batch_alter_table('client') as batch_op:
+        batch_op.drop_column('updated_at')
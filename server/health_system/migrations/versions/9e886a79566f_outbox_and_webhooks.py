@@ -0,0 +1,53 @@
+"""Outbox events and webhooks
+
+Revision ID: 9e886a79566f
+Revises: 220053d73054
+Create Date: 2026-10-19 09:13:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e886a79566f'
+down_revision = '220053d73054'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outbox_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('event_type', sa.String(length=30), nullable=False),
+        sa.Column('resource_id', sa.Integer(), nullable=False),
+        sa.Column('facility_id', sa.Integer(), nullable=True),
+        sa.Column('payload', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_outbox_event_facility', 'outbox_event', ['facility_id', 'id'])
+    op.create_index('ix_outbox_event_created_at', 'outbox_event', ['created_at'])
+    op.create_table('webhook',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('url', sa.String(length=500), nullable=False),
+        sa.Column('secret', sa.String(length=64), nullable=False),
+        sa.Column('event_types', sa.JSON(), nullable=True),
+        sa.Column('facility_id', sa.Integer(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), server_default=sa.true(), nullable=False),
+        sa.Column('last_event_id', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('failures', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['user.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('webhook')
+    op.drop_index('ix_outbox_event_created_at', table_name='outbox_event')
+    op.drop_index('ix_outbox_event_facility', table_name='outbox_event')
+    op.drop_table('outbox_event')
@@ -0,0 +1,99 @@
+"""Soft delete clients, programs and enrollments; archive tables
+
+Revision ID: a67a0a64fe2b
+Revises: 91991623d608
+Create Date: 2026-10-19 09:01:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a67a0a64fe2b'
+down_revision = '91991623d608'
+branch_labels = None
+depends_on = None
+
+LIVE = sa.text('deleted_at IS NULL')
+
+
+def drop_unique(table, columns):
+    """
+    Drop the unnamed UNIQUE constraint on columns. Postgres named it
+    <table>_<columns>_key; SQLite has no name for it, so the table is
+    rebuilt without it.
+    """
+    if op.get_bind().dialect.name == 'sqlite':
+        naming_convention = {'uq': 'uq_%(table_name)s_%(column_0_name)s'}
+        with op.batch_alter_table(table, naming_convention=naming_convention) as batch_op:
+            batch_op.drop_constraint(f'uq_{table}_{columns[0]}', type_='unique')
+    else:
+        op.drop_constraint(f"{table}_{'_'.join(columns)}_key", table, type_='unique')
+
+
+def upgrade():
+    for table in ('client', 'program', 'enrollment'):
+        op.add_column(table, sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    # Uniqueness only applies to rows that have not been deleted
+    drop_unique('program', ['name'])
+    drop_unique('enrollment', ['client_id', 'program_id'])
+    op.create_index('uq_program_live_name', 'program', ['name'], unique=True,
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+    op.create_index('uq_enrollment_live_client_program', 'enrollment', ['client_id', 'program_id'], unique=True,
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+    op.create_index('ix_enrollment_live_program', 'enrollment', ['program_id'],
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+    op.create_index('ix_client_live_name', 'client', ['last_name', 'first_name'],
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+
+    op.create_table('client_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('first_name', sa.String(length=50), nullable=False),
+        sa.Column('last_name', sa.String(length=50), nullable=False),
+        sa.Column('date_of_birth', sa.Date(), nullable=False),
+        sa.Column('gender', sa.String(length=10), nullable=False),
+        sa.Column('contact_number', sa.String(length=15), nullable=True),
+        sa.Column('email', sa.String(length=100), nullable=True),
+        sa.Column('address', sa.String(length=200), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.Column('deleted_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('enrollment_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=False),
+        sa.Column('program_id', sa.Integer(), nullable=False),
+        sa.Column('enrollment_date', sa.DateTime(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.Column('deleted_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_enrollment_archive_client_id', 'enrollment_archive', ['client_id'])
+    op.create_index('ix_enrollment_archive_program_id', 'enrollment_archive', ['program_id'])
+
+
+def downgrade():
+    op.drop_index('ix_enrollment_archive_program_id', table_name='enrollment_archive')
+    op.drop_index('ix_enrollment_archive_client_id', table_name='enrollment_archive')
+    op.drop_table('enrollment_archive')
+    op.drop_table('client_archive')
+
+    # Fails if deleted rows now share a name or a client and program with live ones
+    op.drop_index('ix_client_live_name', table_name='client')
+    op.drop_index('ix_enrollment_live_program', table_name='enrollment')
+    op.drop_index('uq_enrollment_live_client_program', table_name='enrollment')
+    op.drop_index('uq_program_live_name', table_name='program')
+    with op.batch_alter_table('enrollment') as batch_op:
+        batch_op.create_unique_constraint('enrollment_client_id_program_id_key', ['client_id', 'program_id'])
+    with op.batch_alter_table('program') as batch_op:
+        batch_op.create_unique_constraint('program_name_key', ['name'])
+
+    for table in ('enrollment', 'program', 'client'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('deleted_at')
@@ -0,0 +1,27 @@
+"""Index live clients by facility and ID for paging search results
+
+Revision ID: a702eb3326b9
+Revises: efd41b9877b0
+Create Date: 2026-10-19 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a702eb3326b9'
+down_revision = 'efd41b9877b0'
+branch_labels = None
+depends_on = None
+
+LIVE = sa.text('deleted_at IS NULL')
+
+
+def upgrade():
+    op.create_index('ix_client_live_id', 'client', ['facility_id', 'id'],
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+
+
+def downgrade():
+    op.drop_index('ix_client_live_id', table_name='client')
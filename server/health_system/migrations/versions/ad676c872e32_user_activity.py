@@ -0,0 +1,31 @@
+"""User activity: last seen, login and request counts
+
+Revision ID: ad676c872e32
+Revises: a702eb3326b9
+Create Date: 2026-10-19 09:11:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ad676c872e32'
+down_revision = 'a702eb3326b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('last_seen', sa.DateTime(), nullable=True))
+    op.add_column('user', sa.Column('login_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('user', sa.Column('request_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_index('ix_user_last_seen', 'user', ['last_seen'])
+
+
+def downgrade():
+    op.drop_index('ix_user_last_seen', table_name='user')
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('request_count')
+        batch_op.drop_column('login_count')
+        batch_op.drop_column('last_seen')
@@ -0,0 +1,81 @@
+"""Facilities: clients, programs and enrollments belong to one
+
+Revision ID: c68024d5d174
+Revises: 65984a7652fa
+Create Date: 2026-10-19 09:08:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c68024d5d174'
+down_revision = '65984a7652fa'
+branch_labels = None
+depends_on = None
+
+LIVE = sa.text('deleted_at IS NULL')
+DEFAULT_FACILITY_ID = 1
+
+
+def recreate_indexes(facility_first):
+    """The search and uniqueness indexes, leading with facility_id or (downgrade) without it"""
+    lead = ['facility_id'] if facility_first else []
+    op.drop_index('ix_client_live_name', table_name='client')
+    op.drop_index('ix_client_block_last_name_year', table_name='client')
+    op.drop_index('ix_client_block_names', table_name='client')
+    op.drop_index('ix_client_block_phone', table_name='client')
+    op.drop_index('uq_program_live_name', table_name='program')
+    op.drop_index('ix_enrollment_live_program', table_name='enrollment')
+    op.create_index('ix_client_live_name', 'client', lead + ['last_name', 'first_name'],
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+    op.create_index('ix_client_block_last_name_year', 'client', lead + ['last_name_key', 'birth_year'])
+    op.create_index('ix_client_block_names', 'client', lead + ['last_name_key', 'first_name_key'])
+    op.create_index('ix_client_block_phone', 'client', lead + ['phone_suffix'])
+    op.create_index('uq_program_live_name', 'program', lead + ['name'], unique=True,
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+    op.create_index('ix_enrollment_live_program', 'enrollment', lead + ['program_id'],
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+
+
+def upgrade():
+    op.create_table('facility',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+    # Existing users and records belong to the default facility
+    op.execute(f"INSERT INTO facility (id, name) VALUES ({DEFAULT_FACILITY_ID}, 'Main facility')")
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("SELECT setval(pg_get_serial_sequence('facility', 'id'), (SELECT MAX(id) FROM facility))")
+
+    # Foreign keys get the names Postgres gives them in tables created from the models
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.add_column(sa.Column('facility_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('user_facility_id_fkey', 'facility', ['facility_id'], ['id'])
+    for table in ('client', 'program', 'enrollment'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column(
+                'facility_id', sa.Integer(), server_default=str(DEFAULT_FACILITY_ID), nullable=False
+            ))
+            batch_op.create_foreign_key(f'{table}_facility_id_fkey', 'facility', ['facility_id'], ['id'])
+    for table in ('client_archive', 'enrollment_archive', 'job'):
+        op.add_column(table, sa.Column('facility_id', sa.Integer(), nullable=True))
+
+    recreate_indexes(facility_first=True)
+
+
+def downgrade():
+    recreate_indexes(facility_first=False)
+
+    for table in ('user', 'client', 'program', 'enrollment'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_constraint(f'{table}_facility_id_fkey', type_='foreignkey')
+            batch_op.drop_column('facility_id')
+    for table in ('job', 'enrollment_archive', 'client_archive'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('facility_id')
+    op.drop_table('facility')
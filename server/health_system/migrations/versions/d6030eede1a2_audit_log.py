@@ -0,0 +1,38 @@
+"""Audit log of client and program reads
+
+Revision ID: d6030eede1a2
+Revises: 9e700fab30ce
+Create Date: 2026-10-19 09:06:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6030eede1a2'
+down_revision = '9e700fab30ce'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('audit_log',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('action', sa.String(length=20), nullable=False),
+        sa.Column('resource_type', sa.String(length=20), nullable=False),
+        sa.Column('resource_id', sa.Integer(), nullable=True),
+        sa.Column('endpoint', sa.String(length=100), nullable=True),
+        sa.Column('ip_address', sa.String(length=45), nullable=True),
+        sa.Column('accessed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_audit_log_resource', 'audit_log', ['resource_type', 'resource_id', 'accessed_at'])
+    op.create_index('ix_audit_log_user', 'audit_log', ['user_id', 'accessed_at'])
+
+
+def downgrade():
+    op.drop_index('ix_audit_log_user', table_name='audit_log')
+    op.drop_index('ix_audit_log_resource', table_name='audit_log')
+    op.drop_table('audit_log')
@@ -0,0 +1,27 @@
+"""Index live clients by gender and date of birth for demographic search
+
+Revision ID: efd41b9877b0
+Revises: c68024d5d174
+Create Date: 2026-10-19 09:09:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'efd41b9877b0'
+down_revision = 'c68024d5d174'
+branch_labels = None
+depends_on = None
+
+LIVE = sa.text('deleted_at IS NULL')
+
+
+def upgrade():
+    op.create_index('ix_client_live_demographics', 'client', ['facility_id', 'gender', 'date_of_birth'],
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+
+
+def downgrade():
+    op.drop_index('ix_client_live_demographics', table_name='client')
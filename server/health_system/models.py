@@ -1,9 +1,30 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, DDL
+from sqlalchemy.orm import declared_attr
 from datetime import datetime
 import bcrypt
+from db_routing import RoutingSession
+from tenancy import TenantMixin, DEFAULT_FACILITY_ID
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+class Facility(db.Model):
+    """A clinic or hospital; clients, programs and enrollments belong to one"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Facility {self.name}>'
+
+# Every database starts with the default facility that existing rows belong to
+event.listen(Facility.__table__, 'after_create', DDL(
+    f"INSERT INTO facility (id, name) VALUES ({DEFAULT_FACILITY_ID}, 'Main facility')"
+))
+event.listen(Facility.__table__, 'after_create', DDL(
+    "SELECT setval(pg_get_serial_sequence('facility', 'id'), (SELECT MAX(id) FROM facility))"
+).execute_if(dialect='postgresql'))
 
 class User(db.Model):
     __tablename__ = 'user'
@@ -12,8 +33,16 @@ class User(db.Model):
     password = db.Column(db.String(120), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     role = db.Column(db.String(50), nullable=False, default='doctor')
+    facility_id = db.Column(db.Integer, db.ForeignKey('facility.id'))  # None: the default facility
+    is_active = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
+    # Carried in access tokens; bumping it revokes every token issued before
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Activity, written in batches by user_activity.py
     last_login = db.Column(db.DateTime)
+    last_seen = db.Column(db.DateTime, index=True)
+    login_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    request_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # Relationships
     created_clients = db.relationship('Client', backref='creator', lazy=True)
@@ -33,7 +62,36 @@ class User(db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
-class Client(db.Model):
+class SoftDeleteMixin:
+    """Rows are marked with deleted_at instead of being removed"""
+    deleted_at = db.Column(db.DateTime)
+
+    @classmethod
+    def live(cls):
+        """Query only rows that have not been soft deleted"""
+        return cls.query.filter(cls.deleted_at.is_(None))
+
+    @classmethod
+    def get_live(cls, id):
+        return cls.live().filter(cls.id == id).first()
+
+class VersionedMixin:
+    """
+    Rows carry a version that every update increments. The ORM checks it on
+    flush, and API updates compare it against the request's If-Match header.
+    """
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    @declared_attr.directive
+    def __mapper_args__(cls):
+        return {'version_id_col': cls.version}
+
+def live_index(name, *columns, unique=False):
+    """Partial index covering only rows that have not been soft deleted"""
+    predicate = db.text('deleted_at IS NULL')
+    return db.Index(name, *columns, unique=unique, postgresql_where=predicate, sqlite_where=predicate)
+
+class Client(TenantMixin, SoftDeleteMixin, VersionedMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     first_name = db.Column(db.String(50), nullable=False)
     last_name = db.Column(db.String(50), nullable=False)
@@ -43,41 +101,222 @@ class Client(db.Model):
     email = db.Column(db.String(100))
     address = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+
+    # Blocking keys for duplicate detection, kept up to date by dedup.py
+    first_name_key = db.Column(db.String(4))
+    last_name_key = db.Column(db.String(4))
+    birth_year = db.Column(db.Integer)
+    phone_suffix = db.Column(db.String(7))
 
     # Relationship with programs through enrollments
     programs = db.relationship('Program', secondary='enrollment', back_populates='clients')
+
+    # Queries are limited to one facility, so the indexes lead with it
+    __table_args__ = (
+        live_index('ix_client_live_name', 'facility_id', 'last_name', 'first_name'),
+        db.Index('ix_client_block_last_name_year', 'facility_id', 'last_name_key', 'birth_year'),
+        db.Index('ix_client_block_names', 'facility_id', 'last_name_key', 'first_name_key'),
+        db.Index('ix_client_block_phone', 'facility_id', 'phone_suffix'),
+        # Demographic search: gender and an age range, i.e. a date_of_birth range
+        live_index('ix_client_live_demographics', 'facility_id', 'gender', 'date_of_birth'),
+        # Searches are returned in ID order, page by page
+        live_index('ix_client_live_id', 'facility_id', 'id'),
+    )
     
     def __repr__(self):
         return f'<Client {self.first_name} {self.last_name}>'
     
 
 
-class Program(db.Model):
+class Program(TenantMixin, SoftDeleteMixin, VersionedMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False, unique=True)
+    name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     duration = db.Column(db.Integer, nullable=False, default=30)  # Duration in days
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     
     # Relationship with clients through enrollments
     clients = db.relationship('Client', secondary='enrollment', back_populates='programs')
+
+    # Names only need to be unique among a facility's programs that have not been deleted
+    __table_args__ = (
+        live_index('uq_program_live_name', 'facility_id', 'name', unique=True),
+    )
     
     def __repr__(self):
         return f'<Program {self.name}>'
 
 
-class Enrollment(db.Model):
+class Enrollment(TenantMixin, SoftDeleteMixin, VersionedMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
     program_id = db.Column(db.Integer, db.ForeignKey('program.id'), nullable=False)
     enrollment_date = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='Active')  # Active, Completed, Suspended
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+
+    program = db.relationship('Program', viewonly=True)
     
-    # Ensure a client can only be enrolled once in a program
-    __table_args__ = (db.UniqueConstraint('client_id', 'program_id'),)
+    # Ensure a client can only be enrolled once in a program (re-enrolling
+    # after an unenrollment is allowed)
+    __table_args__ = (
+        live_index('uq_enrollment_live_client_program', 'client_id', 'program_id', unique=True),
+        live_index('ix_enrollment_live_program', 'facility_id', 'program_id'),
+        # Used by the scheduler that completes enrollments past their program duration
+        db.Index('ix_enrollment_status_date', 'status', 'enrollment_date'),
+    )
     
     def __repr__(self):
-        return f'<Enrollment client_id={self.client_id} program_id={self.program_id}>'
\ No newline at end of file
+        return f'<Enrollment client_id={self.client_id} program_id={self.program_id}>'
+
+
+class ClientArchive(db.Model):
+    """Deleted clients moved out of the client table by the archiver"""
+    __tablename__ = 'client_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    first_name = db.Column(db.String(50), nullable=False)
+    last_name = db.Column(db.String(50), nullable=False)
+    date_of_birth = db.Column(db.Date, nullable=False)
+    gender = db.Column(db.String(10), nullable=False)
+    contact_number = db.Column(db.String(15))
+    email = db.Column(db.String(100))
+    address = db.Column(db.String(200))
+    facility_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime)
+    created_by = db.Column(db.Integer)
+    deleted_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ClientArchive {self.id}>'
+
+
+class EnrollmentArchive(db.Model):
+    """Completed or deleted enrollments moved out of the enrollment table by the archiver"""
+    __tablename__ = 'enrollment_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    client_id = db.Column(db.Integer, nullable=False, index=True)
+    program_id = db.Column(db.Integer, nullable=False, index=True)
+    enrollment_date = db.Column(db.DateTime)
+    status = db.Column(db.String(20))
+    facility_id = db.Column(db.Integer)
+    created_by = db.Column(db.Integer)
+    deleted_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<EnrollmentArchive client_id={self.client_id} program_id={self.program_id}>'
+
+class Job(db.Model):
+    """A unit of background work picked up by `flask worker`"""
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # Last sign of life from the worker running it
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    facility_id = db.Column(db.Integer)  # Facility the job's queries are limited to, None for all
+
+    # The worker polls for the oldest due job of a given status
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.type} {self.status}>'
+
+class AuditLog(db.Model):
+    """
+    Append-only record of who read which patient data. Rows are written in
+    batches by the audit writer thread, see audit.py.
+    """
+    __tablename__ = 'audit_log'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(20), nullable=False, default='read')
+    resource_type = db.Column(db.String(20), nullable=False)  # client or program
+    resource_id = db.Column(db.Integer)
+    endpoint = db.Column(db.String(100))
+    ip_address = db.Column(db.String(45))
+    accessed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # Audits are looked up by the record that was read or by who read it
+    __table_args__ = (
+        db.Index('ix_audit_log_resource', 'resource_type', 'resource_id', 'accessed_at'),
+        db.Index('ix_audit_log_user', 'user_id', 'accessed_at'),
+    )
+
+    def __repr__(self):
+        return f'<AuditLog user_id={self.user_id} {self.resource_type}={self.resource_id}>'
+
+class OutboxEvent(db.Model):
+    """
+    A change to a client or enrollment, written in the same transaction as
+    the change and delivered to webhooks and event streams, see outbox.py
+    """
+    __tablename__ = 'outbox_event'
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(30), nullable=False)  # e.g. client.created, enrollment.updated
+    resource_id = db.Column(db.Integer, nullable=False)
+    facility_id = db.Column(db.Integer)
+    payload = db.Column(db.JSON)  # IDs and status only; consumers fetch the record itself through the API
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # Consumers read the events after the last one they saw, most of them for one facility
+    __table_args__ = (
+        db.Index('ix_outbox_event_facility', 'facility_id', 'id'),
+        db.Index('ix_outbox_event_created_at', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} {self.event_type} {self.resource_id}>'
+
+class Webhook(db.Model):
+    """An endpoint that outbox events are POSTed to in batches by `flask outbox dispatch`"""
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), nullable=False)
+    secret = db.Column(db.String(64), nullable=False)  # Signs each delivery, see outbox.sign
+    event_types = db.Column(db.JSON)  # None: every event type
+    facility_id = db.Column(db.Integer)  # None: every facility
+    is_active = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
+    # Delivery state: the last event delivered and the backoff after failed deliveries
+    last_event_id = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    failures = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_attempt_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+
+    def __repr__(self):
+        return f'<Webhook {self.id} {self.url}>'
+
+class IdempotencyKey(db.Model):
+    """
+    Response to a POST sent with an Idempotency-Key header, replayed to
+    retries of the same request until it expires, see idempotency.py
+    """
+    __tablename__ = 'idempotency_key'
+    id = db.Column(db.String(64), primary_key=True)  # SHA-256 of the user, endpoint and key
+    fingerprint = db.Column(db.String(64), nullable=False)  # SHA-256 of the request, to catch reused keys
+    status_code = db.Column(db.Integer)  # None while the first request is still running
+    response = db.Column(db.JSON)
+    response_headers = db.Column(db.JSON)
+    locked_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.id[:12]} {self.status_code}>'
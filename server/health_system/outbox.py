@@ -0,0 +1,275 @@
+from flask import current_app
+from models import db, Client, Enrollment, OutboxEvent, Webhook
+from db_routing import RoutingSession
+from sqlalchemy import event, inspect, insert, select, delete, func
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import chain
+import click
+import hashlib
+import hmac
+import json
+import time
+import urllib.error
+import urllib.request
+
+# Models whose changes are published, with the event name and the fields
+# each event carries. Events hold IDs, never patient details: consumers
+# fetch the record through the API, where access is checked and audited.
+PUBLISHED = {
+    Client: ('client', ('id',)),
+    Enrollment: ('enrollment', ('id', 'client_id', 'program_id', 'status')),
+}
+ACTIONS = ('created', 'updated', 'deleted')
+EVENT_TYPES = tuple(f'{name}.{action}' for name, _ in PUBLISHED.values() for action in ACTIONS)
+
+
+def record_events(model, action, rows, session=None):
+    """
+    Add events for changed rows (objects or result rows) to the current
+    transaction, so they commit or roll back together with the change.
+    The flush hook below covers objects changed through the session; bulk
+    statements call this themselves. Does nothing for unpublished models.
+    """
+    if model not in PUBLISHED or not rows:
+        return
+    name, fields = PUBLISHED[model]
+    now = datetime.utcnow()
+    (session or db.session).execute(insert(OutboxEvent), [{
+        'event_type': f'{name}.{action}',
+        'resource_id': row.id,
+        'facility_id': row.facility_id,
+        'payload': {field: getattr(row, field) for field in fields},
+        'created_at': now
+    } for row in rows])
+
+
+def _flushed_action(session, obj):
+    if obj in session.new:
+        return 'created'
+    if obj in session.deleted:
+        return 'deleted'
+    if not session.is_modified(obj, include_collections=False):
+        return None
+    # Soft deletes are updates setting deleted_at
+    added = inspect(obj).attrs.deleted_at.history.added
+    return 'deleted' if added and added[0] is not None else 'updated'
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _record_flushed_changes(session, flush_context):
+    changes = defaultdict(list)
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if type(obj) in PUBLISHED:
+            action = _flushed_action(session, obj)
+            if action:
+                changes[type(obj), action].append(obj)
+    for (model, action), objects in changes.items():
+        record_events(model, action, objects, session)
+
+
+def settled_before(now=None):
+    """
+    Events are read in ID order, but a transaction that got a lower ID can
+    commit after one with a higher ID. Only reading events older than
+    OUTBOX_SETTLE_SECONDS keeps consumers from skipping past those.
+    """
+    return (now or datetime.utcnow()) - timedelta(seconds=current_app.config['OUTBOX_SETTLE_SECONDS'])
+
+
+def events_after(last_event_id, facility_id=None, event_types=None, limit=100, now=None):
+    """Settled events after last_event_id in ID order, optionally of one facility and some event types"""
+    query = select(OutboxEvent).where(
+        OutboxEvent.id > last_event_id,
+        OutboxEvent.created_at <= settled_before(now)
+    )
+    if facility_id is not None:
+        query = query.where(OutboxEvent.facility_id == facility_id)
+    if event_types:
+        query = query.where(OutboxEvent.event_type.in_(event_types))
+    return db.session.scalars(query.order_by(OutboxEvent.id).limit(limit)).all()
+
+
+def latest_event_id():
+    return db.session.scalar(select(func.max(OutboxEvent.id))) or 0
+
+
+def event_to_dict(outbox_event):
+    return {
+        'id': outbox_event.id,
+        'type': outbox_event.event_type,
+        'resource_id': outbox_event.resource_id,
+        'facility_id': outbox_event.facility_id,
+        'data': outbox_event.payload,
+        'created_at': outbox_event.created_at.isoformat()
+    }
+
+
+def sign(secret, body):
+    """X-AfyaLink-Signature header value: HMAC-SHA256 of the request body with the webhook's secret"""
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+def deliver(webhook, events):
+    """POST a batch of events to a webhook; raises on connection errors, timeouts and non-2xx responses"""
+    body = json.dumps({'webhook_id': webhook.id, 'events': [event_to_dict(e) for e in events]}).encode('utf-8')
+    request = urllib.request.Request(webhook.url, data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'User-Agent': 'AfyaLink-Webhooks',
+        'X-AfyaLink-Signature': sign(webhook.secret, body)
+    })
+    with urllib.request.urlopen(request, timeout=current_app.config['WEBHOOK_TIMEOUT_SECONDS']) as response:
+        response.read()
+
+
+def _deliver_next_batch(webhook, upper, batch_size, now):
+    """Deliver one batch to a webhook and move its cursor; returns the number of events delivered"""
+    events = events_after(webhook.last_event_id, webhook.facility_id, webhook.event_types, batch_size, now)
+    if not events:
+        # Nothing it subscribes to up to upper; don't scan those events again
+        webhook.last_event_id = max(webhook.last_event_id, upper)
+        return 0
+    try:
+        deliver(webhook, events)
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        # HTTPError is a URLError and timeouts are OSErrors. Retry the same
+        # batch later, backing off exponentially
+        webhook.failures += 1
+        delay = min(
+            current_app.config['WEBHOOK_RETRY_BACKOFF_SECONDS'] * 2 ** (webhook.failures - 1),
+            current_app.config['WEBHOOK_MAX_BACKOFF_SECONDS']
+        )
+        webhook.next_attempt_at = now + timedelta(seconds=delay)
+        webhook.last_error = str(e)[:500]
+        current_app.logger.warning('Webhook %s delivery failed (%s attempts): %s', webhook.id, webhook.failures, e)
+        return 0
+    webhook.last_event_id = events[-1].id
+    webhook.failures = 0
+    webhook.next_attempt_at = None
+    webhook.last_error = None
+    return len(events)
+
+
+def dispatch_webhooks(batch_size=100, now=None):
+    """
+    One pass over the active webhooks that aren't backing off, delivering
+    at most one batch to each so a busy or slow endpoint can't hold up the
+    others. Returns (events delivered, whether any webhook has more waiting).
+    """
+    now = now or datetime.utcnow()
+    upper = db.session.scalar(
+        select(func.max(OutboxEvent.id)).where(OutboxEvent.created_at <= settled_before(now))
+    ) or 0
+    webhooks = db.session.scalars(
+        select(Webhook).where(
+            Webhook.is_active.is_(True),
+            Webhook.last_event_id < upper,
+            (Webhook.next_attempt_at.is_(None)) | (Webhook.next_attempt_at <= now)
+        ).order_by(Webhook.id)
+    ).all()
+
+    delivered, more = 0, False
+    for webhook in webhooks:
+        sent = _deliver_next_batch(webhook, upper, batch_size, now)
+        # Committed per webhook, so a crash doesn't deliver the others' batches twice
+        db.session.commit()
+        delivered += sent
+        more = more or sent == batch_size
+    return delivered, more
+
+
+def purge_events(days, now=None):
+    """Delete events older than days; returns how many were deleted"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+    deleted = db.session.execute(delete(OutboxEvent).where(OutboxEvent.created_at < cutoff)).rowcount
+    db.session.commit()
+    return deleted
+
+
+def event_stream(last_event_id, facility_id=None, event_types=None):
+    """
+    Server-Sent Events for events after last_event_id. Polls the outbox
+    every EVENT_STREAM_POLL_SECONDS and ends after EVENT_STREAM_MAX_SECONDS;
+    browsers reconnect on their own and send the last ID they received as
+    Last-Event-ID. A stream occupies one gunicorn worker thread while it is
+    open, so EVENT_STREAM_MAX_SECONDS is kept below the gunicorn timeout.
+    """
+    config = current_app.config
+    poll_interval = config['EVENT_STREAM_POLL_SECONDS']
+    yield f"retry: {int(poll_interval * 1000)}\n\n"
+
+    started = last_sent = time.monotonic()
+    while time.monotonic() - started < config['EVENT_STREAM_MAX_SECONDS']:
+        events = events_after(last_event_id, facility_id, event_types, config['EVENT_STREAM_BATCH_SIZE'])
+        # Don't keep a transaction (and on SQLite a read snapshot) open while waiting
+        db.session.close()
+        for outbox_event in events:
+            last_event_id = outbox_event.id
+            yield (
+                f"id: {outbox_event.id}\n"
+                f"event: {outbox_event.event_type}\n"
+                f"data: {json.dumps(event_to_dict(outbox_event))}\n\n"
+            )
+        if events:
+            last_sent = time.monotonic()
+            if len(events) == config['EVENT_STREAM_BATCH_SIZE']:
+                continue
+        elif time.monotonic() - last_sent >= config['EVENT_STREAM_HEARTBEAT_SECONDS']:
+            # Comment line that keeps proxies from closing an idle connection
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+        time.sleep(poll_interval)
+
+
+def init_outbox(app):
+    app.config.setdefault('OUTBOX_SETTLE_SECONDS', 2)
+    app.config.setdefault('OUTBOX_RETENTION_DAYS', 7)
+    app.config.setdefault('WEBHOOK_BATCH_SIZE', 100)
+    app.config.setdefault('WEBHOOK_TIMEOUT_SECONDS', 10)
+    app.config.setdefault('WEBHOOK_RETRY_BACKOFF_SECONDS', 10)
+    app.config.setdefault('WEBHOOK_MAX_BACKOFF_SECONDS', 3600)
+    app.config.setdefault('EVENT_STREAM_POLL_SECONDS', 1)
+    app.config.setdefault('EVENT_STREAM_BATCH_SIZE', 100)
+    app.config.setdefault('EVENT_STREAM_HEARTBEAT_SECONDS', 15)
+    # Below gunicorn's 30 second timeout (GUNICORN_TIMEOUT)
+    app.config.setdefault('EVENT_STREAM_MAX_SECONDS', 25)
+
+    @app.cli.group('outbox')
+    def outbox_group():
+        """Deliver client and enrollment change events"""
+
+    @outbox_group.command('dispatch')
+    @click.option('--poll-interval', type=float, default=1.0, help='Seconds to wait when no webhook has events waiting')
+    @click.option('--once', is_flag=True, help='Deliver what is waiting and exit')
+    def dispatch_command(poll_interval, once):
+        """Deliver events to the registered webhooks until interrupted"""
+        batch_size = app.config['WEBHOOK_BATCH_SIZE']
+        purged_at = 0
+        click.echo("Webhook dispatcher started")
+        try:
+            while True:
+                more = False
+                with app.app_context():
+                    try:
+                        if time.monotonic() - purged_at >= 3600:
+                            purge_events(app.config['OUTBOX_RETENTION_DAYS'])
+                            purged_at = time.monotonic()
+                        delivered, more = dispatch_webhooks(batch_size)
+                        if delivered:
+                            click.echo(f"Delivered {delivered} events")
+                    except Exception:
+                        db.session.rollback()
+                        app.logger.exception('Webhook dispatcher error')
+                if once and not more:
+                    break
+                if not more:
+                    time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
+
+    @outbox_group.command('purge')
+    @click.option('--days', type=int, default=None, help='Delete events older than this (default OUTBOX_RETENTION_DAYS)')
+    def purge_command(days):
+        """Delete old events"""
+        deleted = purge_events(days if days is not None else app.config['OUTBOX_RETENTION_DAYS'])
+        click.echo(f"Deleted {deleted} events")
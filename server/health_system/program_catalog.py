@@ -0,0 +1,149 @@
+from flask import current_app
+from models import db, Program, Enrollment
+from db_routing import RoutingSession
+from tenancy import current_facility_id, facility_scope
+from sqlalchemy import event, select, func
+from collections import namedtuple
+from itertools import chain
+from types import MappingProxyType
+import threading
+import time
+
+# A live program as held by the catalog; read-only, with the attributes
+# serializers use on Program objects
+CatalogProgram = namedtuple('CatalogProgram', [
+    'id', 'name', 'description', 'duration', 'facility_id', 'created_by', 'created_at', 'version'
+])
+
+
+class ProgramSnapshot:
+    """Every live program at one point in time, indexed by ID and by (facility_id, name). Never changed once built."""
+
+    def __init__(self, programs, fingerprint):
+        self.by_id = MappingProxyType({p.id: p for p in programs})
+        self.by_name = MappingProxyType({(p.facility_id, p.name): p for p in programs})
+        self.fingerprint = fingerprint
+
+
+def _fingerprint():
+    """
+    Changes whenever a program is added, updated or deleted: updates bump
+    the version, inserts raise the highest ID and deletes lower the count
+    """
+    return tuple(db.session.execute(
+        select(func.count(Program.id), func.max(Program.id), func.sum(Program.version)),
+        # Replicas may lag behind the change we are looking for
+        bind_arguments={'bind': db.engine}
+    ).one())
+
+
+class ProgramCatalog:
+    """
+    Per-process, in-memory copy of the program table. Programs are few and
+    read on every enrollment and client profile, so they are looked up here
+    instead of being queried or joined.
+
+    Readers get the current snapshot without locking; a reload builds a new
+    snapshot and swaps it in whole. Commits in this process that touch
+    programs reload it on the next read. Changes made by other processes are
+    noticed by comparing a fingerprint of the table, at most every
+    PROGRAM_CATALOG_CHECK_SECONDS.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._checked_at = 0
+        self._stale = False
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._stale = True
+
+    def _load(self, fingerprint):
+        programs = db.session.execute(
+            select(*[getattr(Program, field) for field in CatalogProgram._fields])
+            .where(Program.deleted_at.is_(None))
+            .order_by(Program.id),
+            bind_arguments={'bind': db.engine}
+        ).all()
+        return ProgramSnapshot([CatalogProgram(*row) for row in programs], fingerprint)
+
+    def snapshot(self, check=False):
+        """
+        The current snapshot. check=True compares the fingerprint now
+        instead of waiting for the check interval, e.g. after a lookup missed.
+        """
+        current = self._snapshot
+        if current is not None and not check and not self._stale \
+                and time.monotonic() - self._checked_at < current_app.config['PROGRAM_CATALOG_CHECK_SECONDS']:
+            return current
+
+        with self._lock:
+            # Another thread may have reloaded while this one waited
+            if self._snapshot is not current:
+                return self._snapshot
+            self._stale = False
+            # All facilities, whoever's request triggers the reload
+            with facility_scope(None):
+                fingerprint = _fingerprint()
+                if current is None or fingerprint != current.fingerprint:
+                    self._snapshot = self._load(fingerprint)
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def get(self, program_id):
+        """A live program of the current user's facility, or None"""
+        program = self.snapshot().by_id.get(program_id)
+        if program is None:
+            # Possibly created by another process since the last check
+            program = self.snapshot(check=True).by_id.get(program_id)
+        facility_id = current_facility_id()
+        if program is None or (facility_id is not None and program.facility_id != facility_id):
+            return None
+        return program
+
+    def get_by_name(self, name, facility_id=None):
+        """A live program by name in a facility (default: the current user's), or None"""
+        if facility_id is None:
+            facility_id = current_facility_id()
+        return self.snapshot().by_name.get((facility_id, name))
+
+    def all(self):
+        """Live programs of the current user's facility (every facility for admins), by ID"""
+        facility_id = current_facility_id()
+        return [p for p in self.snapshot().by_id.values() if facility_id is None or p.facility_id == facility_id]
+
+    def enrollments_with_programs(self, client_ids):
+        """
+        (enrollment, program) for the clients' live enrollments in live
+        programs, reading only the enrollment table
+        """
+        enrollments = Enrollment.live().filter(Enrollment.client_id.in_(client_ids)).all()
+        programs = self.snapshot().by_id
+        return [(e, programs[e.program_id]) for e in enrollments if e.program_id in programs]
+
+
+program_catalog = ProgramCatalog()
+
+
+def init_program_catalog(app):
+    app.config.setdefault('PROGRAM_CATALOG_CHECK_SECONDS', 5)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_changed_on_flush(session, flush_context):
+    if any(isinstance(obj, Program) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info['programs_changed'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_changed_on_bulk_write(orm_execute_state):
+    if (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete) \
+            and orm_execute_state.bind_mapper is not None and orm_execute_state.bind_mapper.class_ is Program:
+        orm_execute_state.session.info['programs_changed'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('programs_changed', False):
+        program_catalog.invalidate()
@@ -0,0 +1,124 @@
+from flask import request, current_app
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from functools import wraps
+import math
+import threading
+import time
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600}
+
+
+def parse_limit(limit):
+    """'120/minute' -> (refill rate in tokens per second, bucket capacity)"""
+    count, period = limit.split('/')
+    count = int(count)
+    return count / PERIODS[period.strip()], count
+
+
+class MemoryTokenBucketStore:
+    """Token buckets kept in this process; each worker limits on its own"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity, cost=1):
+        """Take cost tokens; returns (allowed, seconds until enough tokens are available)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return True, 0
+            self._buckets[key] = (tokens, now)
+            return False, (cost - tokens) / rate
+
+
+class RedisTokenBucketStore:
+    """Token buckets shared by every worker through Redis"""
+
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local cost = tonumber(ARGV[4])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated_at = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated_at) * rate)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self.redis = redis.Redis.from_url(url)
+        self.script = self.redis.register_script(self.SCRIPT)
+
+    def take(self, key, rate, capacity, cost=1):
+        allowed, tokens = self.script(keys=[f'ratelimit:{key}'], args=[capacity, rate, time.time(), cost])
+        if allowed:
+            return True, 0
+        return False, (cost - float(tokens)) / rate
+
+
+class RateLimiter:
+    """
+    Per-user, per-route rate limits. The quota depends on the role claim in
+    the access token (RATE_LIMITS maps roles to limits like '120/minute').
+    """
+
+    def __init__(self, app=None):
+        self.store = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATE_LIMIT_ENABLED', True)
+        app.config.setdefault('RATE_LIMIT_STORAGE_URL', None)
+        app.config.setdefault('RATE_LIMITS', {})
+        app.config.setdefault('RATE_LIMIT_DEFAULT', '60/minute')
+
+        self.limits = {role: parse_limit(limit) for role, limit in app.config['RATE_LIMITS'].items()}
+        self.default_limit = parse_limit(app.config['RATE_LIMIT_DEFAULT'])
+        url = app.config['RATE_LIMIT_STORAGE_URL']
+        self.store = RedisTokenBucketStore(url) if url else MemoryTokenBucketStore()
+        app.extensions['rate_limiter'] = self
+
+    def check(self, cost=1):
+        """Returns (allowed, retry_after) for the current user and route"""
+        role = get_jwt().get('role')
+        rate, capacity = self.limits.get(role, self.default_limit)
+        key = f'{get_jwt_identity()}:{request.endpoint}'
+        return self.store.take(key, rate, capacity, cost)
+
+
+rate_limiter = RateLimiter()
+
+
+def rate_limited(f=None, cost=1):
+    """
+    Reject the request with 429 when the user has used up their quota for
+    this route. Must be applied inside @jwt_required().
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if current_app.config['RATE_LIMIT_ENABLED']:
+                allowed, retry_after = rate_limiter.check(cost)
+                if not allowed:
+                    return {'error': 'Rate limit exceeded'}, 429, {'Retry-After': str(math.ceil(retry_after))}
+            return f(*args, **kwargs)
+        return decorated
+
+    if f is not None:
+        return decorator(f)
+    return decorator
@@ -0,0 +1,18 @@
+from routes.base import api
+
+# Importing the routes modules registers their resources on the shared Api
+from routes import (  # noqa: F401
+    system_user_routes,
+    program_routes,
+    client_routes,
+    enrollment_routes,
+    job_routes,
+    export_routes,
+    metrics_routes,
+    audit_routes,
+    event_routes,
+)
+
+
+def init_routes(app):
+    api.init_app(app)
@@ -0,0 +1,67 @@
+from routes.base import api, BaseResource, role_required
+from routes.schemas import audit_log_query_schema
+from models import AuditLog
+from flask_jwt_extended import jwt_required
+
+def audit_log_to_dict(entry):
+    return {
+        'id': entry.id,
+        'user_id': entry.user_id,
+        'action': entry.action,
+        'resource_type': entry.resource_type,
+        'resource_id': entry.resource_id,
+        'endpoint': entry.endpoint,
+        'ip_address': entry.ip_address,
+        'accessed_at': entry.accessed_at.isoformat()
+    }
+
+class AuditLogResource(BaseResource):
+    @jwt_required()
+    @role_required('admin')
+    def get(self):
+        """
+        Who read which client or program records, newest first (admins only)
+        Records appear within AUDIT_FLUSH_INTERVAL seconds of the read.
+        Query parameters:
+        - client_id: Reads of this client
+        - program_id: Reads of this program
+        - user_id: Reads by this user
+        - start: Only reads from this date (DD/MM/YYYY)
+        - end: Only reads before this date (DD/MM/YYYY)
+        - page: Page number (default: 1)
+        - per_page: Items per page (default: 50, at most 500)
+        """
+        try:
+            args, error = self.parse(audit_log_query_schema, location='args')
+            if error:
+                return error
+            if args['client_id'] is not None and args['program_id'] is not None:
+                return self.error_response("Filter by client_id or program_id, not both")
+
+            query = AuditLog.query
+            if args['client_id'] is not None:
+                query = query.filter_by(resource_type='client', resource_id=args['client_id'])
+            if args['program_id'] is not None:
+                query = query.filter_by(resource_type='program', resource_id=args['program_id'])
+            if args['user_id'] is not None:
+                query = query.filter_by(user_id=args['user_id'])
+            if args['start']:
+                query = query.filter(AuditLog.accessed_at >= args['start'])
+            if args['end']:
+                query = query.filter(AuditLog.accessed_at < args['end'])
+
+            entries = query.order_by(AuditLog.accessed_at.desc(), AuditLog.id.desc()).paginate(
+                page=args['page'], per_page=args['per_page'], error_out=False
+            )
+
+            return self.success_response({
+                'items': [audit_log_to_dict(e) for e in entries.items],
+                'total': entries.total,
+                'pages': entries.pages,
+                'current_page': entries.page
+            })
+        except Exception as e:
+            return self.error_response(str(e), 500)
+
+# Register routes on the shared Api
+api.add_resource(AuditLogResource, '/api/audit')
@@ -0,0 +1,53 @@
+from flask import request
+from flask_restful import Resource, Api
+from flask_jwt_extended import get_jwt
+from functools import wraps
+from marshmallow import ValidationError
+
+# The one Api every routes module registers its resources on
+api = Api()
+
+
+class BaseResource(Resource):
+    """
+    Response helpers shared by every resource. Request bodies and query
+    strings are validated with schemas built once at import, see schemas.py.
+    """
+
+    def error_response(self, message, status_code=400, **extra):
+        return {'error': message, **extra}, status_code
+
+    def success_response(self, data, message="Success", status_code=200, headers=None):
+        return {
+            'message': message,
+            'data': data
+        }, status_code, headers or {}
+
+    def parse(self, schema, location='json', partial=False):
+        """
+        Validate the JSON body (or the query string with location='args').
+        With partial=True only the fields that were sent are validated, for PATCH.
+        Returns (data, None), or (None, error response) when the request is invalid.
+        """
+        if location == 'args':
+            source = request.args
+        else:
+            source = request.get_json(silent=True)
+            if source is None:
+                source = {}
+        try:
+            return schema.load(source, partial=partial), None
+        except ValidationError as e:
+            return None, self.error_response("Invalid request data", 400, errors=e.messages)
+
+
+def role_required(*roles):
+    """Reject users whose role claim is not one of roles. Must be applied inside @jwt_required()."""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if get_jwt().get('role') not in roles:
+                return {'error': "You are not allowed to do this"}, 403
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
@@ -1,31 +1,41 @@
-from flask import request
-from flask_restful import Resource, Api, reqparse
-from models import db, Client, Program, Enrollment
+from flask import request, current_app
+from routes.base import api, BaseResource
+from routes.schemas import client_schema, client_search_schema
+from models import db, Client, Program
 from datetime import datetime
 from sqlalchemy.exc import IntegrityError
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from db_routing import read_replica
+from jobs import enqueue
+from client_search import client_search_query, count_clients
+from dedup import find_duplicates, blocking_keys, changed_blocking_keys
+from rate_limit import rate_limited
+from single_flight import single_flight
+from audit import audit_log, audited
+from versioning import etag, if_match_versions, versioned_update, update_failure
+from program_catalog import program_catalog
+from idempotency import idempotent
 
-class ClientResource(Resource):
-    def __init__(self):
-        self.parser = reqparse.RequestParser()
-        self.parser.add_argument('first_name', type=str, required=True, help='First name is required')
-        self.parser.add_argument('last_name', type=str, required=True, help='Last name is required')
-        self.parser.add_argument('date_of_birth', type=str, required=True, help='Date of birth is required (DD/MM/YYYY)')
-        self.parser.add_argument('gender', type=str, required=True, help='Gender is required')
-        self.parser.add_argument('contact_number', type=str, required=False)
-        self.parser.add_argument('email', type=str, required=False)
-        self.parser.add_argument('address', type=str, required=False)
-
-    def error_response(self, message, status_code=400):
-        return {'error': message}, status_code
-
-    def success_response(self, data, message="Success", status_code=200):
-        return {
-            'message': message,
-            'data': data
-        }, status_code
+def client_to_dict(client):
+    """Client fields returned after an update; client may be a model or a row"""
+    return {
+        'id': client.id,
+        'first_name': client.first_name,
+        'last_name': client.last_name,
+        'date_of_birth': client.date_of_birth.strftime('%d/%m/%Y'),
+        'gender': client.gender,
+        'contact_number': client.contact_number,
+        'email': client.email,
+        'address': client.address,
+        'created_by': client.created_by,
+        'created_at': client.created_at.isoformat() if client.created_at else None
+    }
 
+class ClientResource(BaseResource):
+    @read_replica
     @jwt_required()
+    @audited('client', lists=True)
+    @single_flight
     def get(self, client_id=None):
         """
         Get client details
@@ -35,13 +45,12 @@ class ClientResource(Resource):
         try:
             if client_id is not None:
                 # Get specific client
-                client = Client.query.get(client_id)
+                client = Client.get_live(client_id)
                 if not client:
                     return self.error_response("Client not found", 404)
 
-                # Get client's enrollments with program details
-                enrollments = Enrollment.query.filter_by(client_id=client_id).all()
-                programs = [Program.query.get(e.program_id) for e in enrollments]
+                # Get client's enrollments, with programs from the catalog
+                programs = [p for _, p in program_catalog.enrollments_with_programs([client_id])]
 
                 # Format client data
                 client_data = {
@@ -67,11 +76,12 @@ class ClientResource(Resource):
 
                 return self.success_response(
                     client_data,
-                    "Client details retrieved successfully"
+                    "Client details retrieved successfully",
+                    headers={'ETag': etag(client.version)}
                 )
             else:
                 # Get all clients
-                clients = Client.query.all()
+                clients = Client.live().all()
                 clients_list = [{
                     'id': client.id,
                     'first_name': client.first_name,
@@ -93,6 +103,7 @@ class ClientResource(Resource):
             return self.error_response(str(e), 500)
 
     @jwt_required()
+    @idempotent
     def post(self):
         """
         Register a new client
@@ -106,19 +117,21 @@ class ClientResource(Resource):
             "email": "john@example.com",
             "address": "123 Main St"
         }
+        Query parameters:
+        - check_duplicates: If "true", the client is not registered when likely
+          duplicates exist; they are returned with a 409 instead
+        Send an Idempotency-Key header to safely retry: a retry gets the first
+        response back instead of registering the client twice
         """
         try:
             # Get the current user's ID
             current_user_id = int(get_jwt_identity())
             
             # Parse and validate the request data
-            args = self.parser.parse_args()
-            
-            # Convert date string to date object
-            try:
-                date_of_birth = datetime.strptime(args['date_of_birth'], '%d/%m/%Y').date()
-            except ValueError:
-                return self.error_response("Invalid date format. Use DD/MM/YYYY")
+            args, error = self.parse(client_schema)
+            if error:
+                return error
+            date_of_birth = args['date_of_birth']
             
             # Create new client
             client = Client(
@@ -131,9 +144,25 @@ class ClientResource(Resource):
                 address=args.get('address'),
                 created_by=current_user_id
             )
+
+            if request.args.get('check_duplicates', '').lower() == 'true':
+                duplicates = find_duplicates(client)
+                if duplicates:
+                    return {
+                        'error': "Possible duplicate clients found",
+                        'duplicates': [{
+                            'id': c.id,
+                            'first_name': c.first_name,
+                            'last_name': c.last_name,
+                            'date_of_birth': c.date_of_birth.strftime('%d/%m/%Y'),
+                            'contact_number': c.contact_number,
+                            'score': score
+                        } for score, c in duplicates]
+                    }, 409
             
             db.session.add(client)
-            db.session.commit()
+            # Committed by @idempotent, together with the response
+            db.session.flush()
             
             # Convert client object to dictionary
             client_dict = {
@@ -152,7 +181,8 @@ class ClientResource(Resource):
             return self.success_response(
                 client_dict,
                 "Client registered successfully",
-                201
+                201,
+                {'ETag': etag(client.version)}
             )
         except Exception as e:
             db.session.rollback()
@@ -162,6 +192,8 @@ class ClientResource(Resource):
     def put(self, client_id):
         """
         Update client details
+        Send the ETag of the client in an If-Match header to only update it if
+        nobody has changed it since; 412 means someone did
         Expected JSON body:
         {
             "first_name": "John",
@@ -174,51 +206,68 @@ class ClientResource(Resource):
         }
         """
         try:
-            # Get the current user's ID
-            current_user_id = int(get_jwt_identity())
-            
-            # Find the client
-            client = Client.query.get(client_id)
-            if not client:
-                return self.error_response("Client not found", 404)
-            
             # Parse and validate the request data
-            args = self.parser.parse_args()
-            
-            # Convert date string to date object
-            try:
-                date_of_birth = datetime.strptime(args['date_of_birth'], '%d/%m/%Y').date()
-            except ValueError:
-                return self.error_response("Invalid date format. Use DD/MM/YYYY")
-            
-            # Update client details
-            client.first_name = args['first_name']
-            client.last_name = args['last_name']
-            client.date_of_birth = date_of_birth
-            client.gender = args['gender']
-            client.contact_number = args.get('contact_number')
-            client.email = args.get('email')
-            client.address = args.get('address')
-            
-            db.session.commit()
-            
-            # Format response
-            client_dict = {
-                'id': client.id,
-                'first_name': client.first_name,
-                'last_name': client.last_name,
-                'date_of_birth': client.date_of_birth.strftime('%d/%m/%Y'),
-                'gender': client.gender,
-                'contact_number': client.contact_number,
-                'email': client.email,
-                'address': client.address,
-                'created_by': client.created_by,
-                'created_at': client.created_at.isoformat() if client.created_at else None
+            args, error = self.parse(client_schema)
+            if error:
+                return error
+
+            # Update client details in one statement, checking the version
+            # instead of loading the client first
+            values = {
+                'first_name': args['first_name'],
+                'last_name': args['last_name'],
+                'date_of_birth': args['date_of_birth'],
+                'gender': args['gender'],
+                'contact_number': args.get('contact_number'),
+                'email': args.get('email'),
+                'address': args.get('address'),
+                **blocking_keys(args['first_name'], args['last_name'], args['date_of_birth'], args.get('contact_number'))
             }
-            
+            client = versioned_update(Client, values, if_match_versions(), id=client_id)
+            if client is None:
+                db.session.rollback()
+                return self.error_response(*update_failure(Client, id=client_id))
+
+            db.session.commit()
+
             return self.success_response(
-                client_dict,
-                "Client details updated successfully"
+                client_to_dict(client),
+                "Client details updated successfully",
+                headers={'ETag': etag(client.version)}
+            )
+        except Exception as e:
+            db.session.rollback()
+            return self.error_response(str(e), 500)
+
+    @jwt_required()
+    def patch(self, client_id):
+        """
+        Change some of a client's details; only the fields sent are validated
+        and written. If-Match works as for PUT
+        Example JSON body:
+        {
+            "contact_number": "0712345678"
+        }
+        """
+        try:
+            args, error = self.parse(client_schema, partial=True)
+            if error:
+                return error
+            if not args:
+                return self.error_response("No fields to update")
+
+            values = {**args, **changed_blocking_keys(args)}
+            client = versioned_update(Client, values, if_match_versions(), id=client_id)
+            if client is None:
+                db.session.rollback()
+                return self.error_response(*update_failure(Client, id=client_id))
+
+            db.session.commit()
+
+            return self.success_response(
+                client_to_dict(client),
+                "Client details updated successfully",
+                headers={'ETag': etag(client.version)}
             )
         except Exception as e:
             db.session.rollback()
@@ -236,15 +285,13 @@ class ClientResource(Resource):
             current_user_id = int(get_jwt_identity())
             
             # Find the client
-            client = Client.query.get(client_id)
+            client = Client.get_live(client_id)
             if not client:
                 return self.error_response("Client not found", 404)
             
-            # Delete all enrollments first (due to foreign key constraints)
-            Enrollment.query.filter_by(client_id=client_id).delete()
-            
-            # Delete the client
-            db.session.delete(client)
+            # Soft delete the client; its enrollments are hidden with it and
+            # both are moved to the archive tables later by the archiver
+            client.deleted_at = datetime.utcnow()
             db.session.commit()
             
             return self.success_response(
@@ -256,89 +303,92 @@ class ClientResource(Resource):
             db.session.rollback()
             return self.error_response(str(e), 500)
 
-class ClientSearchResource(Resource):
-    def __init__(self):
-        self.parser = reqparse.RequestParser()
-        self.parser.add_argument('query', type=str, required=False, default='', location='args')
-        self.parser.add_argument('page', type=int, required=False, default=1, location='args')
-        self.parser.add_argument('per_page', type=int, required=False, default=10, location='args')
-
-    def error_response(self, message, status_code=400):
-        return {'error': message}, status_code
-
-    def success_response(self, data, message="Success", status_code=200):
-        return {
-            'message': message,
-            'data': data
-        }, status_code
-
+class ClientSearchResource(BaseResource):
+    @read_replica
     @jwt_required()
+    @rate_limited
+    @audited('client', lists=True)
     def get(self):
         """
-        Search for clients by name or other criteria
+        Search for clients by name and demographics, e.g. females aged 15-24
+        not enrolled in program 3:
+        /api/clients/search?gender=Female&min_age=15&max_age=24&not_enrolled_in=3
         Query parameters:
-        - query: Search term
+        - query: Part of the first or last name
+        - gender: Gender as registered
+        - min_age, max_age: Age range in years, inclusive
+        - enrolled_in: Only clients enrolled in this program
+        - not_enrolled_in: Only clients not enrolled in this program
+        - status: Only clients with an enrollment (in enrolled_in, if given) in this status
+        - created_by: Only clients registered by this user
+        - after: next_cursor of the previous page; pages by ID without counting
+          or skipping rows, and ignores page
         - page: Page number (default: 1)
         - per_page: Items per page (default: 10)
+        - count: "estimate" (default) for an approximate total, "exact" to
+          count every match; total_is_exact tells which one was returned
         """
         try:
             # Parse and validate the request data
-            args = self.parser.parse_args()
-            
-            clients = Client.query.filter(
-                (Client.first_name.ilike(f'%{args["query"]}%')) |
-                (Client.last_name.ilike(f'%{args["query"]}%'))
-            ).paginate(page=args['page'], per_page=args['per_page'])
-            
-            # Format the response with the new date format
-            formatted_clients = []
-            for client in clients.items:
-                client_dict = {
-                    'id': client.id,
-                    'first_name': client.first_name,
-                    'last_name': client.last_name,
-                    'date_of_birth': client.date_of_birth.strftime('%d/%m/%Y'),
-                    'gender': client.gender,
-                    'contact_number': client.contact_number,
-                    'email': client.email,
-                    'address': client.address,
-                    'created_by': client.created_by,
-                    'created_at': client.created_at.isoformat() if client.created_at else None
-                }
-                formatted_clients.append(client_dict)
-            
+            args, error = self.parse(client_search_schema, location='args')
+            if error:
+                return error
+
+            query = client_search_query(args)
+            per_page = args['per_page']
+            if args['after'] is not None:
+                clients = query.limit(per_page + 1).all()
+                has_next = len(clients) > per_page
+                clients = clients[:per_page]
+                return self.success_response({
+                    'items': [client_to_dict(c) for c in clients],
+                    'has_next': has_next,
+                    'next_cursor': clients[-1].id if has_next else None
+                })
+
+            # One row more than the page tells whether there is a next page
+            # without counting every match
+            offset = (args['page'] - 1) * per_page
+            clients = query.offset(offset).limit(per_page + 1).all()
+            has_next = len(clients) > per_page
+            clients = clients[:per_page]
+
+            if not has_next and (clients or offset == 0):
+                # Last page: the total is known exactly
+                total, exact = offset + len(clients), True
+            else:
+                total, exact = count_clients(query, args, args['count'])
+                if clients:
+                    # An estimate can't be below the matches already seen
+                    total = max(total, offset + len(clients) + has_next)
+
             return self.success_response({
-                'items': formatted_clients,
-                'total': clients.total,
-                'pages': clients.pages,
-                'current_page': clients.page
+                'items': [client_to_dict(c) for c in clients],
+                'total': total,
+                'total_is_exact': exact,
+                'pages': -(-total // per_page),
+                'current_page': args['page'],
+                'has_next': has_next,
+                'next_cursor': clients[-1].id if has_next else None
             })
         except Exception as e:
             return self.error_response(str(e), 500)
 
-class ClientProfileResource(Resource):
-    def error_response(self, message, status_code=400):
-        return {'error': message}, status_code
-
-    def success_response(self, data, message="Success", status_code=200):
-        return {
-            'message': message,
-            'data': data
-        }, status_code
-
+class ClientProfileResource(BaseResource):
+    @read_replica
     @jwt_required()
+    @audited('client')
     def get(self, client_id):
         """
         Get detailed client profile including enrolled programs
         """
         try:
-            client = Client.query.get(client_id)
+            client = Client.get_live(client_id)
             if not client:
                 return self.error_response("Client not found", 404)
             
-            # Get client's enrollments with program details
-            enrollments = Enrollment.query.filter_by(client_id=client_id).all()
-            programs = [Program.query.get(e.program_id) for e in enrollments]
+            # Get client's enrollments, with programs from the catalog
+            programs = [p for _, p in program_catalog.enrollments_with_programs([client_id])]
             
             # Format client data
             client_data = {
@@ -369,63 +419,226 @@ class ClientProfileResource(Resource):
         except Exception as e:
             return self.error_response(str(e), 500)
 
-class ClientAPIResource(Resource):
-    def error_response(self, message, status_code=400):
-        return {'error': message}, status_code
-
-    def success_response(self, data, message="Success", status_code=200):
-        return {
-            'message': message,
-            'data': data
-        }, status_code
+def client_api_data(client, enrollments):
+    """
+    Client profile in the standardized format used by the external API
+    enrollments: (enrollment, program) pairs, see ProgramCatalog.enrollments_with_programs
+    """
+    return {
+        'client_id': client.id,
+        'name': f"{client.first_name} {client.last_name}",
+        'date_of_birth': client.date_of_birth.strftime('%d/%m/%Y'),
+        'gender': client.gender,
+        'contact': {
+            'phone': client.contact_number,
+            'email': client.email,
+            'address': client.address
+        },
+        'enrolled_programs': [
+            {
+                'program_id': p.id,
+                'name': p.name,
+                'description': p.description,
+                'enrollment_date': e.enrollment_date.strftime('%d/%m/%Y'),
+                'status': e.status
+            }
+            for e, p in enrollments
+        ]
+    }
 
+class ClientAPIResource(BaseResource):
+    @read_replica
     @jwt_required()
+    @rate_limited
+    @audited('client')
+    @single_flight
     def get(self, client_id):
         """
         External API endpoint for client information
         Returns client profile in a standardized format
         """
         try:
-            client = Client.query.get(client_id)
+            client = Client.get_live(client_id)
             if not client:
                 return self.error_response("Client not found", 404)
             
-            # Get client's enrollments with program details
-            enrollments = Enrollment.query.filter_by(client_id=client_id).all()
-            programs = [Program.query.get(e.program_id) for e in enrollments]
+            # Get client's enrollments, with programs from the catalog
+            enrollments = program_catalog.enrollments_with_programs([client_id])
             
             # Format response for external systems
-            response_data = {
-                'client_id': client.id,
-                'name': f"{client.first_name} {client.last_name}",
-                'date_of_birth': client.date_of_birth.strftime('%d/%m/%Y'),
-                'gender': client.gender,
-                'contact': {
-                    'phone': client.contact_number,
-                    'email': client.email,
-                    'address': client.address
-                },
-                'enrolled_programs': [
-                    {
-                        'program_id': p.id,
-                        'name': p.name,
-                        'description': p.description,
-                        'enrollment_date': e.enrollment_date.strftime('%d/%m/%Y'),
-                        'status': e.status
-                    }
-                    for p, e in zip(programs, enrollments)
-                ]
-            }
+            response_data = client_api_data(client, enrollments)
             
             return self.success_response(response_data)
         except Exception as e:
             return self.error_response(str(e), 500)
 
-# Initialize API
-api = Api()
+class ClientAPIBatchResource(BaseResource):
+    def check_count(self, client_ids):
+        """An error response when no IDs or more than CLIENT_BATCH_MAX were given, otherwise None"""
+        max_clients = current_app.config['CLIENT_BATCH_MAX']
+        if not client_ids:
+            return self.error_response("A list of client IDs is required")
+        if len(client_ids) > max_clients:
+            return self.error_response(f"At most {max_clients} clients can be requested at once")
+        return None
+
+    def get_clients(self, client_ids):
+        """
+        Profiles for many clients using one query for the clients and one
+        for their enrollments; programs come from the catalog
+        """
+        error = self.check_count(client_ids)
+        if error:
+            return error
+
+        client_ids = list(dict.fromkeys(client_ids))
+        clients = {c.id: c for c in Client.live().filter(Client.id.in_(client_ids)).all()}
+
+        enrollments_by_client = {client_id: [] for client_id in clients}
+        for e, program in program_catalog.enrollments_with_programs(list(clients)):
+            enrollments_by_client[e.client_id].append((e, program))
+
+        audit_log.record('client', list(clients))
+
+        return self.success_response({
+            'clients': [
+                client_api_data(clients[client_id], enrollments_by_client[client_id])
+                for client_id in client_ids if client_id in clients
+            ],
+            'not_found': [client_id for client_id in client_ids if client_id not in clients]
+        })
+
+    @read_replica
+    @jwt_required()
+    @rate_limited
+    def get(self):
+        """
+        External API endpoint for many clients at once
+        Query parameters:
+        - ids: Comma separated client IDs
+        """
+        try:
+            client_ids = [i for i in request.args.get('ids', '').split(',') if i.strip()]
+            # Checked before parsing so a huge list is turned away cheaply
+            error = self.check_count(client_ids)
+            if error:
+                return error
+            try:
+                client_ids = [int(i) for i in client_ids]
+            except ValueError:
+                return self.error_response("Client IDs must be integers")
+
+            return self.get_clients(client_ids)
+        except Exception as e:
+            return self.error_response(str(e), 500)
+
+    @read_replica
+    @jwt_required()
+    @rate_limited
+    def post(self):
+        """
+        External API endpoint for many clients at once
+        Expected JSON body:
+        {
+            "ids": [1, 2, 3]
+        }
+        """
+        try:
+            data = request.get_json(silent=True) or {}
+            client_ids = data.get('ids')
+            # bool is a subclass of int, so compare types exactly
+            if not isinstance(client_ids, list) or not all(type(i) is int for i in client_ids):
+                return self.error_response("A list of integer client IDs is required")
+
+            return self.get_clients(client_ids)
+        except Exception as e:
+            return self.error_response(str(e), 500)
+
+class ClientImportResource(BaseResource):
+    @jwt_required()
+    def post(self):
+        """
+        Register many clients in a background job
+        Expected JSON body:
+        {
+            "clients": [
+                {
+                    "first_name": "John",
+                    "last_name": "Doe",
+                    "date_of_birth": "01/01/1990",
+                    "gender": "Male"
+                }
+            ]
+        }
+        Returns the job id to poll at /api/jobs/<job_id>
+        """
+        try:
+            current_user_id = int(get_jwt_identity())
+
+            data = request.get_json(silent=True) or {}
+            clients = data.get('clients')
+            if not isinstance(clients, list) or not clients:
+                return self.error_response("A non-empty list of clients is required")
+
+            job = enqueue('client_import', {'clients': clients, 'created_by': current_user_id}, current_user_id)
+
+            return self.success_response(
+                {'job_id': job.id, 'status': job.status},
+                "Client import started",
+                202
+            )
+        except Exception as e:
+            db.session.rollback()
+            return self.error_response(str(e), 500)
+
+class ClientExportResource(BaseResource):
+    @jwt_required()
+    def post(self):
+        """
+        Export all clients to CSV in a background job
+        The file can be downloaded from /api/jobs/<job_id>/download once the job succeeds
+        """
+        try:
+            current_user_id = int(get_jwt_identity())
+
+            job = enqueue('client_export', {}, current_user_id)
+
+            return self.success_response(
+                {'job_id': job.id, 'status': job.status},
+                "Client export started",
+                202
+            )
+        except Exception as e:
+            db.session.rollback()
+            return self.error_response(str(e), 500)
+
+class ClientDuplicateScanResource(BaseResource):
+    @jwt_required()
+    def post(self):
+        """
+        Scan the whole registry for likely duplicate clients in a background job
+        The duplicate pairs are in the job result at /api/jobs/<job_id>
+        """
+        try:
+            current_user_id = int(get_jwt_identity())
+
+            job = enqueue('client_dedup_scan', {}, current_user_id)
+
+            return self.success_response(
+                {'job_id': job.id, 'status': job.status},
+                "Duplicate scan started",
+                202
+            )
+        except Exception as e:
+            db.session.rollback()
+            return self.error_response(str(e), 500)
+
 
-def init_client_routes(app):
-    api.add_resource(ClientResource, '/api/clients', '/api/clients/<int:client_id>')
-    api.add_resource(ClientSearchResource, '/api/clients/search')
-    api.add_resource(ClientAPIResource, '/api/v1/clients/<int:client_id>')
-    api.init_app(app) 
\ No newline at end of file
+# Register routes on the shared Api
+api.add_resource(ClientResource, '/api/clients', '/api/clients/<int:client_id>')
+api.add_resource(ClientSearchResource, '/api/clients/search')
+api.add_resource(ClientImportResource, '/api/clients/import')
+api.add_resource(ClientExportResource, '/api/clients/export')
+api.add_resource(ClientDuplicateScanResource, '/api/clients/duplicates/scan')
+api.add_resource(ClientAPIResource, '/api/v1/clients/<int:client_id>')
+api.add_resource(ClientAPIBatchResource, '/api/v1/clients/batch')
@@ -1,25 +1,19 @@
 from flask import request
-from flask_restful import Resource, Api, reqparse
-from models import db, Client, Program, Enrollment
+from routes.base import api, BaseResource
+from routes.schemas import enrollment_schema, enrollment_status_schema, enrollment_update_schema
+from models import db, Client, Enrollment
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+from enrollment_lifecycle import set_enrollment_status
+from program_catalog import program_catalog
+from idempotency import idempotent
+from versioning import etag, if_match_versions, versioned_update, update_failure
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
-class EnrollmentResource(Resource):
-    def __init__(self):
-        self.parser = reqparse.RequestParser()
-        self.parser.add_argument('client_id', type=int, required=True, help='Client ID is required')
-        self.parser.add_argument('program_ids', type=int, action='append', required=True, help='Program IDs are required')
-
-    def error_response(self, message, status_code=400):
-        return {'error': message}, status_code
-
-    def success_response(self, data, message="Success", status_code=200):
-        return {
-            'message': message,
-            'data': data
-        }, status_code
-
+class EnrollmentResource(BaseResource):
     @jwt_required()
+    @idempotent
     def post(self):
         """
         Enroll a client in one or more programs
@@ -28,33 +22,59 @@ class EnrollmentResource(Resource):
             "client_id": 1,
             "program_ids": [1, 2, 3]
         }
+        Send an Idempotency-Key header to safely retry: a retry gets the first
+        response back instead of a 409
         """
         try:
             # Get the current user's ID
             current_user_id = int(get_jwt_identity())
             
             # Parse and validate the request data
-            args = self.parser.parse_args()
+            args, error = self.parse(enrollment_schema)
+            if error:
+                return error
             
-            client = Client.query.get(args['client_id'])
+            client = Client.get_live(args['client_id'])
             if not client:
                 return self.error_response("Client not found", 404)
             
+            # Repeated IDs would only collide with each other
+            program_ids = list(dict.fromkeys(args['program_ids']))
+
             enrollments = []
-            for program_id in args['program_ids']:
-                program = Program.query.get(program_id)
+            for program_id in program_ids:
+                program = program_catalog.get(program_id)
                 if not program:
                     return self.error_response(f"Program with ID {program_id} not found", 404)
+                # Only admins can see both, but records never span facilities
+                if program.facility_id != client.facility_id:
+                    return self.error_response(f"Program with ID {program_id} belongs to another facility")
                 
                 enrollment = Enrollment(
                     client_id=client.id, 
                     program_id=program.id,
+                    facility_id=client.facility_id,
                     created_by=current_user_id
                 )
                 enrollments.append(enrollment)
+
+            # Answer the common conflict with one indexed query instead of a
+            # failed INSERT; the unique index still catches concurrent enrollments
+            enrolled = db.session.scalars(
+                select(Enrollment.program_id).where(
+                    Enrollment.client_id == client.id,
+                    Enrollment.program_id.in_(program_ids),
+                    Enrollment.deleted_at.is_(None)
+                )
+            ).all()
+            if enrolled:
+                return self.error_response(
+                    "Client is already enrolled in one or more of these programs", 409, program_ids=sorted(enrolled)
+                )
             
             db.session.add_all(enrollments)
-            db.session.commit()
+            # Committed by @idempotent, together with the response
+            db.session.flush()
             
             # Convert enrollment objects to dictionaries
             enrollment_dicts = [{
@@ -77,6 +97,50 @@ class EnrollmentResource(Resource):
             db.session.rollback()
             return self.error_response(str(e), 500)
 
+    @jwt_required()
+    def patch(self, client_id, program_id):
+        """
+        Change an enrollment's status or date in one UPDATE
+        Send the enrollment's ETag in an If-Match header to only update it if
+        nobody has changed it since; 412 means someone did
+        Example JSON body:
+        {
+            "status": "Suspended",  # Active, Completed or Suspended
+            "enrollment_date": "01/01/2025"
+        }
+        """
+        try:
+            args, error = self.parse(enrollment_update_schema, partial=True)
+            if error:
+                return error
+            if not args:
+                return self.error_response("No fields to update")
+
+            enrollment = versioned_update(
+                Enrollment, args, if_match_versions(), client_id=client_id, program_id=program_id
+            )
+            if enrollment is None:
+                db.session.rollback()
+                return self.error_response(*update_failure(Enrollment, client_id=client_id, program_id=program_id))
+
+            db.session.commit()
+
+            return self.success_response(
+                {
+                    'id': enrollment.id,
+                    'client_id': enrollment.client_id,
+                    'program_id': enrollment.program_id,
+                    'enrollment_date': enrollment.enrollment_date.isoformat() if enrollment.enrollment_date else None,
+                    'status': enrollment.status,
+                    'created_by': enrollment.created_by
+                },
+                "Enrollment updated successfully",
+                headers={'ETag': etag(enrollment.version)}
+            )
+        except Exception as e:
+            db.session.rollback()
+            return self.error_response(str(e), 500)
+
     @jwt_required()
     def delete(self, client_id, program_id):
         """
@@ -90,7 +154,7 @@ class EnrollmentResource(Resource):
             current_user_id = int(get_jwt_identity())
             
             # Find the enrollment
-            enrollment = Enrollment.query.filter_by(
+            enrollment = Enrollment.live().filter_by(
                 client_id=client_id,
                 program_id=program_id
             ).first()
@@ -98,8 +162,8 @@ class EnrollmentResource(Resource):
             if not enrollment:
                 return self.error_response("Enrollment not found", 404)
             
-            # Delete the enrollment
-            db.session.delete(enrollment)
+            # Soft delete the enrollment so its history is kept
+            enrollment.deleted_at = datetime.utcnow()
             db.session.commit()
             
             return self.success_response(
@@ -111,9 +175,37 @@ class EnrollmentResource(Resource):
             db.session.rollback()
             return self.error_response(str(e), 500)
 
-# Initialize API
-api = Api()
+class EnrollmentStatusResource(BaseResource):
+    @jwt_required()
+    def put(self):
+        """
+        Change the status of many enrollments at once
+        Expected JSON body:
+        {
+            "enrollment_ids": [1, 2, 3],
+            "status": "Suspended"  # Active, Completed or Suspended
+        }
+        """
+        try:
+            # Parse and validate the request data
+            args, error = self.parse(enrollment_status_schema)
+            if error:
+                return error
+
+            try:
+                updated = set_enrollment_status(args['enrollment_ids'], args['status'])
+            except ValueError as e:
+                return self.error_response(str(e))
+
+            return self.success_response(
+                {'updated': updated, 'status': args['status']},
+                "Enrollment status updated successfully"
+            )
+        except Exception as e:
+            db.session.rollback()
+            return self.error_response(str(e), 500)
+
 
-def init_enrollment_routes(app):
-    api.add_resource(EnrollmentResource, '/api/enrollments', '/api/enrollments/<int:client_id>/<int:program_id>')
-    api.init_app(app) 
\ No newline at end of file
+# Register routes on the shared Api
+api.add_resource(EnrollmentResource, '/api/enrollments', '/api/enrollments/<int:client_id>/<int:program_id>')
+api.add_resource(EnrollmentStatusResource, '/api/enrollments/status')
@@ -0,0 +1,126 @@
+from flask import request, Response, stream_with_context
+from routes.base import api, BaseResource, role_required
+from routes.schemas import event_stream_query_schema, webhook_schema
+from models import db, Webhook
+from outbox import event_stream, latest_event_id
+from tenancy import current_facility_id
+from flask_jwt_extended import jwt_required, get_jwt_identity
+import secrets
+
+def webhook_to_dict(webhook):
+    return {
+        'id': webhook.id,
+        'url': webhook.url,
+        'event_types': webhook.event_types,
+        'facility_id': webhook.facility_id,
+        'is_active': webhook.is_active,
+        'last_event_id': webhook.last_event_id,
+        'failures': webhook.failures,
+        'next_attempt_at': webhook.next_attempt_at.isoformat() if webhook.next_attempt_at else None,
+        'last_error': webhook.last_error,
+        'created_at': webhook.created_at.isoformat() if webhook.created_at else None
+    }
+
+class EventStreamResource(BaseResource):
+    @jwt_required()
+    def get(self):
+        """
+        Server-Sent Events stream of client and enrollment changes in the
+        user's facility (every facility for admins)
+        Each event's data is {"id", "type", "resource_id", "facility_id", "data", "created_at"}.
+        Query parameters:
+        - after: Only events after this ID (default: only new events).
+          Reconnecting browsers send Last-Event-ID instead
+        - types: Comma separated event types, e.g. enrollment.created,enrollment.updated
+        """
+        args, error = self.parse(event_stream_query_schema, location='args')
+        if error:
+            return error
+
+        last_event_id = request.headers.get('Last-Event-ID', '')
+        if last_event_id.isdigit():
+            last_event_id = int(last_event_id)
+        elif args['after'] is not None:
+            last_event_id = args['after']
+        else:
+            last_event_id = latest_event_id()
+        event_types = args['types'].split(',') if args['types'] else None
+
+        return Response(
+            stream_with_context(event_stream(last_event_id, current_facility_id(), event_types)),
+            mimetype='text/event-stream',
+            # Keep proxies from caching or buffering the stream
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
+class WebhookListResource(BaseResource):
+    @jwt_required()
+    @role_required('admin')
+    def get(self):
+        """Registered webhooks and their delivery state (admins only)"""
+        try:
+            webhooks = Webhook.query.order_by(Webhook.id).all()
+            return self.success_response([webhook_to_dict(w) for w in webhooks])
+        except Exception as e:
+            return self.error_response(str(e), 500)
+
+    @jwt_required()
+    @role_required('admin')
+    def post(self):
+        """
+        Register a webhook (admins only). Events from now on are POSTed to
+        it in batches as {"webhook_id": 1, "events": [...]}, signed with the
+        returned secret in the X-AfyaLink-Signature header
+        (sha256=<HMAC-SHA256 of the body>). The secret is only shown once.
+        Expected JSON body:
+        {
+            "url": "https://partner.example.com/afyalink",
+            "event_types": ["enrollment.created"],  # optional, default every type
+            "facility_id": 2  # optional, default every facility
+        }
+        """
+        try:
+            args, error = self.parse(webhook_schema)
+            if error:
+                return error
+
+            webhook = Webhook(
+                url=args['url'],
+                secret=secrets.token_hex(32),
+                event_types=args['event_types'],
+                facility_id=args['facility_id'],
+                last_event_id=latest_event_id(),
+                created_by=int(get_jwt_identity())
+            )
+            db.session.add(webhook)
+            db.session.commit()
+
+            return self.success_response(
+                {**webhook_to_dict(webhook), 'secret': webhook.secret},
+                "Webhook registered successfully",
+                201
+            )
+        except Exception as e:
+            db.session.rollback()
+            return self.error_response(str(e), 500)
+
+class WebhookResource(BaseResource):
+    @jwt_required()
+    @role_required('admin')
+    def delete(self, webhook_id):
+        """Stop delivering to a webhook and remove it (admins only)"""
+        try:
+            webhook = db.session.get(Webhook, webhook_id)
+            if not webhook:
+                return self.error_response("Webhook not found", 404)
+            db.session.delete(webhook)
+            db.session.commit()
+            return self.success_response(None, "Webhook deleted successfully")
+        except Exception as e:
+            db.session.rollback()
+            return self.error_response(str(e), 500)
+
+# Register routes on the shared Api
+api.add_resource(EventStreamResource, '/api/events/stream')
+api.add_resource(WebhookListResource, '/api/webhooks')
+api.add_resource(WebhookResource, '/api/webhooks/<int:webhook_id>')
@@ -0,0 +1,127 @@
+from flask import request, send_from_directory
+from routes.base import api, BaseResource
+from models import db, Job
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from jobs import enqueue
+from rate_limit import rate_limited
+from bulk_export import RESOURCE_TYPES, export_dir, parse_since
+import shutil
+
+class BulkExportResource(BaseResource):
+    @jwt_required()
+    @rate_limited
+    def get(self):
+        """
+        Start a bulk export of client data for external systems
+        Query parameters:
+        - _type: Comma separated resource types (Patient, EpisodeOfCare; default: all)
+        - _since: Only export resources changed at or after this time (ISO 8601)
+        Returns 202 with the status URL in the Content-Location header
+        """
+        try:
+            current_user_id = int(get_jwt_identity())
+
+            types = [t.strip() for t in request.args.get('_type', '').split(',') if t.strip()]
+            types = types or list(RESOURCE_TYPES)
+            unknown = [t for t in types if t not in RESOURCE_TYPES]
+            if unknown:
+                return self.error_response(f"Unsupported resource type: {', '.join(unknown)}")
+
+            since = request.args.get('_since')
+            if since:
+                try:
+                    # Stored as naive UTC, which is what the job compares updated_at with
+                    since = parse_since(since).isoformat()
+                except ValueError:
+                    return self.error_response("Invalid _since. Use an ISO 8601 date and time")
+
+            job = enqueue('bulk_export', {'types': types, 'since': since, 'request': request.url}, current_user_id)
+
+            return self.success_response(
+                {'job_id': job.id, 'status': job.status},
+                "Bulk export started",
+                202,
+                {'Content-Location': f'{request.host_url}api/v1/export/{job.id}'}
+            )
+        except Exception as e:
+            db.session.rollback()
+            return self.error_response(str(e), 500)
+
+class BulkExportStatusResource(BaseResource):
+    @jwt_required()
+    def get(self, job_id):
+        """
+        Poll a bulk export
+        Returns 202 with an X-Progress header while the export runs, then the
+        manifest listing the NDJSON files of each resource type
+        """
+        try:
+            current_user_id = int(get_jwt_identity())
+
+            job = Job.query.filter_by(id=job_id, type='bulk_export', created_by=current_user_id).first()
+            if not job:
+                return self.error_response("Export not found", 404)
+
+            if job.status in ('queued', 'running'):
+                progress = f'{job.progress}/{job.total}' if job.total else f'{job.progress} resources'
+                return self.success_response(
+                    {'status': job.status},
+                    "Export in progress",
+                    202,
+                    {'X-Progress': progress, 'Retry-After': '5'}
+                )
+            if job.status == 'failed':
+                return self.error_response(job.error or "Export failed", 500)
+
+            manifest = dict(job.result)
+            manifest['requiresAccessToken'] = True
+            manifest['output'] = [{
+                'type': item['type'],
+                'url': f"{request.host_url}api/v1/export/{job.id}/{item['file']}",
+                'count': item['count']
+            } for item in job.result['output']]
+            manifest['error'] = []
+
+            return self.success_response(manifest, "Export complete")
+        except Exception as e:
+            return self.error_response(str(e), 500)
+
+    @jwt_required()
+    def delete(self, job_id):
+        """
+        Delete the files of a finished bulk export
+        """
+        try:
+            current_user_id = int(get_jwt_identity())
+
+            job = Job.query.filter_by(id=job_id, type='bulk_export', created_by=current_user_id).first()
+            if not job:
+                return self.error_response("Export not found", 404)
+            if job.status in ('queued', 'running'):
+                return self.error_response("Export has not finished yet", 409)
+
+            shutil.rmtree(export_dir(job.id), ignore_errors=True)
+
+            return self.success_response(None, "Export files deleted")
+        except Exception as e:
+            return self.error_response(str(e), 500)
+
+class BulkExportFileResource(BaseResource):
+    @jwt_required()
+    def get(self, job_id, filename):
+        """
+        Download one gzip-compressed NDJSON file of a finished bulk export
+        """
+        current_user_id = int(get_jwt_identity())
+
+        job = Job.query.filter_by(id=job_id, type='bulk_export', created_by=current_user_id).first()
+        if not job or job.status != 'succeeded':
+            return {'error': "Export not found"}, 404
+
+        return send_from_directory(export_dir(job.id), filename, mimetype='application/gzip')
+
+
+# Register routes on the shared Api
+api.add_resource(BulkExportResource, '/api/v1/$export')
+api.add_resource(BulkExportStatusResource, '/api/v1/export/<int:job_id>')
+api.add_resource(BulkExportFileResource, '/api/v1/export/<int:job_id>/<string:filename>')
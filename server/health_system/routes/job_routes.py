@@ -0,0 +1,60 @@
+from flask import current_app, send_from_directory
+from routes.base import api, BaseResource
+from models import db, Job
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'type': job.type,
+        'status': job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'result': job.result,
+        'error': job.error,
+        'attempts': job.attempts,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+class JobResource(BaseResource):
+    @jwt_required()
+    def get(self, job_id):
+        """
+        Get the status and progress of a background job
+        Only the user who started the job can see it
+        """
+        try:
+            current_user_id = int(get_jwt_identity())
+
+            job = Job.query.filter_by(id=job_id, created_by=current_user_id).first()
+            if not job:
+                return self.error_response("Job not found", 404)
+
+            return self.success_response(job_to_dict(job))
+        except Exception as e:
+            return self.error_response(str(e), 500)
+
+class JobDownloadResource(BaseResource):
+    @jwt_required()
+    def get(self, job_id):
+        """
+        Download the file produced by a finished export job
+        """
+        current_user_id = int(get_jwt_identity())
+
+        job = Job.query.filter_by(id=job_id, created_by=current_user_id).first()
+        if not job:
+            return {'error': "Job not found"}, 404
+        if job.status != 'succeeded':
+            return {'error': "Job has not finished yet"}, 409
+        if not job.result or 'file' not in job.result:
+            return {'error': "Job did not produce a file"}, 404
+
+        return send_from_directory(current_app.config['EXPORT_DIR'], job.result['file'], as_attachment=True)
+
+
+# Register routes on the shared Api
+api.add_resource(JobResource, '/api/jobs/<int:job_id>')
+api.add_resource(JobDownloadResource, '/api/jobs/<int:job_id>/download')
@@ -0,0 +1,22 @@
+from routes.base import api, BaseResource, role_required
+from flask_jwt_extended import jwt_required
+from single_flight import single_flight_group
+
+class MetricsResource(BaseResource):
+    @jwt_required()
+    @role_required('admin')
+    def get(self):
+        """
+        Request coalescing counters for this worker process, per endpoint (admins only):
+        - executed: requests that ran their handler
+        - coalesced: requests answered with another request's result
+        - timeouts: coalesced requests that gave up waiting and ran themselves
+        """
+        try:
+            return self.success_response({'single_flight': single_flight_group.stats()})
+        except Exception as e:
+            return self.error_response(str(e), 500)
+
+
+# Register routes on the shared Api
+api.add_resource(MetricsResource, '/api/metrics')
@@ -1,26 +1,22 @@
 from flask import request
-from flask_restful import Resource, Api, reqparse
-from models import db, Program, Enrollment
+from routes.base import api, BaseResource
+from routes.schemas import program_schema, program_analytics_schema
+from models import db, Client, Program, Enrollment
+from datetime import datetime
 from sqlalchemy.exc import IntegrityError
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from db_routing import read_replica
+from single_flight import single_flight
+from audit import audited
+from versioning import etag, if_match_versions, versioned_update, update_failure
+from analytics import program_analytics, overall_analytics
+from program_catalog import program_catalog
 
-class ProgramResource(Resource):
-    def __init__(self):
-        self.parser = reqparse.RequestParser()
-        self.parser.add_argument('name', type=str, required=True, help='Program name is required')
-        self.parser.add_argument('description', type=str, required=False)
-        self.parser.add_argument('duration', type=int, required=False, default=30, help='Duration in days')
-
-    def error_response(self, message, status_code=400):
-        return {'error': message}, status_code
-
-    def success_response(self, data, message="Success", status_code=200):
-        return {
-            'message': message,
-            'data': data
-        }, status_code
-
+class ProgramResource(BaseResource):
+    @read_replica
     @jwt_required()
+    @audited('program')
+    @single_flight
     def get(self, program_id=None):
         """
         Get program details
@@ -30,12 +26,15 @@ class ProgramResource(Resource):
         try:
             if program_id is not None:
                 # Get specific program
-                program = Program.query.get(program_id)
+                program = Program.get_live(program_id)
                 if not program:
                     return self.error_response("Program not found", 404)
 
                 # Get program's enrolled clients
-                clients = program.clients
+                clients = Client.live().join(Enrollment, Enrollment.client_id == Client.id).filter(
+                    Enrollment.program_id == program_id,
+                    Enrollment.deleted_at.is_(None)
+                ).all()
 
                 # Format program data
                 program_data = {
@@ -56,11 +55,12 @@ class ProgramResource(Resource):
 
                 return self.success_response(
                     program_data,
-                    "Program details retrieved successfully"
+                    "Program details retrieved successfully",
+                    headers={'ETag': etag(program.version)}
                 )
             else:
-                # Get all programs
-                programs = Program.query.all()
+                # Get all programs from the in-memory catalog
+                programs = program_catalog.all()
                 
                 # Convert programs to list of dictionaries
                 programs_list = [{
@@ -95,7 +95,9 @@ class ProgramResource(Resource):
             current_user_id = int(get_jwt_identity())
             
             # Parse and validate the request data
-            args = self.parser.parse_args()
+            args, error = self.parse(program_schema)
+            if error:
+                return error
             
             # Create new program
             program = Program(
@@ -121,7 +123,8 @@ class ProgramResource(Resource):
             return self.success_response(
                 program_dict,
                 "Program created successfully",
-                201
+                201,
+                {'ETag': etag(program.version)}
             )
         except IntegrityError:
             db.session.rollback()
@@ -130,37 +133,23 @@ class ProgramResource(Resource):
             db.session.rollback()
             return self.error_response(str(e), 500)
 
-    @jwt_required()
-    def put(self, program_id):
-        """
-        Update an existing health program
-        URL parameters:
-        - program_id: ID of the program to update
-        
-        Expected JSON body:
-        {
-            "name": "Updated Program Name",
-            "description": "Updated Program Description",
-            "duration": 45  # Duration in days (optional)
-        }
-        """
+    def update(self, program_id, partial):
+        """Write the fields sent in one versioned UPDATE; omitted fields keep their value"""
         try:
-            # Get the current user's ID
-            current_user_id = int(get_jwt_identity())
-            
-            # Find the program
-            program = Program.query.get(program_id)
-            if not program:
-                return self.error_response("Program not found", 404)
-            
             # Parse and validate the request data
-            args = self.parser.parse_args()
-            
-            # Update program details
-            program.name = args['name']
-            program.description = args.get('description', program.description)
-            program.duration = args.get('duration', program.duration)
-            
+            args, error = self.parse(program_schema, partial=partial)
+            if error:
+                return error
+            if not args:
+                return self.error_response("No fields to update")
+
+            # Update program details in one statement, checking the version
+            # instead of loading the program first
+            program = versioned_update(Program, args, if_match_versions(), id=program_id)
+            if program is None:
+                db.session.rollback()
+                return self.error_response(*update_failure(Program, id=program_id))
+
             db.session.commit()
             
             # Convert program object to dictionary
@@ -175,7 +164,8 @@ class ProgramResource(Resource):
             
             return self.success_response(
                 program_dict,
-                "Program updated successfully"
+                "Program updated successfully",
+                headers={'ETag': etag(program.version)}
             )
         except IntegrityError:
             db.session.rollback()
@@ -184,6 +174,36 @@ class ProgramResource(Resource):
             db.session.rollback()
             return self.error_response(str(e), 500)
 
+    @jwt_required()
+    def put(self, program_id):
+        """
+        Update an existing health program
+        Send the ETag of the program in an If-Match header to only update it
+        if nobody has changed it since; 412 means someone did
+        URL parameters:
+        - program_id: ID of the program to update
+        
+        Expected JSON body:
+        {
+            "name": "Updated Program Name",
+            "description": "Updated Program Description",
+            "duration": 45  # Duration in days (optional)
+        }
+        """
+        return self.update(program_id, partial=False)
+
+    @jwt_required()
+    def patch(self, program_id):
+        """
+        Change some of a program's fields; only the fields sent are validated
+        and written. If-Match works as for PUT
+        Example JSON body:
+        {
+            "duration": 60
+        }
+        """
+        return self.update(program_id, partial=True)
+
     @jwt_required()
     def delete(self, program_id):
         """
@@ -196,15 +216,13 @@ class ProgramResource(Resource):
             current_user_id = int(get_jwt_identity())
             
             # Find the program
-            program = Program.query.get(program_id)
+            program = Program.get_live(program_id)
             if not program:
                 return self.error_response("Program not found", 404)
             
-            # Delete all enrollments first (due to foreign key constraints)
-            Enrollment.query.filter_by(program_id=program_id).delete()
-            
-            # Delete the program
-            db.session.delete(program)
+            # Soft delete the program with a single-row update; its enrollments
+            # are hidden with it and moved to the archive tables by the archiver
+            program.deleted_at = datetime.utcnow()
             db.session.commit()
             
             return self.success_response(
@@ -216,9 +234,34 @@ class ProgramResource(Resource):
             db.session.rollback()
             return self.error_response(str(e), 500)
 
-# Initialize API
-api = Api()
+class ProgramAnalyticsResource(BaseResource):
+    @read_replica
+    @jwt_required()
+    def get(self, program_id=None):
+        """
+        Enrollment analytics for one program, or for all programs
+        Query parameters:
+        - bucket: day, week or month (default: week)
+        - start: Only return buckets from this date (DD/MM/YYYY)
+        - end: Only return buckets up to this date (DD/MM/YYYY)
+        """
+        try:
+            args, error = self.parse(program_analytics_schema, location='args')
+            if error:
+                return error
+            start, end = args['start'], args['end']
+
+            if program_id is None:
+                return self.success_response(overall_analytics(args['bucket'], start, end))
+
+            if not Program.get_live(program_id):
+                return self.error_response("Program not found", 404)
+
+            return self.success_response(program_analytics(program_id, args['bucket'], start, end))
+        except Exception as e:
+            return self.error_response(str(e), 500)
+
 
-def init_program_routes(app):
-    api.add_resource(ProgramResource, '/api/programs', '/api/programs/<int:program_id>')
-    api.init_app(app) 
\ No newline at end of file
+# Register routes on the shared Api
+api.add_resource(ProgramResource, '/api/programs', '/api/programs/<int:program_id>')
+api.add_resource(ProgramAnalyticsResource, '/api/programs/analytics', '/api/programs/<int:program_id>/analytics')
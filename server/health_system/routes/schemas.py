@@ -0,0 +1,171 @@
+from marshmallow import Schema, fields, validate, validates_schema, ValidationError, EXCLUDE
+from analytics import BUCKETS
+from enrollment_lifecycle import ENROLLMENT_STATUSES
+from client_search import COUNT_MODES
+from outbox import EVENT_TYPES
+
+DATE_FORMAT = '%d/%m/%Y'
+DATE_ERROR = "Invalid date format. Use DD/MM/YYYY"
+ROLES = ('doctor', 'admin', 'nurse')
+
+
+class RequestSchema(Schema):
+    class Meta:
+        # Ignore fields the endpoint doesn't use, like the request parsers did
+        unknown = EXCLUDE
+
+
+# Schema for user data validation
+class UserSchema(RequestSchema):
+    username = fields.Str(required=True, validate=validate.Length(min=3, max=80))
+    password = fields.Str(required=True, validate=validate.Length(min=6))
+    email = fields.Email(required=True)
+    role = fields.Str(validate=validate.OneOf(ROLES))
+
+
+class LoginSchema(RequestSchema):
+    username = fields.Str(required=True, error_messages={'required': 'Username is required'})
+    password = fields.Str(required=True, error_messages={'required': 'Password is required'})
+
+
+# Lengths match the client table's columns
+class ClientSchema(RequestSchema):
+    first_name = fields.Str(required=True, validate=validate.Length(min=1, max=50),
+                            error_messages={'required': 'First name is required'})
+    last_name = fields.Str(required=True, validate=validate.Length(min=1, max=50),
+                           error_messages={'required': 'Last name is required'})
+    date_of_birth = fields.Date(
+        format=DATE_FORMAT, required=True,
+        error_messages={'required': 'Date of birth is required (DD/MM/YYYY)', 'invalid': DATE_ERROR}
+    )
+    gender = fields.Str(required=True, validate=validate.Length(min=1, max=10),
+                        error_messages={'required': 'Gender is required'})
+    contact_number = fields.Str(allow_none=True, validate=validate.Length(max=15))
+    email = fields.Str(allow_none=True, validate=validate.Length(max=100))
+    address = fields.Str(allow_none=True, validate=validate.Length(max=200))
+
+
+class ClientSearchSchema(RequestSchema):
+    query = fields.Str(load_default='')
+    gender = fields.Str(load_default=None)
+    min_age = fields.Int(load_default=None, validate=validate.Range(min=0))
+    max_age = fields.Int(load_default=None, validate=validate.Range(min=0))
+    enrolled_in = fields.Int(load_default=None)
+    not_enrolled_in = fields.Int(load_default=None)
+    status = fields.Str(load_default=None, validate=validate.OneOf(
+        ENROLLMENT_STATUSES, error=f"Status must be one of: {', '.join(ENROLLMENT_STATUSES)}"
+    ))
+    created_by = fields.Int(load_default=None)
+    after = fields.Int(load_default=None)  # ID of the last client of the previous page
+    count = fields.Str(load_default='estimate', validate=validate.OneOf(
+        COUNT_MODES, error=f"Count must be one of: {', '.join(COUNT_MODES)}"
+    ))
+    page = fields.Int(load_default=1, validate=validate.Range(min=1))
+    per_page = fields.Int(load_default=10, validate=validate.Range(min=1))
+
+    @validates_schema
+    def validate_ages(self, data, **kwargs):
+        if data['min_age'] is not None and data['max_age'] is not None and data['min_age'] > data['max_age']:
+            raise ValidationError("min_age cannot be greater than max_age", 'min_age')
+
+
+class ProgramSchema(RequestSchema):
+    name = fields.Str(required=True, error_messages={'required': 'Program name is required'})
+    description = fields.Str(allow_none=True)
+    duration = fields.Int(validate=validate.Range(min=1))  # Duration in days
+
+
+class ProgramAnalyticsSchema(RequestSchema):
+    bucket = fields.Str(load_default='week', validate=validate.OneOf(
+        BUCKETS, error=f"Bucket must be one of: {', '.join(BUCKETS)}"
+    ))
+    start = fields.DateTime(format=DATE_FORMAT, load_default=None, error_messages={'invalid': DATE_ERROR})
+    end = fields.DateTime(format=DATE_FORMAT, load_default=None, error_messages={'invalid': DATE_ERROR})
+
+
+class EnrollmentSchema(RequestSchema):
+    client_id = fields.Int(required=True, error_messages={'required': 'Client ID is required'})
+    program_ids = fields.List(
+        fields.Int(), required=True, validate=validate.Length(min=1),
+        error_messages={'required': 'Program IDs are required'}
+    )
+
+
+class EnrollmentStatusSchema(RequestSchema):
+    enrollment_ids = fields.List(
+        fields.Int(), required=True, validate=validate.Length(min=1),
+        error_messages={'required': 'Enrollment IDs are required'}
+    )
+    status = fields.Str(required=True, error_messages={'required': 'Status is required'})
+
+
+class EnrollmentUpdateSchema(RequestSchema):
+    status = fields.Str(validate=validate.OneOf(
+        ENROLLMENT_STATUSES, error=f"Status must be one of: {', '.join(ENROLLMENT_STATUSES)}"
+    ))
+    enrollment_date = fields.DateTime(format=DATE_FORMAT, error_messages={'invalid': DATE_ERROR})
+
+
+class AuditLogQuerySchema(RequestSchema):
+    client_id = fields.Int(load_default=None)
+    program_id = fields.Int(load_default=None)
+    user_id = fields.Int(load_default=None)
+    start = fields.DateTime(format=DATE_FORMAT, load_default=None, error_messages={'invalid': DATE_ERROR})
+    end = fields.DateTime(format=DATE_FORMAT, load_default=None, error_messages={'invalid': DATE_ERROR})
+    page = fields.Int(load_default=1, validate=validate.Range(min=1))
+    per_page = fields.Int(load_default=50, validate=validate.Range(min=1, max=500))
+
+
+class UserListQuerySchema(RequestSchema):
+    query = fields.Str(load_default='')  # Part of the username or email
+    role = fields.Str(load_default=None, validate=validate.OneOf(ROLES))
+    is_active = fields.Bool(load_default=None)
+    facility_id = fields.Int(load_default=None)
+    page = fields.Int(load_default=1, validate=validate.Range(min=1))
+    per_page = fields.Int(load_default=50, validate=validate.Range(min=1, max=200))
+
+
+class UserUpdateSchema(RequestSchema):
+    role = fields.Str(validate=validate.OneOf(ROLES, error=f"Role must be one of: {', '.join(ROLES)}"))
+    is_active = fields.Bool()
+    facility_id = fields.Int(allow_none=True)
+
+
+class UserActivityQuerySchema(RequestSchema):
+    minutes = fields.Int(load_default=15, validate=validate.Range(min=1, max=24 * 60))
+
+
+def _check_event_types(event_types):
+    unknown = sorted(set(event_types) - set(EVENT_TYPES))
+    if unknown:
+        raise ValidationError(f"Unknown event types: {', '.join(unknown)}. Use: {', '.join(EVENT_TYPES)}")
+
+
+class EventStreamQuerySchema(RequestSchema):
+    after = fields.Int(load_default=None, validate=validate.Range(min=0))  # Overridden by Last-Event-ID
+    # Comma separated event types
+    types = fields.Str(load_default=None, validate=lambda types: _check_event_types(types.split(',')))
+
+
+class WebhookSchema(RequestSchema):
+    url = fields.Url(required=True, schemes={'http', 'https'}, require_tld=False)
+    event_types = fields.List(fields.Str(), load_default=None, validate=_check_event_types)  # None: every type
+    facility_id = fields.Int(load_default=None)  # None: every facility
+
+
+# Built once at import; schemas hold no per-request state
+user_schema = UserSchema()
+login_schema = LoginSchema()
+client_schema = ClientSchema()
+client_search_schema = ClientSearchSchema()
+program_schema = ProgramSchema()
+program_analytics_schema = ProgramAnalyticsSchema()
+enrollment_schema = EnrollmentSchema()
+enrollment_status_schema = EnrollmentStatusSchema()
+enrollment_update_schema = EnrollmentUpdateSchema()
+audit_log_query_schema = AuditLogQuerySchema()
+user_list_query_schema = UserListQuerySchema()
+user_update_schema = UserUpdateSchema()
+user_activity_query_schema = UserActivityQuerySchema()
+event_stream_query_schema = EventStreamQuerySchema()
+webhook_schema = WebhookSchema()
@@ -1,46 +1,60 @@
 from flask import request
-from flask_restful import Resource, Api, reqparse
-from models import db, User
+from routes.base import api, BaseResource, role_required
+from routes.schemas import (
+    user_schema, login_schema, user_list_query_schema, user_update_schema, user_activity_query_schema
+)
+from models import db, User, Client, Program, Enrollment, Facility
+from cache import TTLCache
+from user_activity import user_activity
+from user_tokens import token_claims, revoke_tokens, token_versions
 import bcrypt
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
 from datetime import datetime, timedelta, timezone
 from functools import wraps
 import os
+from sqlalchemy import or_, select, func, literal, union_all
 from sqlalchemy.exc import IntegrityError
-from marshmallow import Schema, fields, validate
-
-# Initialize API
-api = Api()
 
 # JWT configuration
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")  # In production, use environment variable
 JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
 
-# Schema for user data validation
-class UserSchema(Schema):
-    username = fields.Str(required=True, validate=validate.Length(min=3, max=80))
-    password = fields.Str(required=True, validate=validate.Length(min=6))
-    email = fields.Email(required=True)
-    role = fields.Str(validate=validate.OneOf(['doctor', 'admin', 'nurse']))
-
-user_schema = UserSchema()
-
-class SystemUserResource(Resource):
-    def __init__(self):
-        self.parser = reqparse.RequestParser()
-        self.parser.add_argument('username', type=str, required=True, help='Username is required')
-        self.parser.add_argument('password', type=str, required=True, help='Password is required')
-        self.parser.add_argument('email', type=str, required=True, help='Email is required')
+# Pages of the admin user list; cleared when users change, the TTL bounds
+# how stale the created counts and other workers' copies can be
+user_list_cache = TTLCache(ttl=30, max_entries=256)
 
-    def error_response(self, message, status_code=400):
-        return {'error': message}, status_code
+def user_to_dict(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'role': user.role,
+        'facility_id': user.facility_id,
+        'is_active': user.is_active,
+        'created_at': user.created_at.isoformat() if user.created_at else None,
+        'last_login': user.last_login.isoformat() if user.last_login else None,
+        'last_seen': user.last_seen.isoformat() if user.last_seen else None
+    }
 
-    def success_response(self, data, message="Success", status_code=200):
-        return {
-            'message': message,
-            'data': data
-        }, status_code
+def created_counts(user_ids):
+    """
+    Live clients, programs and enrollments each user created, from one
+    grouped query instead of loading every user's relationships
+    """
+    counts = {user_id: {'clients': 0, 'programs': 0, 'enrollments': 0} for user_id in user_ids}
+    if not user_ids:
+        return counts
+    statement = union_all(*[
+        select(literal(kind).label('kind'), model.created_by, func.count().label('total'))
+        .where(model.created_by.in_(user_ids), model.deleted_at.is_(None))
+        .group_by(model.created_by)
+        for kind, model in (('clients', Client), ('programs', Program), ('enrollments', Enrollment))
+    ])
+    for kind, user_id, total in db.session.execute(statement):
+        counts[user_id][kind] = total
+    return counts
 
+class SystemUserResource(BaseResource):
     def post(self):
         """
         Create a new system user
@@ -53,7 +67,9 @@ class SystemUserResource(Resource):
         """
         try:
             # Parse and validate the request data
-            args = self.parser.parse_args()
+            args, error = self.parse(user_schema)
+            if error:
+                return error
             
             # Check if username already exists
             if User.query.filter_by(username=args['username']).first():
@@ -68,6 +84,7 @@ class SystemUserResource(Resource):
             
             db.session.add(user)
             db.session.commit()
+            user_list_cache.clear()
             
             return self.success_response(
                 {
@@ -85,16 +102,7 @@ class SystemUserResource(Resource):
             db.session.rollback()
             return self.error_response(str(e), 500)
 
-class LoginResource(Resource):
-    def error_response(self, message, status_code=400):
-        return {'error': message}, status_code
-
-    def success_response(self, data, message="Success", status_code=200):
-        return {
-            'message': message,
-            'data': data
-        }, status_code
-
+class LoginResource(BaseResource):
     def post(self):
         """
         Login a system user
@@ -106,9 +114,11 @@ class LoginResource(Resource):
         """
         try:
             # Get username and password from request
-            data = request.get_json()
-            username = data.get('username')
-            password = data.get('password')
+            data, error = self.parse(login_schema)
+            if error:
+                return error
+            username = data['username']
+            password = data['password']
             
             if not username or not password:
                 return self.error_response("Username and password are required", 400)
@@ -118,11 +128,17 @@ class LoginResource(Resource):
             
             if not user or not user.check_password(password):
                 return self.error_response("Invalid username or password", 401)
+            if not user.is_active:
+                return self.error_response("This account has been deactivated", 403)
+
+            # Written with other users' activity in the next batch, not now
+            user_activity.login(user.id)
             
             # Create access token with string identity
             access_token = create_access_token(
                 identity=str(user.id),  # Convert user.id to string
-                fresh=True  # This is a fresh login
+                fresh=True,  # This is a fresh login
+                additional_claims=token_claims(user)
             )
             
             return self.success_response(
@@ -139,16 +155,7 @@ class LoginResource(Resource):
         except Exception as e:
             return self.error_response(str(e), 500)
 
-class LogoutResource(Resource):
-    def error_response(self, message, status_code=400):
-        return {'error': message}, status_code
-
-    def success_response(self, data, message="Success", status_code=200):
-        return {
-            'message': message,
-            'data': data
-        }, status_code
-
+class LogoutResource(BaseResource):
     @jwt_required()
     def post(self):
         """
@@ -169,8 +176,145 @@ class LogoutResource(Resource):
         except Exception as e:
             return self.error_response(str(e), 500)
 
-def init_system_user_routes(app):
-    api.add_resource(SystemUserResource, '/api/doctors')
-    api.add_resource(LoginResource, '/api/doctors/login')
-    api.add_resource(LogoutResource, '/api/doctors/logout')
-    api.init_app(app) 
\ No newline at end of file
+class UserListResource(BaseResource):
+    @jwt_required()
+    @role_required('admin')
+    def get(self):
+        """
+        List users with how many clients, programs and enrollments each
+        created (admins only). Pages are cached for up to 30 seconds.
+        Query parameters:
+        - query: Part of the username or email
+        - role: Only users with this role
+        - is_active: true or false
+        - facility_id: Only users of this facility
+        - page: Page number (default: 1)
+        - per_page: Items per page (default: 50, at most 200)
+        """
+        try:
+            args, error = self.parse(user_list_query_schema, location='args')
+            if error:
+                return error
+
+            key = tuple(sorted(args.items()))
+            data = user_list_cache.get(key)
+            if data is None:
+                query = User.query
+                if args['query']:
+                    pattern = f"%{args['query']}%"
+                    query = query.filter(or_(User.username.ilike(pattern), User.email.ilike(pattern)))
+                if args['role']:
+                    query = query.filter(User.role == args['role'])
+                if args['is_active'] is not None:
+                    query = query.filter(User.is_active == args['is_active'])
+                if args['facility_id'] is not None:
+                    query = query.filter(User.facility_id == args['facility_id'])
+
+                users = query.order_by(User.id).paginate(page=args['page'], per_page=args['per_page'], error_out=False)
+                counts = created_counts([u.id for u in users.items])
+                data = {
+                    'items': [{**user_to_dict(u), 'created': counts[u.id]} for u in users.items],
+                    'total': users.total,
+                    'pages': users.pages,
+                    'current_page': users.page
+                }
+                user_list_cache.set(key, data)
+
+            return self.success_response(data)
+        except Exception as e:
+            return self.error_response(str(e), 500)
+
+class UserResource(BaseResource):
+    @jwt_required()
+    @role_required('admin')
+    def patch(self, user_id):
+        """
+        Change a user's role, facility or whether they can log in (admins only)
+        Their current tokens stop working at once, so the change takes effect
+        at their next login.
+        Example JSON body:
+        {
+            "role": "nurse",
+            "is_active": false
+        }
+        """
+        try:
+            args, error = self.parse(user_update_schema, partial=True)
+            if error:
+                return error
+            if not args:
+                return self.error_response("No fields to update")
+
+            user = db.session.get(User, user_id)
+            if user is None:
+                return self.error_response("User not found", 404)
+            if user.id == int(get_jwt_identity()) and (args.get('is_active') is False or args.get('role', 'admin') != 'admin'):
+                return self.error_response("You cannot deactivate yourself or remove your own admin role")
+            if args.get('facility_id') is not None and db.session.get(Facility, args['facility_id']) is None:
+                return self.error_response(f"Facility with ID {args['facility_id']} not found")
+
+            changed = {field: value for field, value in args.items() if getattr(user, field) != value}
+            for field, value in changed.items():
+                setattr(user, field, value)
+            if changed:
+                revoke_tokens(user)
+            db.session.commit()
+            # Dropped only now so no request can cache the old version meanwhile
+            token_versions.delete(user.id)
+            user_list_cache.clear()
+
+            return self.success_response(user_to_dict(user), "User updated successfully")
+        except Exception as e:
+            db.session.rollback()
+            return self.error_response(str(e), 500)
+
+class UserActivityResource(BaseResource):
+    @jwt_required()
+    @role_required('admin')
+    def get(self):
+        """
+        Users active recently, most recent first (admins only)
+        Includes activity of this worker that hasn't been written yet; other
+        workers' activity appears within USER_ACTIVITY_FLUSH_INTERVAL seconds.
+        Query parameters:
+        - minutes: Active within this many minutes (default: 15)
+        """
+        try:
+            args, error = self.parse(user_activity_query_schema, location='args')
+            if error:
+                return error
+            since = datetime.utcnow() - timedelta(minutes=args['minutes'])
+
+            pending = user_activity.pending()
+            users = User.query.filter(or_(User.last_seen >= since, User.id.in_(list(pending)))).all()
+
+            activity = []
+            for user in users:
+                recent = pending.get(user.id, {})
+                last_seen = max(filter(None, [user.last_seen, recent.get('seen_at')]))
+                last_login = max(filter(None, [user.last_login, recent.get('login_at')]), default=None)
+                if last_seen < since:
+                    continue
+                activity.append({
+                    'id': user.id,
+                    'username': user.username,
+                    'role': user.role,
+                    'last_seen': last_seen.isoformat(),
+                    'last_login': last_login.isoformat() if last_login else None,
+                    'login_count': user.login_count + recent.get('logins', 0),
+                    'request_count': user.request_count + recent.get('requests', 0)
+                })
+            activity.sort(key=lambda entry: entry['last_seen'], reverse=True)
+
+            return self.success_response(activity)
+        except Exception as e:
+            return self.error_response(str(e), 500)
+
+
+# Register routes on the shared Api
+api.add_resource(SystemUserResource, '/api/doctors')
+api.add_resource(LoginResource, '/api/doctors/login')
+api.add_resource(LogoutResource, '/api/doctors/logout')
+api.add_resource(UserListResource, '/api/users')
+api.add_resource(UserResource, '/api/users/<int:user_id>')
+api.add_resource(UserActivityResource, '/api/users/activity')
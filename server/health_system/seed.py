@@ -1,8 +1,9 @@
-from app import app, db
-from models import Client, Program, Enrollment
+from app import create_app
+from models import db, Client, Program, Enrollment
 from datetime import datetime
 
 def seed_data():
+    app = create_app()
     with app.app_context():
         # Clear existing data
         Enrollment.query.delete()
@@ -0,0 +1,104 @@
+from flask import Response, request, current_app
+from flask_jwt_extended import get_jwt
+from collections import defaultdict
+from functools import wraps
+import json
+import threading
+
+# Seconds a request waits for an identical in-flight request before running itself
+DEFAULT_TIMEOUT = 5
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution whose
+    result is handed to every caller. Calls only meet within one process,
+    so this only helps when a process serves requests on several threads,
+    as gunicorn's gthread workers do (see gunicorn.conf.py); with sync
+    workers every call runs on its own. Counts per endpoint how many calls
+    ran, how many were coalesced and how many gave up waiting.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {'executed': 0, 'coalesced': 0, 'timeouts': 0})
+
+    def do(self, key, fn, timeout, stats_key=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._stats[stats_key]['executed' if leader else 'coalesced'] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        elif not call.done.wait(timeout):
+            # Don't wait forever on a slow leader, run the call ourselves
+            with self._lock:
+                self._stats[stats_key]['timeouts'] += 1
+            return fn()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {key: dict(value) for key, value in self._stats.items()}
+
+
+single_flight_group = SingleFlight()
+
+
+def _serialize(result):
+    """Turn a resource method's (data, status[, headers]) into shareable bytes"""
+    if not isinstance(result, tuple):
+        result = (result,)
+    data = result[0]
+    status = result[1] if len(result) > 1 else 200
+    headers = result[2] if len(result) > 2 else {}
+    return json.dumps(data).encode('utf-8'), status, headers
+
+
+def single_flight(f=None, timeout=None):
+    """
+    Share one execution between identical concurrent GET requests. Requests
+    are identical when they hit the same endpoint with the same URL and query
+    parameters under the same role and facility. Must be applied inside @jwt_required().
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = (
+                request.endpoint,
+                tuple(sorted(request.view_args.items())),
+                tuple(sorted(request.args.items(multi=True))),
+                get_jwt().get('role'),
+                get_jwt().get('facility_id')
+            )
+            wait = timeout or current_app.config.get('SINGLE_FLIGHT_TIMEOUT', DEFAULT_TIMEOUT)
+            body, status, headers = single_flight_group.do(
+                key, lambda: _serialize(f(*args, **kwargs)), wait, request.endpoint
+            )
+            return Response(body, status, headers, mimetype='application/json')
+        return decorated
+
+    if f is not None:
+        return decorator(f)
+    return decorator
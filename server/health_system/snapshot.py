@@ -0,0 +1,221 @@
+from models import db
+from sqlalchemy import Date, DateTime, Integer, delete, select, text
+from datetime import date, datetime
+from contextlib import contextmanager
+import click
+import gzip
+import hashlib
+import json
+import time
+
+SNAPSHOT_FORMAT = 'afyalink-snapshot'
+SNAPSHOT_VERSION = 1
+
+# A snapshot is a gzip-compressed file of JSON records, one per line:
+#   {"format": ..., "version": 1, "created_at": ..., "tables": [...]}
+#   {"table": "client", "columns": [...]}
+#   {"rows": [[...], ...]}                 one line per chunk of rows
+#   ...
+#   {"end": true, "counts": {...}}
+# Each line starts with a SHA-256 over the previous line's checksum and
+# the record, so a changed, missing or reordered line is noticed before its
+# rows are used, and a file without the end record is incomplete.
+
+
+def _encode(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Can't store {type(value).__name__} in a snapshot")
+
+
+def _decoder(column):
+    """Function turning a column's JSON value back into what the column expects, None if it can be used as is"""
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat
+    if isinstance(column.type, Date):
+        return date.fromisoformat
+    return None
+
+
+def _chain(previous, payload):
+    return hashlib.sha256(previous + payload).digest()
+
+
+class _ChecksummedWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.digest = b''
+
+    def write(self, record):
+        payload = json.dumps(record, default=_encode, separators=(',', ':')).encode('utf-8')
+        self.digest = _chain(self.digest, payload)
+        self.stream.write(self.digest.hex().encode('ascii') + b' ' + payload + b'\n')
+
+
+def _read_records(stream):
+    digest = b''
+    for line in stream:
+        checksum, _, payload = line.rstrip(b'\n').partition(b' ')
+        digest = _chain(digest, payload)
+        if checksum != digest.hex().encode('ascii'):
+            raise click.ClickException("Checksum mismatch: the snapshot is damaged. Nothing was restored")
+        yield json.loads(payload)
+
+
+@contextmanager
+def _read_transaction():
+    """Connection whose reads all see the database as of the first one"""
+    with db.engine.connect() as connection:
+        if connection.dialect.name == 'postgresql':
+            connection = connection.execution_options(isolation_level='REPEATABLE READ')
+        with connection.begin():
+            if connection.dialect.name == 'sqlite':
+                # pysqlite only opens a transaction before a write
+                connection.exec_driver_sql('BEGIN')
+            yield connection
+
+
+def create_snapshot(path, chunk_size=1000, progress=None):
+    """
+    Stream every table in primary key order into a compressed snapshot.
+    All tables are read in one transaction, so rows written meanwhile are
+    left out of every table and the snapshot is consistent.
+    Rows are read with a server-side cursor where the database has one, so
+    memory use doesn't grow with the size of the tables.
+    Returns {table name: rows written}.
+    """
+    tables = db.metadata.sorted_tables
+    counts = {}
+    # Level 6 compresses nearly as well as 9 at a fraction of the CPU time
+    with gzip.open(path, 'wb', compresslevel=6) as stream, _read_transaction() as connection:
+        writer = _ChecksummedWriter(stream)
+        writer.write({
+            'format': SNAPSHOT_FORMAT,
+            'version': SNAPSHOT_VERSION,
+            'created_at': datetime.utcnow(),
+            'dialect': connection.dialect.name,
+            'tables': [table.name for table in tables]
+        })
+        for table in tables:
+            started = time.monotonic()
+            writer.write({'table': table.name, 'columns': [column.name for column in table.columns]})
+            result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(
+                select(table).order_by(*table.primary_key.columns)
+            )
+            counts[table.name] = 0
+            for rows in result.partitions():
+                writer.write({'rows': [list(row) for row in rows]})
+                counts[table.name] += len(rows)
+            if progress:
+                progress(table.name, counts[table.name], time.monotonic() - started)
+        writer.write({'end': True, 'counts': counts})
+    return counts
+
+
+def _reset_sequences(connection, tables):
+    """Make Postgres hand out IDs after the restored ones"""
+    for table in tables:
+        key = list(table.primary_key.columns)
+        if len(key) != 1 or not isinstance(key[0].type, Integer):
+            continue
+        name = connection.dialect.identifier_preparer.quote(table.name)
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence(:table, :column), "
+            f"COALESCE((SELECT MAX({key[0].name}) FROM {name}), 0) + 1, false)"
+        ), {'table': name, 'column': key[0].name})
+
+
+def restore_snapshot(path, progress=None):
+    """
+    Replace the contents of every table with a snapshot, in one
+    transaction: nothing is changed unless the whole file is read and its
+    checksum matches. Works across databases, e.g. a SQLite snapshot can
+    be restored into Postgres. Returns {table name: rows restored}.
+    """
+    tables = {table.name: table for table in db.metadata.sorted_tables}
+    counts = {}
+
+    with gzip.open(path, 'rb') as stream, db.engine.begin() as connection:
+        records = _read_records(stream)
+        header = next(records, None)
+        if not header or header.get('format') != SNAPSHOT_FORMAT or header.get('version') != SNAPSHOT_VERSION:
+            raise click.ClickException(f"{path} is not a snapshot this version can restore")
+
+        if connection.dialect.name == 'postgresql':
+            names = ', '.join(connection.dialect.identifier_preparer.quote(name) for name in tables)
+            connection.execute(text(f'TRUNCATE {names}'))
+        else:
+            # Children first, so foreign keys don't stop the deletes
+            for table in reversed(db.metadata.sorted_tables):
+                connection.execute(delete(table))
+
+        table = None
+        for record in records:
+            if table is not None and ('table' in record or 'end' in record) and progress:
+                progress(table.name, counts[table.name], time.monotonic() - started)
+
+            if 'table' in record:
+                table = tables.get(record['table'])
+                if table is None:
+                    raise click.ClickException(f"The snapshot has a table this app doesn't know: {record['table']}")
+                # Columns added to the app since the snapshot was taken get their defaults
+                columns = [
+                    (name, position, _decoder(table.c[name]))
+                    for position, name in enumerate(record['columns']) if name in table.c
+                ]
+                counts[table.name] = 0
+                started = time.monotonic()
+            elif 'rows' in record:
+                rows = [{
+                    name: decode(row[position]) if decode and row[position] is not None else row[position]
+                    for name, position, decode in columns
+                } for row in record['rows']]
+                connection.execute(table.insert(), rows)
+                counts[table.name] += len(rows)
+            elif 'end' in record:
+                if record['counts'] != counts:
+                    raise click.ClickException("Row counts don't match: the snapshot is damaged. Nothing was restored")
+                break
+        else:
+            raise click.ClickException("The snapshot is incomplete. Nothing was restored")
+
+        if connection.dialect.name == 'postgresql':
+            _reset_sequences(connection, tables.values())
+    return counts
+
+
+def _report(table, rows, seconds):
+    rate = rows / seconds if seconds > 0 else 0
+    click.echo(f"  {table}: {rows} rows in {seconds:.2f}s ({rate:,.0f} rows/s)")
+
+
+def init_snapshot(app):
+    @app.cli.group('snapshot')
+    def snapshot_group():
+        """Back up and restore the whole database"""
+
+    @snapshot_group.command('create')
+    @click.argument('path')
+    @click.option('--chunk-size', type=int, default=1000, help='Rows read and written at a time')
+    def create_command(path, chunk_size):
+        """Write every table to a compressed snapshot file"""
+        started = time.monotonic()
+        counts = create_snapshot(path, chunk_size, _report)
+        seconds = time.monotonic() - started
+        total = sum(counts.values())
+        click.echo(f"Wrote {total} rows to {path} in {seconds:.2f}s ({total / max(seconds, 1e-9):,.0f} rows/s)")
+
+    @snapshot_group.command('restore')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.confirmation_option(prompt='This replaces all data in the database. Continue?')
+    def restore_command(path):
+        """Replace all data with the contents of a snapshot file"""
+        started = time.monotonic()
+        try:
+            counts = restore_snapshot(path, _report)
+        except (OSError, EOFError) as e:
+            # Not gzip, or cut off in the middle of the compressed stream
+            raise click.ClickException(f"Could not read {path}: {e}. Nothing was restored")
+        seconds = time.monotonic() - started
+        total = sum(counts.values())
+        click.echo(f"Restored {total} rows from {path} in {seconds:.2f}s ({total / max(seconds, 1e-9):,.0f} rows/s)")
@@ -0,0 +1,46 @@
+from models import db
+from db_routing import replica_router
+from sqlalchemy import event
+
+
+def sqlite_pragmas(config):
+    """PRAGMAs run on every new SQLite connection when SQLITE_PERFORMANCE_MODE is on"""
+    return [
+        # Readers no longer wait for writers or the other way round; only
+        # writers still take turns
+        'PRAGMA journal_mode=WAL',
+        # Safe with WAL: a power cut can lose the last commits but never corrupts the database
+        'PRAGMA synchronous=NORMAL',
+        # Wait for the write lock instead of failing with "database is locked"
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        # Negative sizes are in KiB
+        f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        'PRAGMA temp_store=MEMORY',
+        'PRAGMA foreign_keys=ON',
+    ]
+
+
+def init_sqlite(app):
+    app.config.setdefault('SQLITE_PERFORMANCE_MODE', False)
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    app.config.setdefault('SQLITE_CACHE_SIZE_KB', 64 * 1024)
+    app.config.setdefault('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+
+    if not app.config['SQLITE_PERFORMANCE_MODE']:
+        return
+    pragmas = sqlite_pragmas(app.config)
+
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    with app.app_context():
+        engines = [db.engine, *replica_router.engines]
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', apply_pragmas)
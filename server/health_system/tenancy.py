@@ -0,0 +1,81 @@
+from flask import has_request_context
+from flask_jwt_extended import get_jwt
+from sqlalchemy import Column, Integer, ForeignKey, event
+from sqlalchemy.orm import declared_attr, with_loader_criteria
+from contextlib import contextmanager
+from contextvars import ContextVar
+from db_routing import RoutingSession
+
+# Facility that single-facility deployments, existing rows and users
+# without a facility belong to; created together with the facility table
+DEFAULT_FACILITY_ID = 1
+
+_UNSET = object()
+_facility_override = ContextVar('facility_override', default=_UNSET)
+
+
+def current_facility_id():
+    """
+    Facility the current request or job is limited to, or None when it may
+    see every facility (admins, scheduled jobs, CLI commands)
+    """
+    override = _facility_override.get()
+    if override is not _UNSET:
+        return override
+    if not has_request_context():
+        return None
+    try:
+        return get_jwt().get('facility_id')
+    except RuntimeError:
+        # No verified token in this request
+        return None
+
+
+@contextmanager
+def facility_scope(facility_id):
+    """Run a block as if a user of facility_id (None: every facility) were making the queries"""
+    token = _facility_override.set(facility_id)
+    try:
+        yield
+    finally:
+        _facility_override.reset(token)
+
+
+def default_facility_id():
+    facility_id = current_facility_id()
+    return facility_id if facility_id is not None else DEFAULT_FACILITY_ID
+
+
+def token_facility_claim(user):
+    """facility_id claim for a user's access token; admins see every facility"""
+    if user.role == 'admin':
+        return None
+    return user.facility_id or DEFAULT_FACILITY_ID
+
+
+class TenantMixin:
+    """Rows belong to one facility and users only see their own facility's rows"""
+
+    @declared_attr
+    def facility_id(cls):
+        return Column(
+            Integer, ForeignKey('facility.id'), nullable=False,
+            default=default_facility_id, server_default=str(DEFAULT_FACILITY_ID)
+        )
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _limit_to_facility(orm_execute_state):
+    """Add facility_id = ? for every tenant table to ORM selects, updates and deletes"""
+    if orm_execute_state.is_column_load or orm_execute_state.is_relationship_load:
+        # Already limited by the statement that loaded the parent rows
+        return
+    if not (orm_execute_state.is_select or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+
+    facility_id = current_facility_id()
+    if facility_id is None:
+        return
+    orm_execute_state.statement = orm_execute_state.statement.options(
+        with_loader_criteria(TenantMixin, lambda cls: cls.facility_id == facility_id, include_aliases=True)
+    )
@@ -0,0 +1,43 @@
+import os
+import pytest
+
+os.environ.setdefault('JWT_SECRET_KEY', 'test-secret-key-that-is-long-enough')
+
+from app import create_app
+from models import db, User
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URI', f'sqlite:///{tmp_path}/test.db')
+    app = create_app(with_migrations=False)
+    app.config['EXPORT_DIR'] = str(tmp_path / 'exports')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, username, role):
+    """Create a user with the given role and return headers carrying their token"""
+    user = User(username=username, email=f'{username}@example.com', role=role)
+    user.set_password('secret1')
+    db.session.add(user)
+    db.session.commit()
+    response = client.post('/api/doctors/login', json={'username': username, 'password': 'secret1'})
+    return {'Authorization': f"Bearer {response.json['data']['token']}"}
+
+
+@pytest.fixture
+def admin_headers(client):
+    return login(client, 'admin', 'admin')
+
+
+@pytest.fixture
+def doctor_headers(client):
+    return login(client, 'doctor', 'doctor')
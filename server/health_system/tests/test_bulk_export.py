@@ -0,0 +1,51 @@
+from datetime import date, datetime
+import gzip
+import json
+import os
+from models import db, Client, Job
+from bulk_export import export_dir
+import jobs
+
+
+def add_client(first_name, gender, updated_at):
+    client = Client(first_name=first_name, last_name='Doe', date_of_birth=date(1990, 1, 1),
+                    gender=gender, updated_at=updated_at)
+    db.session.add(client)
+    db.session.commit()
+    return client
+
+
+def run_export(client, headers, **params):
+    response = client.get('/api/v1/$export', query_string={'_type': 'Patient', **params}, headers=headers)
+    assert response.status_code == 202
+    job_id = response.json['data']['job_id']
+    assert jobs.claim(job_id)
+    jobs.run_job(job_id)
+    job = db.session.get(Job, job_id)
+    assert job.status == 'succeeded', job.error
+
+    patients = []
+    for name in sorted(os.listdir(export_dir(job_id))):
+        with gzip.open(os.path.join(export_dir(job_id), name), 'rt', encoding='utf-8') as f:
+            patients.extend(json.loads(line) for line in f)
+    return job, patients
+
+
+def test_since_with_offset_is_compared_in_utc(client, doctor_headers):
+    add_client('Before', 'Male', datetime(2026, 1, 1, 8, 30))
+    after = add_client('After', 'Female', datetime(2026, 1, 1, 9, 30))
+
+    # 12:00 at +03:00 is 09:00 UTC
+    job, patients = run_export(client, doctor_headers, _since='2026-01-01T12:00:00+03:00')
+
+    assert job.payload['since'] == '2026-01-01T09:00:00'
+    assert [patient['id'] for patient in patients] == [str(after.id)]
+
+
+def test_patient_gender_uses_fhir_codes(client, doctor_headers):
+    for gender in ('Male', 'F', 'Non-binary', ' '):
+        add_client('Jo', gender, datetime(2026, 1, 1))
+
+    job, patients = run_export(client, doctor_headers)
+
+    assert [patient['gender'] for patient in patients] == ['male', 'female', 'other', 'unknown']
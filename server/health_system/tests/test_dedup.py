@@ -0,0 +1,28 @@
+from datetime import date
+from sqlalchemy import func, select, update
+from models import db, Client, OutboxEvent
+from dedup import backfill_blocking_keys
+
+
+def test_backfill_leaves_version_and_events_alone(app):
+    client = Client(first_name='John', last_name='Doe', date_of_birth=date(1990, 1, 1),
+                    gender='Male', contact_number='0712345678')
+    db.session.add(client)
+    db.session.commit()
+    # As if the client was registered before blocking keys existed
+    db.session.execute(update(Client.__table__).values(
+        first_name_key=None, last_name_key=None, birth_year=None, phone_suffix=None
+    ))
+    db.session.commit()
+    version, updated_at = db.session.execute(select(Client.version, Client.updated_at)).one()
+    events = db.session.scalar(select(func.count(OutboxEvent.id)))
+
+    assert backfill_blocking_keys() == 1
+
+    db.session.expire_all()
+    client = db.session.get(Client, client.id)
+    assert (client.first_name_key, client.last_name_key, client.birth_year, client.phone_suffix) == \
+        ('J500', 'D000', 1990, '2345678')
+    assert client.version == version
+    assert client.updated_at == updated_at
+    assert db.session.scalar(select(func.count(OutboxEvent.id))) == events
@@ -0,0 +1,34 @@
+def test_webhook_routes(client, admin_headers):
+    response = client.post('/api/webhooks', json={
+        'url': 'https://partner.example.com/afyalink',
+        'event_types': ['enrollment.created']
+    }, headers=admin_headers)
+    assert response.status_code == 201
+    webhook_id = response.json['data']['id']
+    assert response.json['data']['secret']
+
+    response = client.get('/api/webhooks', headers=admin_headers)
+    assert response.status_code == 200
+    assert [webhook['id'] for webhook in response.json['data']] == [webhook_id]
+    assert 'secret' not in response.json['data'][0]
+
+    response = client.delete(f'/api/webhooks/{webhook_id}', headers=admin_headers)
+    assert response.status_code == 200
+
+    response = client.get('/api/webhooks', headers=admin_headers)
+    assert response.json['data'] == []
+    response = client.delete(f'/api/webhooks/{webhook_id}', headers=admin_headers)
+    assert response.status_code == 404
+
+
+def test_webhook_routes_are_for_admins(client, doctor_headers):
+    assert client.get('/api/webhooks', headers=doctor_headers).status_code == 403
+    assert client.post('/api/webhooks', json={'url': 'https://partner.example.com'},
+                       headers=doctor_headers).status_code == 403
+    assert client.delete('/api/webhooks/1', headers=doctor_headers).status_code == 403
+
+
+def test_webhook_routes_only_allow_their_methods(client, admin_headers):
+    assert client.delete('/api/webhooks', headers=admin_headers).status_code == 405
+    assert client.get('/api/webhooks/1', headers=admin_headers).status_code == 405
+    assert client.post('/api/webhooks/1', json={}, headers=admin_headers).status_code == 405
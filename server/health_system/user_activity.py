@@ -0,0 +1,152 @@
+from flask_jwt_extended import get_jwt_identity
+from models import db, User
+from sqlalchemy import update, values, column, bindparam, func, Integer, DateTime
+from datetime import datetime
+import atexit
+import os
+import threading
+import time
+
+
+class UserActivity:
+    """
+    Keeps users' last_login, last_seen, login_count and request_count up to
+    date without writing the user table on every request. Activity is
+    merged per user in memory and written every USER_ACTIVITY_FLUSH_INTERVAL
+    seconds in one statement, so at most that much activity is lost if a
+    worker is killed; a clean shutdown writes everything.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('USER_ACTIVITY_ENABLED', True)
+        app.config.setdefault('USER_ACTIVITY_FLUSH_INTERVAL', 10.0)
+
+        self.app = app
+        app.extensions['user_activity'] = self
+        app.after_request(self._after_request)
+        atexit.register(self.flush)
+
+    def _ensure_writer(self):
+        # Threads don't survive a fork, so each worker process starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                if self._pid is not None:
+                    # Activity buffered by the parent is the parent's to write
+                    self._pending = {}
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='user-activity-writer', daemon=True)
+                self._thread.start()
+
+    def _record(self, user_id, login=False):
+        if not self.app.config['USER_ACTIVITY_ENABLED']:
+            return
+        self._ensure_writer()
+        now = datetime.utcnow()
+        with self._lock:
+            activity = self._pending.setdefault(user_id, {
+                'user_id': user_id, 'seen_at': now, 'login_at': None, 'logins': 0, 'requests': 0
+            })
+            activity['seen_at'] = now
+            if login:
+                activity['login_at'] = now
+                activity['logins'] += 1
+            else:
+                activity['requests'] += 1
+
+    def login(self, user_id):
+        """Record a successful login"""
+        self._record(user_id, login=True)
+
+    def _after_request(self, response):
+        # Only requests made with a verified token count as activity
+        try:
+            user_id = get_jwt_identity()
+        except RuntimeError:
+            return response
+        if user_id is not None:
+            self._record(int(user_id))
+        return response
+
+    def pending(self):
+        """Activity not written yet, by user id, e.g. to show next to what's in the database"""
+        with self._lock:
+            return {user_id: dict(activity) for user_id, activity in self._pending.items()}
+
+    def _run(self):
+        while True:
+            time.sleep(self.app.config['USER_ACTIVITY_FLUSH_INTERVAL'])
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception('Could not write user activity')
+
+    def flush(self):
+        """Write all buffered activity in one statement"""
+        with self._lock:
+            rows, self._pending = list(self._pending.values()), {}
+        if not rows:
+            return
+        try:
+            with self.app.app_context():
+                # A connection of its own, outside any request's session and transaction
+                with db.engine.begin() as connection:
+                    self._write(connection, rows)
+        except Exception:
+            # Put the activity back so the next flush retries it
+            with self._lock:
+                for row in rows:
+                    self._merge(row)
+            raise
+
+    def _merge(self, row):
+        activity = self._pending.get(row['user_id'])
+        if activity is None:
+            self._pending[row['user_id']] = row
+            return
+        activity['seen_at'] = max(activity['seen_at'], row['seen_at'])
+        if row['login_at'] and (activity['login_at'] is None or row['login_at'] > activity['login_at']):
+            activity['login_at'] = row['login_at']
+        activity['logins'] += row['logins']
+        activity['requests'] += row['requests']
+
+    def _write(self, connection, rows):
+        user = User.__table__
+        if connection.dialect.name == 'postgresql':
+            # UPDATE "user" SET ... FROM (VALUES (...), (...)) AS activity (...) WHERE "user".id = activity.user_id
+            activity = values(
+                column('user_id', Integer), column('seen_at', DateTime), column('login_at', DateTime),
+                column('logins', Integer), column('requests', Integer),
+                name='activity'
+            ).data([
+                (r['user_id'], r['seen_at'], r['login_at'], r['logins'], r['requests']) for r in rows
+            ])
+            connection.execute(update(user).where(user.c.id == activity.c.user_id).values(
+                last_seen=activity.c.seen_at,
+                last_login=func.coalesce(activity.c.login_at, user.c.last_login),
+                login_count=user.c.login_count + activity.c.logins,
+                request_count=user.c.request_count + activity.c.requests
+            ))
+            return
+
+        # SQLite can't name the columns of a VALUES list; one executemany instead
+        connection.execute(update(user).where(user.c.id == bindparam('user_id')).values(
+            last_seen=bindparam('seen_at'),
+            last_login=func.coalesce(bindparam('login_at'), user.c.last_login),
+            login_count=user.c.login_count + bindparam('logins'),
+            request_count=user.c.request_count + bindparam('requests')
+        ), rows)
+
+
+user_activity = UserActivity()
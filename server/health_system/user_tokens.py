@@ -0,0 +1,46 @@
+from models import db, User
+from cache import TTLCache
+from tenancy import token_facility_claim
+from sqlalchemy import select
+
+# token_version of each active user, None for deactivated users. Other
+# workers pick up a change within `ttl` seconds; this one immediately.
+token_versions = TTLCache(ttl=30, max_entries=10000)
+
+
+def token_claims(user):
+    """Claims added to a user's access tokens"""
+    return {
+        'role': user.role,  # Used for role checks and per-role rate limits
+        'facility_id': token_facility_claim(user),  # Limits queries to the user's facility
+        'token_version': user.token_version  # Tokens of older versions are rejected
+    }
+
+
+def current_token_version(user_id):
+    """The token version a user's tokens must carry, None when no token is valid"""
+    version = token_versions.get(user_id, False)
+    if version is False:
+        row = db.session.execute(select(User.is_active, User.token_version).where(User.id == user_id)).first()
+        version = row.token_version if row and row.is_active else None
+        token_versions.set(user_id, version)
+    return version
+
+
+def revoke_tokens(user):
+    """
+    Invalidate all of a user's tokens, e.g. after a role change or
+    deactivation. Call token_versions.delete(user.id) once committed.
+    """
+    user.token_version = User.token_version + 1
+
+
+def init_token_checks(jwt):
+    @jwt.token_in_blocklist_loader
+    def token_revoked(jwt_header, jwt_data):
+        # Tokens issued before versions were added count as version 0
+        return jwt_data.get('token_version', 0) != current_token_version(int(jwt_data['sub']))
+
+    @jwt.revoked_token_loader
+    def revoked_token_callback(jwt_header, jwt_data):
+        return {'error': 'Token has been revoked. Please log in again'}, 401
@@ -1,7 +1,9 @@
-from app import app, db
+from app import create_app
+from models import db
 from sqlalchemy import inspect
 
 def verify_schema():
+    app = create_app()
     with app.app_context():
         inspector = inspect(db.engine)
         
@@ -0,0 +1,60 @@
+from flask import request
+from models import db
+from outbox import record_events
+from sqlalchemy import update, select
+
+
+def etag(version):
+    """ETag header value for a row version"""
+    return f'"{version}"'
+
+
+def if_match_versions():
+    """
+    Versions listed in the request's If-Match header, or None when the header
+    is absent or '*' and any version may be overwritten
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    # Tags that aren't versions of ours can never match, leaving an empty set
+    return {int(tag) for tag in request.if_match.as_set() if tag.isdigit()}
+
+
+def versioned_update(model, values, versions=None, **filters):
+    """
+    Compare-and-swap update of the live row matching filters (e.g. id=1) in
+    a single statement:
+    UPDATE ... SET values, version = version + 1 WHERE id = ? [AND version IN (?)]
+    Only the columns in values are written and the row is not read first. Returns the updated row, using RETURNING where
+    the database supports it, or None when no live row with an allowed
+    version matched. Client and enrollment updates are added to the outbox.
+    """
+    table = model.__table__
+    statement = (
+        update(model)
+        .filter_by(**filters)
+        .where(model.deleted_at.is_(None))
+        .values(**values, version=model.version + 1)
+    )
+    if versions is not None:
+        statement = statement.where(model.version.in_(versions))
+
+    options = {'synchronize_session': False}
+    if db.engine.dialect.update_returning:
+        row = db.session.execute(statement.returning(*table.c), execution_options=options).first()
+    elif db.session.execute(statement, execution_options=options).rowcount == 0:
+        row = None
+    else:
+        row = db.session.execute(select(*table.c).filter_by(**filters).where(table.c.deleted_at.is_(None))).first()
+
+    if row is not None:
+        record_events(model, 'updated', [row])
+    return row
+
+
+def update_failure(model, **filters):
+    """(message, status) explaining why versioned_update matched no row"""
+    name = model.__name__
+    if model.live().filter_by(**filters).first() is None:
+        return f"{name} not found", 404
+    return f"{name} was changed by someone else. Reload it and try again", 412
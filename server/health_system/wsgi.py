@@ -0,0 +1,4 @@
+from app import create_app
+
+# Entry point for gunicorn; web workers never run migrations
+app = create_app(with_migrations=False)